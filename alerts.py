@@ -0,0 +1,233 @@
+import itertools
+
+import numpy as np
+
+from fx import BASE_CURRENCY, format_money
+from valuation import value_portfolio
+
+# What a rule watches:
+#   price   - the price of one symbol (stock or crypto)
+#   pnl_pct - the unrealised PnL % of one holding in the rule's portfolio
+#   value   - the total value of the rule's portfolio
+RULE_KINDS = ('price', 'pnl_pct', 'value')
+DIRECTIONS = ('above', 'below')
+ASSET_CLASSES = ('stock', 'crypto')
+
+########################################################################
+class AlertRule:
+    __slots__ = ('id', 'portfolio', 'kind', 'asset_class', 'symbol', 'direction', 'threshold')
+
+    def __init__(self, portfolio, kind, direction, threshold, asset_class=None, symbol=None, id=None):
+        if kind not in RULE_KINDS:
+            raise ValueError(f"Unknown alert kind '{kind}'.")
+        if direction not in DIRECTIONS:
+            raise ValueError(f"Direction must be 'above' or 'below', not '{direction}'.")
+        if kind != 'value':
+            if asset_class not in ASSET_CLASSES or not symbol:
+                raise ValueError(f"A {kind} alert needs an asset class and a symbol.")
+            symbol = symbol.upper()
+        else:
+            asset_class, symbol = None, None
+        self.id = id # Attribute 1: store id (assigned by the engine if missing)
+        self.portfolio = portfolio # Attribute 2: portfolio the rule belongs to
+        self.kind = kind
+        self.asset_class = asset_class
+        self.symbol = symbol
+        self.direction = direction
+        self.threshold = float(threshold)
+
+    @property
+    def key(self):
+        # The observed value this rule is indexed under. Price rules of every portfolio
+        # share the symbol's key, since the price is the same for all of them.
+        if self.kind == 'price':
+            return ('price', self.asset_class, self.symbol)
+        if self.kind == 'pnl_pct':
+            return ('pnl_pct', self.portfolio, self.asset_class, self.symbol)
+        return ('value', self.portfolio)
+
+    def describe(self, currency=BASE_CURRENCY):
+        # Price and value thresholds are in the reporting currency.
+        if self.kind == 'price':
+            return f"{self.symbol} price {self.direction} {format_money(self.threshold, currency)}"
+        if self.kind == 'pnl_pct':
+            return f"{self.symbol} unrealised PnL {self.direction} {self.threshold:.2f} %"
+        return f"portfolio value {self.direction} {format_money(self.threshold, currency)}"
+
+    def to_row(self):
+        return (self.portfolio, self.kind, self.asset_class, self.symbol, self.direction, self.threshold)
+
+class Alert:
+    # A rule that fired, with the value that made it fire.
+    def __init__(self, rule, value, currency=BASE_CURRENCY):
+        self.rule = rule
+        self.value = value
+        self.currency = currency # Currency of value (and of the rule's threshold)
+
+    @property
+    def message(self):
+        if self.rule.kind == 'pnl_pct':
+            now = f"{self.value:.2f} %"
+        else:
+            now = format_money(self.value, self.currency)
+        return f"Alert for '{self.rule.portfolio}': {self.rule.describe(self.currency)} (now {now})."
+
+########################################################################
+# Every rule watching one value, split by direction into sorted threshold
+# arrays. An update only looks at the thresholds between the previous and
+# the new value (two binary searches), however many rules there are.
+class ThresholdIndex:
+    def __init__(self):
+        self._rules = {'above': [], 'below': []}
+        self._sorted = None # direction -> (thresholds, rule ids), rebuilt after changes
+        self.last = None # Last value seen
+
+    def __len__(self):
+        return len(self._rules['above']) + len(self._rules['below'])
+
+    def add(self, rule):
+        self._rules[rule.direction].append((rule.threshold, rule.id))
+        self._sorted = None
+
+    def remove(self, rule):
+        self._rules[rule.direction].remove((rule.threshold, rule.id))
+        self._sorted = None
+
+    def _build(self):
+        self._sorted = {}
+        for direction, entries in self._rules.items():
+            entries.sort()
+            thresholds = np.array([threshold for threshold, _ in entries], dtype=np.float64)
+            ids = [rule_id for _, rule_id in entries]
+            self._sorted[direction] = (thresholds, ids)
+
+    def update(self, value):
+        # Ids of the rules crossed by moving from the last value to value.
+        # The first value fires every rule that already holds.
+        if value is None or value != value: # No price: keep the last value
+            return []
+        if self._sorted is None:
+            self._build()
+        last, self.last = self.last, value
+        fired = []
+
+        thresholds, ids = self._sorted['above']
+        if len(thresholds) and (last is None or value > last):
+            start = 0 if last is None else np.searchsorted(thresholds, last, side='right')
+            end = np.searchsorted(thresholds, value, side='right')
+            fired.extend(ids[start:end])
+
+        thresholds, ids = self._sorted['below']
+        if len(thresholds) and (last is None or value < last):
+            start = np.searchsorted(thresholds, value, side='left')
+            end = len(thresholds) if last is None else np.searchsorted(thresholds, last, side='left')
+            fired.extend(ids[start:end])
+        return fired
+
+########################################################################
+# The rules of any number of portfolios, indexed by the value they watch.
+# Feed it prices (and the portfolios, for PnL and value rules) on every
+# update; it returns the alerts that fired.
+class AlertEngine:
+    def __init__(self, rules=()):
+        self._rules = {} # Attribute 1: id -> AlertRule
+        self._indexes = {} # Attribute 2: rule key -> ThresholdIndex
+        self._valued = {} # portfolio -> number of pnl_pct/value rules
+        self._ids = itertools.count(1)
+        for rule in rules:
+            self.add(rule)
+
+    @classmethod
+    def from_store(cls, store, portfolio_name=None):
+        rules = []
+        for alert_id, portfolio_name, kind, asset_class, symbol, direction, threshold in store.iter_alerts(portfolio_name):
+            rules.append(AlertRule(portfolio_name, kind, direction, threshold, asset_class, symbol, id=alert_id))
+        return cls(rules)
+
+    def __len__(self):
+        return len(self._rules)
+
+    @property
+    def rules(self):
+        return list(self._rules.values())
+
+    def add(self, rule):
+        if rule.id is None:
+            rule.id = next(self._ids)
+            while rule.id in self._rules:
+                rule.id = next(self._ids)
+        self._rules[rule.id] = rule
+        self._indexes.setdefault(rule.key, ThresholdIndex()).add(rule)
+        if rule.kind != 'price':
+            self._valued[rule.portfolio] = self._valued.get(rule.portfolio, 0) + 1
+        return rule
+
+    def remove(self, rule_id):
+        rule = self._rules.pop(rule_id)
+        index = self._indexes[rule.key]
+        index.remove(rule)
+        if not len(index):
+            del self._indexes[rule.key]
+        if rule.kind != 'price':
+            self._valued[rule.portfolio] -= 1
+            if not self._valued[rule.portfolio]:
+                del self._valued[rule.portfolio]
+        return rule
+
+    def price_symbols(self):
+        # {'stock': [...], 'crypto': [...]} watched by price rules, so they can be fetched
+        # with the holdings even when no portfolio holds them.
+        symbols = {'stock': [], 'crypto': []}
+        for key in self._indexes:
+            if key[0] == 'price':
+                symbols[key[1]].append(key[2])
+        return symbols
+
+    def _fire(self, key, value, currency=BASE_CURRENCY):
+        index = self._indexes.get(key)
+        if index is None:
+            return []
+        return [Alert(self._rules[rule_id], value, currency) for rule_id in index.update(value)]
+
+    #########################################################################
+    def update_prices(self, stock_prices, crypto_prices, fx=None):
+        # Check the price rules against new {symbol: price} mappings, converted into
+        # fx.target (pence, yen and CMC's quote currency alike) when fx is given.
+        currency = BASE_CURRENCY if fx is None else fx.target
+        alerts = []
+        for asset_class, prices in (('stock', stock_prices), ('crypto', crypto_prices)):
+            items = list(prices.items())
+            if not items:
+                continue
+            symbols = [symbol for symbol, _ in items]
+            values = np.array([price for _, price in items], dtype=np.float64)
+            if fx is not None:
+                values = values * fx.price_factors(symbols, [asset_class] * len(symbols))
+            for symbol, value in zip(symbols, values):
+                alerts.extend(self._fire(('price', asset_class, symbol), float(value), currency))
+        return alerts
+
+    def update_valuation(self, portfolio_name, valuation):
+        # Check a portfolio's PnL % and value rules against its Valuation.
+        if portfolio_name not in self._valued:
+            return []
+        alerts = []
+        for index, symbol in enumerate(valuation.symbols):
+            key = ('pnl_pct', portfolio_name, valuation.asset_classes[index], symbol)
+            if key in self._indexes and valuation.priced[index]:
+                alerts.extend(self._fire(key, float(valuation.unrealised_pnl_pct[index])))
+        # The total leaves out unpriced holdings, so it is only checked when everything is priced
+        if not valuation.missing:
+            alerts.extend(self._fire(('value', portfolio_name), valuation.total_value, valuation.currency))
+        return alerts
+
+    def evaluate(self, portfolios, stock_prices, crypto_prices, fx=None):
+        # Check every rule for {name: Portfolio} against one round of prices, in fx.target
+        # when fx (project.fx_rates of the same round) is given. Only portfolios with PnL
+        # or value rules are valued.
+        alerts = self.update_prices(stock_prices, crypto_prices, fx)
+        for name in self._valued:
+            if name in portfolios:
+                valuation = value_portfolio(portfolios[name], stock_prices, crypto_prices, fx)
+                alerts.extend(self.update_valuation(name, valuation))
+        return alerts
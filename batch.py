@@ -0,0 +1,574 @@
+import argparse
+import csv
+import json
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+import project
+import watch
+from alerts import RULE_KINDS, AlertEngine, AlertRule
+from fx import format_money
+from history import HISTORY_FETCHERS, HistoryStore, backfill_portfolio, portfolio_history, to_date, to_day
+from risk import RiskEngine
+from simulate import Snapshot, rebalance
+from valuation import price_vector, value_portfolio, value_portfolios
+from symbol_index import fetch_crypto_listings, fetch_stock_listings
+
+# Accepted spellings of the asset class column -> (Portfolio attribute, quantity field)
+ASSET_CLASSES = {
+    'stock': ('stocks', 'shares'),
+    'stocks': ('stocks', 'shares'),
+    'crypto': ('crypto', 'amount')
+}
+
+########################################################################
+# Streaming trade file parsing (CSV with a header row, or JSON Lines).
+# Columns: portfolio, asset_class, symbol, side (buy/sell), quantity, price,
+# and optionally timestamp (Unix seconds or ISO 8601). If side is missing,
+# a negative quantity means a sell.
+def iter_trade_file(path, default_portfolio=None):
+    # Yield (line number, trade dict) or (line number, ValueError) one row at a time.
+    with open(path, 'r', newline='') as file:
+        if path.endswith(('.jsonl', '.ndjson')):
+            rows = ((number, line) for number, line in enumerate(file, start=1) if line.strip())
+            for number, line in rows:
+                try:
+                    yield number, parse_trade(json.loads(line), default_portfolio)
+                except ValueError as error:
+                    yield number, error
+        else:
+            # Line 1 is the header
+            for number, row in enumerate(csv.DictReader(file), start=2):
+                try:
+                    yield number, parse_trade(row, default_portfolio)
+                except ValueError as error:
+                    yield number, error
+
+def parse_trade(row, default_portfolio=None):
+    # Normalise one raw row into {portfolio, asset_class, symbol, quantity, price, timestamp}.
+    portfolio_name = (row.get('portfolio') or default_portfolio or '').strip()
+    if not portfolio_name:
+        raise ValueError("missing portfolio")
+
+    asset_class = str(row.get('asset_class') or '').strip().lower()
+    if asset_class not in ASSET_CLASSES:
+        raise ValueError(f"unknown asset class '{asset_class}'")
+
+    symbol = str(row.get('symbol') or '').strip().upper()
+    if not symbol:
+        raise ValueError("missing symbol")
+
+    try:
+        quantity = float(row.get('quantity'))
+        price = float(row.get('price'))
+    except (TypeError, ValueError):
+        raise ValueError("quantity and price must be numbers")
+
+    side = str(row.get('side') or '').strip().lower()
+    if side == 'sell':
+        quantity = -abs(quantity)
+    elif side == 'buy':
+        quantity = abs(quantity)
+    elif side:
+        raise ValueError(f"unknown side '{side}'")
+    if quantity == 0 or price <= 0:
+        raise ValueError("quantity and price must be greater than 0")
+
+    return {
+        'portfolio': portfolio_name,
+        'asset_class': ASSET_CLASSES[asset_class][0],
+        'symbol': symbol,
+        'quantity': quantity,
+        'price': price,
+        'timestamp': parse_timestamp(row.get('timestamp'))
+    }
+
+def parse_timestamp(value):
+    if value in (None, ''):
+        return time.time()
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return datetime.fromisoformat(str(value)).timestamp()
+    except ValueError:
+        raise ValueError(f"bad timestamp '{value}'")
+
+########################################################################
+class ImportResult:
+    def __init__(self):
+        self.applied = 0
+        self.errors = [] # (line number, message)
+        self.portfolios = set()
+
+    def summary(self):
+        return (f"Imported {self.applied} trades into {len(self.portfolios)} portfolio(s); "
+                f"skipped {len(self.errors)}.")
+
+def import_trades(path, portfolios, store, default_portfolio=None):
+    # Apply every trade in a file to the portfolios dict and save once at the end.
+    # Pass 1 collects the unique symbols so each is validated once, in batches;
+    # pass 2 streams the file again and applies the valid trades in order.
+    result = ImportResult()
+    symbols = {'stocks': set(), 'crypto': set()}
+    for number, trade in iter_trade_file(path, default_portfolio):
+        if isinstance(trade, ValueError):
+            continue
+        symbols[trade['asset_class']].add(trade['symbol'])
+
+    valid = {
+        'stocks': {ticker for ticker, (ok, _) in project.validate_tickers(symbols['stocks']).items() if ok},
+        'crypto': {symbol for symbol, (ok, _) in project.validate_cryptos(symbols['crypto']).items() if ok}
+    }
+
+    changed = set() # (portfolio, asset_class, symbol) whose holding must be saved
+    trades = []
+    for number, trade in iter_trade_file(path, default_portfolio):
+        if isinstance(trade, ValueError):
+            result.errors.append((number, str(trade)))
+            continue
+
+        asset_class, symbol = trade['asset_class'], trade['symbol']
+        if symbol not in valid[asset_class]:
+            result.errors.append((number, f"symbol '{symbol}' does not exist"))
+            continue
+
+        name = trade['portfolio']
+        if name not in portfolios:
+            portfolio = project.Portfolio(name)
+            portfolio._store = store # Created in the store by the final batch write
+            portfolios[name] = portfolio
+        portfolio = portfolios[name]
+        holdings = getattr(portfolio, asset_class)
+        quantity_field = 'shares' if asset_class == 'stocks' else 'amount'
+
+        quantity = trade['quantity']
+        if quantity > 0:
+            project.apply_buy(holdings, symbol, quantity_field, quantity, trade['price'])
+        else:
+            held = holdings[symbol][quantity_field] if symbol in holdings else 0
+            if -quantity > held:
+                result.errors.append((number, f"cannot sell {-quantity} {symbol}, only {held} held"))
+                continue
+            project.apply_sell(holdings, symbol, quantity_field, -quantity, trade['price'])
+
+        # Keep an already-loaded ledger in step; otherwise it loads from the store later
+        ledger = portfolio._stock_ledger if asset_class == 'stocks' else portfolio._crypto_ledger
+        if ledger is not None:
+            ledger.append(symbol, quantity, trade['price'], trade['timestamp'])
+
+        changed.add((name, asset_class, symbol))
+        trades.append((name, asset_class, symbol, quantity, trade['price'], trade['timestamp']))
+        result.applied += 1
+        result.portfolios.add(name)
+
+    holdings_changes = [
+        (name, asset_class, symbol, getattr(portfolios[name], asset_class).get(symbol))
+        for name, asset_class, symbol in changed
+    ]
+    store.apply_batch(holdings_changes, trades)
+    return result
+
+########################################################################
+# Subcommands
+def command_import(args):
+    store = project.open_portfolio_store()
+    portfolios = project.load_portfolios(store)
+    result = import_trades(args.path, portfolios, store, args.portfolio)
+
+    for number, message in result.errors[:args.max_errors]:
+        print(f"Line {number}: {message}", file=sys.stderr)
+    if len(result.errors) > args.max_errors:
+        print(f"... and {len(result.errors) - args.max_errors} more errors.", file=sys.stderr)
+    print(result.summary())
+    project.symbol_index.save()
+    return 1 if result.errors else 0
+
+def command_value(args):
+    portfolios = project.load_portfolios()
+    if args.all:
+        selected = portfolios
+    elif args.name in portfolios:
+        selected = {args.name: portfolios[args.name]}
+    else:
+        print(f"Portfolio '{args.name}' does not exist.", file=sys.stderr)
+        return 1
+
+    # Price every symbol across the selected portfolios once
+    currency = args.currency.upper() if args.currency else None
+    prices = project.fetch_prices(selected, currency=currency)
+    failed = {**prices.failed('stock'), **prices.failed('crypto')}
+    try:
+        fx = project.fx_rates(prices, currency)
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 1
+
+    if args.summary:
+        aggregate = value_portfolios(selected, prices.get('stock'), prices.get('crypto'), fx)
+        if args.json:
+            print(json.dumps(aggregate.to_dict(), indent=2))
+        else:
+            print(project.render_aggregate(aggregate, failed))
+        return 0
+
+    valuations = {
+        name: value_portfolio(portfolio, prices.get('stock'), prices.get('crypto'), fx)
+        for name, portfolio in selected.items()
+    }
+
+    if args.json:
+        print(json.dumps({name: valuation.to_dict() for name, valuation in valuations.items()}, indent=2))
+    else:
+        for name, valuation in valuations.items():
+            print(project.render_valuation(valuation, name, failed))
+    return 0
+
+def command_watch(args):
+    store = project.open_portfolio_store()
+    portfolios = project.load_portfolios(store)
+    if args.name not in portfolios:
+        print(f"Portfolio '{args.name}' does not exist.", file=sys.stderr)
+        return 1
+    engine = AlertEngine.from_store(store, args.name)
+    project.price_cache.load(project.PRICE_CACHE_FILE)
+    try:
+        watch.PortfolioWatch(portfolios[args.name], refresh=args.refresh,
+                             alerts=engine if len(engine) else None).run(args.count)
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 1
+    project.price_cache.save(project.PRICE_CACHE_FILE)
+    return 0
+
+def command_history(args):
+    portfolios = project.load_portfolios()
+    if args.name not in portfolios:
+        print(f"Portfolio '{args.name}' does not exist.", file=sys.stderr)
+        return 1
+    portfolio = portfolios[args.name]
+    store = HistoryStore(project.HISTORY_DIR)
+    last_day = to_day(time.time())
+    first_day = to_day(args.start) if args.start else last_day - args.days
+
+    project.price_cache.load(project.PRICE_CACHE_FILE)
+    if not args.offline:
+        backfill_portfolio(store, portfolio, first_day, last_day)
+    try:
+        fx = project.history_fx_rates(list(portfolio.stocks), offline=args.offline)
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 1
+    history = portfolio_history(store, portfolio, first_day, last_day, fx)
+    if not args.offline:
+        project.price_cache.save(project.PRICE_CACHE_FILE)
+
+    if args.json:
+        frame = history.to_frame()
+        frame.index = frame.index.astype(str)
+        print(frame.to_json(orient='index', indent=2))
+        return 0
+
+    from tabulate import tabulate
+
+    table = [
+        [str(to_date(day)), format_money(value, history.currency), f"{returns * 100:.2f} %", f"{drawdown * 100:.2f} %"]
+        for day, value, returns, drawdown in zip(history.days, history.value, history.returns, history.drawdown)
+    ][-args.rows:]
+    print("\n" + tabulate(table, ["Date", "Value", "Return", "Drawdown"], tablefmt="grid"))
+    print(f"Time-weighted return for '{args.name}': {history.total_return * 100:.2f} %")
+    print(f"Maximum drawdown for '{args.name}': {history.max_drawdown * 100:.2f} %")
+    if history.missing:
+        print(f"Left out (no price history): {', '.join(history.missing)}")
+    print()
+    return 0
+
+def command_risk(args):
+    portfolios = project.load_portfolios()
+    if args.name not in portfolios:
+        print(f"Portfolio '{args.name}' does not exist.", file=sys.stderr)
+        return 1
+    portfolio = portfolios[args.name]
+    store = HistoryStore(project.HISTORY_DIR)
+    last_day = to_day(time.time()) - 1 # Last complete daily bar
+    first_day = last_day - args.days
+
+    stock_prices = crypto_prices = None
+    project.price_cache.load(project.PRICE_CACHE_FILE)
+    if not args.offline:
+        for asset_class, holdings in (('stock', portfolio.stocks), ('crypto', portfolio.crypto)):
+            if holdings:
+                store.backfill(asset_class, list(holdings), first_day, last_day, HISTORY_FETCHERS[asset_class])
+        prices = project.fetch_prices(portfolio)
+        stock_prices, crypto_prices = prices.get('stock'), prices.get('crypto')
+    try:
+        if args.offline:
+            # Valued at stored closes: stocks in their quote currency, crypto in USD
+            fx = project.history_fx_rates(list(portfolio.stocks), offline=True)
+        else:
+            fx = project.fx_rates(prices)
+        report = RiskEngine(store).report(portfolio, first_day, last_day, stock_prices, crypto_prices,
+                                          args.confidence, args.horizon, fx)
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 1
+
+    if args.json:
+        print(json.dumps(report.to_dict(), indent=2))
+        return 0
+
+    from tabulate import tabulate
+
+    table = [
+        [symbol, format_money(report.value[index], report.currency), f"{report.weights[index] * 100:.2f} %",
+         f"{report.volatility[index] * 100:.2f} %"]
+        for index, symbol in enumerate(report.symbols)
+    ]
+    print("\n" + tabulate(table, ["Asset", "Market Value", "Weight", "Volatility (annual)"], tablefmt="grid"))
+    level = f"{report.confidence * 100:g}%"
+    print(f"Annualised volatility for '{args.name}': {report.portfolio_volatility * 100:.2f} % "
+          f"({report.observations} daily returns)")
+    print(f"{level} {report.horizon}-day historical VaR for '{args.name}': {format_money(report.var_historical, report.currency)}")
+    print(f"{level} {report.horizon}-day parametric VaR for '{args.name}': {format_money(report.var_parametric, report.currency)}")
+    if report.missing:
+        print(f"Left out (no price or history): {', '.join(report.missing)}")
+    print()
+    return 0
+
+def command_alerts(args):
+    store = project.open_portfolio_store()
+    if args.name is not None and args.name not in store.portfolio_names():
+        print(f"Portfolio '{args.name}' does not exist.", file=sys.stderr)
+        return 1
+    if args.action == 'add':
+        try:
+            rule = AlertRule(args.name, args.kind, args.direction, args.threshold,
+                             'crypto' if args.crypto else 'stock', args.symbol)
+        except ValueError as error:
+            print(error, file=sys.stderr)
+            return 1
+        [rule.id] = store.add_alerts([rule.to_row()])
+        print(f"Added alert {rule.id} for '{rule.portfolio}': {rule.describe(project.reporting_currency())}.")
+        return 0
+
+    if args.action == 'remove':
+        if not store.delete_alert(args.id):
+            print(f"Alert {args.id} does not exist.", file=sys.stderr)
+            return 1
+        print(f"Removed alert {args.id}.")
+        return 0
+
+    engine = AlertEngine.from_store(store, args.name)
+    if args.action == 'list':
+        for rule in engine.rules:
+            print(f"{rule.id:>6}  {rule.portfolio}: {rule.describe(project.reporting_currency())}")
+        return 0
+
+    # check: one round of prices for every portfolio with rules and every symbol watched
+    portfolios = project.load_portfolios(store)
+    selected = {rule.portfolio: portfolios[rule.portfolio] for rule in engine.rules if rule.portfolio in portfolios}
+    prices = project.fetch_prices(selected, extra=engine.price_symbols())
+    try:
+        fx = project.fx_rates(prices)
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 1
+    fired = engine.evaluate(selected, prices.get('stock'), prices.get('crypto'), fx)
+    for alert in fired:
+        print(alert.message)
+    print(f"{len(fired)} of {len(engine)} alerts triggered.")
+    return 0
+
+def parse_targets(entries):
+    # [(asset_class, symbol, weight)] from SYMBOL=WEIGHT entries; crypto:SYMBOL=WEIGHT for crypto.
+    targets = []
+    for entry in entries:
+        name, _, weight = entry.rpartition('=')
+        asset_class, _, symbol = name.rpartition(':')
+        asset_class = asset_class.lower() or 'stock'
+        if not symbol or asset_class not in ASSET_CLASSES:
+            raise ValueError(f"Can't read target '{entry}'; use SYMBOL=WEIGHT or crypto:SYMBOL=WEIGHT.")
+        try:
+            weight = float(weight)
+        except ValueError:
+            raise ValueError(f"Can't read the weight in '{entry}'.")
+        asset_class = 'crypto' if asset_class == 'crypto' else 'stock'
+        targets.append((asset_class, symbol.upper(), weight))
+    return targets
+
+def command_rebalance(args):
+    # Trades taking a portfolio to target weights, tried on a snapshot; nothing is changed.
+    portfolios = project.load_portfolios()
+    if args.name not in portfolios:
+        print(f"Portfolio '{args.name}' does not exist.", file=sys.stderr)
+        return 1
+    portfolio = portfolios[args.name]
+    try:
+        targets = parse_targets(args.targets)
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 1
+
+    held = {('stock', symbol) for symbol in portfolio.stocks} | {('crypto', symbol) for symbol in portfolio.crypto}
+    extra = {'stock': [], 'crypto': []}
+    for asset_class, symbol, _ in targets:
+        if (asset_class, symbol) not in held:
+            extra[asset_class].append(symbol)
+    prices = project.fetch_prices(portfolio, extra=extra)
+    try:
+        fx = project.fx_rates(prices)
+        snapshot = Snapshot.from_portfolio(portfolio, prices.get('stock'), prices.get('crypto'), fx)
+        new = [(asset_class, symbol) for asset_class in ('stock', 'crypto') for symbol in extra[asset_class]]
+        if new:
+            symbols = [symbol for _, symbol in new]
+            asset_classes = [asset_class for asset_class, _ in new]
+            price = price_vector(symbols, asset_classes, prices.get('stock'), prices.get('crypto'))
+            if fx is not None:
+                price = price * fx.price_factors(symbols, asset_classes)
+            snapshot = snapshot.with_assets(zip(asset_classes, symbols, price))
+        weights = np.zeros(len(snapshot))
+        for asset_class, symbol, weight in targets:
+            weights[snapshot.index(asset_class, symbol)] = weight
+        if weights.sum() <= 0:
+            raise ValueError("Target weights must add up to more than 0.")
+        results = rebalance(snapshot, weights / weights.sum())
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 1
+
+    if args.json:
+        print(json.dumps(results.to_dict(0), indent=2))
+        return 0
+
+    from tabulate import tabulate
+
+    currency = snapshot.currency
+    table = [
+        ["Buy" if quantity > 0 else "Sell", symbol, f"{abs(quantity):,.6g}", format_money(price, currency),
+         format_money(abs(quantity) * price, currency)]
+        for _, symbol, quantity, price in results.trades(0)
+    ]
+    print("\n" + tabulate(table, ["Side", "Asset", "Quantity", "Price", "Amount"], tablefmt="grid"))
+    print(f"Realised PnL from these trades: {format_money(results.trade_realised_pnl[0], currency)}")
+    print(f"Unrealised PnL after rebalancing: {format_money(results.unrealised_pnl[0], currency)}")
+    print(f"Total value: {format_money(results.total_value[0], currency)}\n")
+    return 0
+
+def command_serve(args):
+    from server import serve
+
+    serve(args.host, args.port)
+    return 0
+
+def command_index(args):
+    index = project.symbol_index
+    if args.action == 'build':
+        both = not args.stocks and not args.crypto
+        if args.stocks or both:
+            count = index.add_many('stock', fetch_stock_listings())
+            print(f"Indexed {count} stock symbols.")
+        if args.crypto or both:
+            count = index.add_many('crypto', fetch_crypto_listings(project.get_cmc_client()))
+            print(f"Indexed {count} crypto symbols.")
+        index.save()
+        return 0
+
+    asset_class = 'crypto' if args.crypto else 'stock'
+    for entry in index.prefix(asset_class, args.prefix or '', limit=args.limit):
+        print(f"{entry['symbol']:<10} {entry['name']} ({entry['exchange'] or asset_class})")
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="project.py", description="CryptoStock Tracker batch commands.")
+    subcommands = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = subcommands.add_parser('import', help="import trades from a CSV or JSONL file")
+    import_parser.add_argument('path')
+    import_parser.add_argument('--portfolio', help="portfolio for rows without a portfolio column")
+    import_parser.add_argument('--max-errors', type=int, default=20, help="errors to print")
+    import_parser.set_defaults(handler=command_import)
+
+    value_parser = subcommands.add_parser('value', help="value one or all portfolios")
+    value_parser.add_argument('name', nargs='?')
+    value_parser.add_argument('--all', action='store_true', help="value every portfolio")
+    value_parser.add_argument('--json', action='store_true', help="print JSON instead of tables")
+    value_parser.add_argument('--summary', action='store_true', help="combined totals and exposures instead of one table each")
+    value_parser.add_argument('--currency', help="report in this currency instead of REPORTING_CURRENCY (e.g. EUR)")
+    value_parser.set_defaults(handler=command_value)
+
+    watch_parser = subcommands.add_parser('watch', help="live-updating view of one portfolio")
+    watch_parser.add_argument('name')
+    watch_parser.add_argument('--refresh', type=float, default=watch.DEFAULT_REFRESH, help="seconds between updates")
+    watch_parser.add_argument('--count', type=int, help="stop after this many updates")
+    watch_parser.set_defaults(handler=command_watch)
+
+    history_parser = subcommands.add_parser('history', help="daily value, returns and drawdown of a portfolio")
+    history_parser.add_argument('name')
+    history_parser.add_argument('--days', type=int, default=365, help="days of history to show")
+    history_parser.add_argument('--start', help="first date (YYYY-MM-DD) instead of --days")
+    history_parser.add_argument('--rows', type=int, default=10, help="most recent days to print")
+    history_parser.add_argument('--offline', action='store_true', help="only use bars already stored")
+    history_parser.add_argument('--json', action='store_true', help="print every day as JSON")
+    history_parser.set_defaults(handler=command_history)
+
+    risk_parser = subcommands.add_parser('risk', help="volatility, correlation and Value-at-Risk of a portfolio")
+    risk_parser.add_argument('name')
+    risk_parser.add_argument('--days', type=int, default=365, help="days of daily returns to use")
+    risk_parser.add_argument('--confidence', type=float, default=0.95, help="VaR confidence level")
+    risk_parser.add_argument('--horizon', type=int, default=1, help="VaR horizon in days")
+    risk_parser.add_argument('--offline', action='store_true', help="only use bars already stored, valued at the last close")
+    risk_parser.add_argument('--json', action='store_true', help="print JSON, including the correlation matrix")
+    risk_parser.set_defaults(handler=command_risk)
+
+    alerts_parser = subcommands.add_parser('alerts', help="add, list, remove or check price and PnL alerts")
+    alerts_parser.add_argument('action', choices=['add', 'list', 'remove', 'check'])
+    alerts_parser.add_argument('name', nargs='?', help="portfolio (optional for list and check)")
+    alerts_parser.add_argument('--kind', choices=RULE_KINDS, default='price', help="what the alert watches")
+    alerts_parser.add_argument('--symbol', help="symbol for price and pnl_pct alerts")
+    alerts_parser.add_argument('--crypto', action='store_true', help="the symbol is a cryptocurrency")
+    alerts_parser.add_argument('--above', type=float, help="trigger when the value rises to this")
+    alerts_parser.add_argument('--below', type=float, help="trigger when the value falls to this")
+    alerts_parser.add_argument('--id', type=int, help="alert to remove")
+    alerts_parser.set_defaults(handler=command_alerts)
+
+    rebalance_parser = subcommands.add_parser('rebalance', help="trades to reach target weights, without changing the portfolio")
+    rebalance_parser.add_argument('name')
+    rebalance_parser.add_argument('targets', nargs='+', help="SYMBOL=WEIGHT (crypto:SYMBOL=WEIGHT for crypto); holdings left out are sold")
+    rebalance_parser.add_argument('--json', action='store_true', help="print the trades and resulting PnL as JSON")
+    rebalance_parser.set_defaults(handler=command_rebalance)
+
+    serve_parser = subcommands.add_parser('serve', help="serve portfolios and trades as a local JSON API")
+    serve_parser.add_argument('--host', default='127.0.0.1', help="address to listen on")
+    serve_parser.add_argument('--port', type=int, default=8765, help="port to listen on")
+    serve_parser.set_defaults(handler=command_serve)
+
+    index_parser = subcommands.add_parser('index', help="build or search the local symbol index")
+    index_parser.add_argument('action', choices=['build', 'search'])
+    index_parser.add_argument('prefix', nargs='?')
+    index_parser.add_argument('--stocks', action='store_true', help="only stock symbols")
+    index_parser.add_argument('--crypto', action='store_true', help="only crypto symbols")
+    index_parser.add_argument('--limit', type=int, default=20, help="search results to print")
+    index_parser.set_defaults(handler=command_index)
+    return parser
+
+def run(argv):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == 'value' and not args.all and not args.name:
+        parser.error("value needs a portfolio name or --all")
+    if args.command == 'alerts':
+        if args.action == 'add':
+            if not args.name or (args.above is None) == (args.below is None):
+                parser.error("alerts add needs a portfolio name and one of --above or --below")
+            args.direction = 'above' if args.above is not None else 'below'
+            args.threshold = args.above if args.above is not None else args.below
+        if args.action == 'remove' and args.id is None:
+            parser.error("alerts remove needs --id")
+    return args.handler(args)
+
+if __name__ == "__main__":
+    sys.exit(run(sys.argv[1:]))
@@ -0,0 +1,220 @@
+import argparse
+import contextlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import project
+from market_data import ReplayProvider
+from storage import PortfolioStore
+from symbol_index import SymbolIndex
+from timing import timings
+from valuation import value_portfolio
+
+DEFAULT_SIZES = [10, 1000, 10000, 100000]
+# Share of synthetic positions that are stocks; the rest are crypto
+STOCK_SHARE = 0.7
+# add/sell round trips timed per run
+TRADES = 50
+# Largest portfolio whose holdings table is rendered; above it tabulate dominates the run
+RENDER_LIMIT = 10000
+# Dependencies that must not be imported just by starting up
+HEAVY_MODULES = ['pandas', 'yfinance', 'requests', 'tabulate', 'dotenv']
+
+########################################################################
+# Offline benchmarks of the hot paths on synthetic portfolios.
+#   python bench.py --sizes 10,1000,100000 --latency 0.05
+# Prices come from replay providers (with optional per-request latency),
+# so runs are repeatable and make no network calls. Each phase is timed
+# through the timing hooks; memory is measured in a second, traced pass.
+# Rendering is skipped above --render-limit positions.
+def synthetic_market(positions, seed=0):
+    # Replay providers that know every synthetic symbol, plus the symbol lists.
+    rng = np.random.default_rng(seed)
+    stock_count = int(round(positions * STOCK_SHARE))
+    stocks = [f"S{number:06d}" for number in range(stock_count)]
+    crypto = [f"C{number:06d}" for number in range(positions - stock_count)]
+
+    def fixture(symbols, low, high, asset_class):
+        prices = rng.uniform(low, high, len(symbols))
+        return {
+            'asset_class': asset_class,
+            'prices': {symbol: float(price) for symbol, price in zip(symbols, prices)},
+            'metadata': {symbol: {'name': f"Synthetic {symbol}", 'exchange': None} for symbol in symbols}
+        }
+    return fixture(stocks, 5, 500, 'stock'), fixture(crypto, 0.01, 50000, 'crypto'), stocks, crypto
+
+def synthetic_fx():
+    # Replay fixture with a rate for the reporting currency, so a non-USD
+    # REPORTING_CURRENCY is served offline too.
+    return {'asset_class': 'fx', 'prices': {project.reporting_currency(): 1.0}, 'metadata': {}}
+
+def synthetic_portfolio(name, stocks, crypto, seed=0):
+    rng = np.random.default_rng(seed + 1)
+    portfolio = project.Portfolio(name)
+    for symbol, shares, price in zip(stocks, rng.integers(1, 500, len(stocks)), rng.uniform(5, 500, len(stocks))):
+        portfolio.stocks[symbol] = {'shares': float(shares), 'buy_price': float(price)}
+    for symbol, amount, price in zip(crypto, rng.uniform(0.01, 10, len(crypto)), rng.uniform(0.01, 50000, len(crypto))):
+        portfolio.crypto[symbol] = {'amount': float(amount), 'buy_price': float(price)}
+    return portfolio
+
+@contextlib.contextmanager
+def offline_project(stock_fixture, crypto_fixture, latency):
+    # Point project at replay providers and a cold cache/index, then restore it.
+    saved = (project.stock_provider, project.crypto_provider, project.fx_provider, project.symbol_index)
+    project.stock_provider = ReplayProvider(stock_fixture, 'stock', latency, project.STOCK_BATCH_SIZE)
+    project.crypto_provider = ReplayProvider(crypto_fixture, 'crypto', latency, project.CMC_BATCH_SIZE)
+    project.fx_provider = ReplayProvider(synthetic_fx(), 'fx', latency)
+    project.symbol_index = SymbolIndex()
+    project.price_cache.clear()
+    try:
+        yield project.stock_provider, project.crypto_provider, project.fx_provider
+    finally:
+        project.stock_provider, project.crypto_provider, project.fx_provider, project.symbol_index = saved
+        project.price_cache.clear()
+
+def run_phases(positions, latency, directory, seed=0, render_limit=RENDER_LIMIT):
+    # One pass over every phase; returns the replay providers' request count.
+    stock_fixture, crypto_fixture, stocks, crypto = synthetic_market(positions, seed)
+    with offline_project(stock_fixture, crypto_fixture, latency) as providers:
+        portfolio = synthetic_portfolio("Bench", stocks, crypto, seed)
+        store = PortfolioStore(os.path.join(directory, f"bench-{positions}-{time.time_ns()}.db"))
+        try:
+            project.save_portfolios({"Bench": portfolio}, store)
+
+            with timings.timed('load'):
+                loaded = project.load_portfolios(store)
+                portfolio = loaded["Bench"]
+                len(portfolio.stocks)
+
+            result = project.fetch_prices(portfolio)
+            with timings.timed('compute'):
+                valuation = value_portfolio(portfolio, result.get('stock'), result.get('crypto'))
+            if positions <= render_limit:
+                with timings.timed('render'):
+                    project.render_valuation(valuation, portfolio.name)
+
+            # Add/sell round trips; each one validates the symbol and writes to the store
+            for symbol in stocks[:TRADES]:
+                project.add_stock(portfolio, symbol, 10, 100.0, confirmation='y')
+                project.sell_stock(portfolio, symbol, 5, 110.0)
+        finally:
+            store.close()
+        return sum(provider.calls for provider in providers)
+
+def benchmark(positions, latency=0.0, memory=True, seed=0, render_limit=RENDER_LIMIT):
+    # Wall time, request count, per-phase timings and (optionally) peak memory for one size.
+    # The holdings table is only rendered up to render_limit positions.
+    was_enabled = timings.enabled
+    timings.reset()
+    timings.enable()
+    with tempfile.TemporaryDirectory() as directory:
+        started = time.perf_counter()
+        requests = run_phases(positions, latency, directory, seed, render_limit)
+        wall = time.perf_counter() - started
+        phases = timings.summary()
+
+        peak = None
+        if memory:
+            timings.disable()
+            tracemalloc.start()
+            run_phases(positions, latency, directory, seed, render_limit)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    if not was_enabled:
+        timings.disable()
+
+    return {
+        'positions': positions,
+        'latency': latency,
+        'wall': wall,
+        'requests': requests,
+        'memory_peak': peak,
+        'rendered': positions <= render_limit,
+        'phases': phases
+    }
+
+########################################################################
+# Cold start: a fresh interpreter importing project, as the CLI does
+def startup_time(runs=5):
+    # Median seconds for a new Python process to import project, over several runs.
+    code = "import project"
+    directory = os.path.dirname(os.path.abspath(__file__))
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=directory, check=True)
+        times.append(time.perf_counter() - started)
+    baseline = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+        baseline.append(time.perf_counter() - started)
+    return {
+        'import': statistics.median(times),
+        'interpreter': statistics.median(baseline),
+        'heavy_modules': startup_modules()
+    }
+
+def startup_modules():
+    # Heavy dependencies a fresh `import project` loads (should be none).
+    code = f"import sys, project; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    directory = os.path.dirname(os.path.abspath(__file__))
+    output = subprocess.run([sys.executable, "-c", code], cwd=directory, check=True,
+                            capture_output=True, text=True).stdout.strip()
+    return output.split(',') if output else []
+
+def format_result(result):
+    memory = "n/a" if result['memory_peak'] is None else f"{result['memory_peak'] / 1e6:.1f} MB"
+    lines = [f"{result['positions']:,} positions: {result['wall'] * 1000:.1f} ms wall, "
+             f"{result['requests']} requests, peak memory {memory}"]
+    for name in ('persist', 'load', 'fetch', 'compute', 'render', 'add_stock', 'sell_stock'):
+        stats = result['phases'].get(name)
+        if stats:
+            lines.append(f"  {name:<12}{stats['total'] * 1000:>10.1f} ms total  "
+                         f"{stats['count']:>4}x  p50 {stats['p50'] * 1000:.2f} ms  p99 {stats['p99'] * 1000:.2f} ms")
+        elif name == 'render' and not result['rendered']:
+            lines.append(f"  {name:<12}   skipped (raise --render-limit to include it)")
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks on synthetic portfolios.")
+    parser.add_argument('--sizes', default=",".join(str(size) for size in DEFAULT_SIZES),
+                        help="comma-separated position counts")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every provider request")
+    parser.add_argument('--render-limit', type=int, default=RENDER_LIMIT,
+                        help="largest size whose holdings table is rendered")
+    parser.add_argument('--no-memory', action='store_true', help="skip the traced pass for peak memory")
+    parser.add_argument('--json', action='store_true', help="print JSON results (e.g. to keep as a baseline)")
+    parser.add_argument('--startup', action='store_true', help="only measure cold startup")
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        result = startup_time()
+        if args.json:
+            print(json.dumps(result, indent=2))
+        else:
+            print(f"import project: {result['import'] * 1000:.1f} ms "
+                  f"(bare interpreter {result['interpreter'] * 1000:.1f} ms)")
+            print(f"heavy modules loaded at startup: {', '.join(result['heavy_modules']) or 'none'}")
+        return 0
+
+    results = []
+    for size in (int(size) for size in args.sizes.split(',')):
+        result = benchmark(size, args.latency, memory=not args.no_memory, render_limit=args.render_limit)
+        results.append(result)
+        if not args.json:
+            print(format_result(result))
+    if args.json:
+        print(json.dumps(results, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
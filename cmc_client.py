@@ -0,0 +1,187 @@
+import threading
+import time
+
+CMC_BASE_URL = "https://pro-api.coinmarketcap.com"
+
+# CMC status.error_code values for an exhausted daily/monthly credit allowance.
+# Retrying these is pointless until the allowance resets.
+CREDIT_LIMIT_ERROR_CODES = {1009, 1010}
+# HTTP statuses worth retrying
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+########################################################################
+class CMCError(Exception):
+    # Raised when CoinMarketCap rejects a request or keeps failing after retries.
+    def __init__(self, message, status_code=None, error_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.error_code = error_code
+
+class CMCCreditLimitError(CMCError):
+    # Raised when the plan's daily or monthly credits are used up.
+    pass
+
+########################################################################
+class TokenBucket:
+    def __init__(self, rate_per_minute, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        if rate_per_minute <= 0:
+            raise ValueError("rate_per_minute must be greater than 0")
+        self._rate = rate_per_minute / 60.0 # Attribute 1: tokens added per second
+        self._capacity = capacity or rate_per_minute # Attribute 2: largest allowed burst
+        self._tokens = float(self._capacity)
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def acquire(self, tokens=1):
+        # Block until the tokens are available, then take them. Returns the time waited.
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                wait_time = (tokens - self._tokens) / self._rate
+            self._sleep(wait_time)
+            waited += wait_time
+
+########################################################################
+class CMCClient:
+    def __init__(self, api_key, base_url=CMC_BASE_URL, timeout=10, max_retries=3,
+                 backoff=0.5, max_backoff=30.0, rate_limit_per_minute=30, pool_size=10,
+                 sleep=time.sleep):
+        self._base_url = base_url.rstrip('/')
+        self._timeout = timeout # Attribute 1: per-request timeout in seconds
+        self._max_retries = max_retries # Attribute 2: retries after the first attempt
+        self._backoff = backoff # Attribute 3: first backoff delay, doubled on every retry
+        self._max_backoff = max_backoff
+        self._sleep = sleep
+        self._rate_limiter = TokenBucket(rate_limit_per_minute, sleep=sleep) if rate_limit_per_minute else None
+
+        self._api_key = api_key
+        self._pool_size = pool_size
+        self._session = None # Created on first use, so importing requests waits until then
+
+        self._lock = threading.Lock()
+        self.request_count = 0
+        self.retry_count = 0
+        self.credits_used = 0
+
+    ########################################################################
+    @property
+    def session(self):
+        # One pooled keep-alive session so repeated calls reuse the TCP/TLS connection
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self._pool_size, pool_maxsize=self._pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers.update({
+                'X-CMC_PRO_API_KEY': self._api_key or '',
+                'Accept': 'application/json'
+            })
+            self._session = session
+        return self._session
+
+    @property
+    def timeout(self):
+        return self._timeout
+
+    def stats(self):
+        return {
+            'requests': self.request_count,
+            'retries': self.retry_count,
+            'credits_used': self.credits_used
+        }
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+
+    #########################################################################
+    def _retry_delay(self, attempt, response):
+        # Honour Retry-After when CMC sends it, otherwise back off exponentially.
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after:
+                try:
+                    return min(float(retry_after), self._max_backoff)
+                except ValueError:
+                    pass
+        return min(self._backoff * (2 ** attempt), self._max_backoff)
+
+    def get(self, path, params=None):
+        # GET a CMC endpoint and return the decoded JSON body.
+        import requests
+
+        url = f"{self._base_url}/{path.lstrip('/')}"
+        session = self.session
+        attempt = 0
+
+        while True:
+            if self._rate_limiter:
+                self._rate_limiter.acquire()
+
+            response = None
+            try:
+                response = session.get(url, params=params, timeout=self._timeout)
+                with self._lock:
+                    self.request_count += 1
+            except (requests.ConnectionError, requests.Timeout) as error:
+                with self._lock:
+                    self.request_count += 1
+                if attempt >= self._max_retries:
+                    raise CMCError(f"Request to {path} failed: {error}") from error
+            else:
+                try:
+                    body = response.json()
+                except ValueError:
+                    body = {}
+                status = body.get('status') or {}
+                error_code = status.get('error_code')
+
+                if response.ok:
+                    with self._lock:
+                        self.credits_used += status.get('credit_count', 0) or 0
+                    return body
+
+                message = status.get('error_message') or f"HTTP {response.status_code}"
+                if error_code in CREDIT_LIMIT_ERROR_CODES:
+                    raise CMCCreditLimitError(message, response.status_code, error_code)
+                if response.status_code not in RETRY_STATUSES or attempt >= self._max_retries:
+                    raise CMCError(message, response.status_code, error_code)
+
+            with self._lock:
+                self.retry_count += 1
+            self._sleep(self._retry_delay(attempt, response))
+            attempt += 1
+
+    #########################################################################
+    def quotes_latest(self, symbols, convert='USD'):
+        # Latest quotes for a list of symbols; unknown symbols are skipped.
+        body = self.get('/v1/cryptocurrency/quotes/latest', {
+            'symbol': ','.join(symbols),
+            'convert': convert,
+            'skip_invalid': 'true'
+        })
+        return body.get('data') or {}
+
+    def cryptocurrency_map(self, start=1, limit=5000, listing_status='active'):
+        # One page of the CMC id map (symbol, name, platform) for building a local symbol index.
+        body = self.get('/v1/cryptocurrency/map', {
+            'start': start,
+            'limit': limit,
+            'listing_status': listing_status,
+            'sort': 'cmc_rank'
+        })
+        return body.get('data') or []
@@ -0,0 +1,122 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+########################################################################
+# A price provider: a function that takes a list of symbols and returns
+# {symbol: price} for the ones it could price, plus how to batch calls to it.
+class Provider:
+    def __init__(self, name, fetch, batch_size=100, max_concurrency=4):
+        if batch_size < 1 or max_concurrency < 1:
+            raise ValueError("batch_size and max_concurrency must be at least 1.")
+        self._name = name # Attribute 1: provider name, e.g. 'stock' or 'crypto'
+        self._fetch = fetch # Attribute 2: fetch(symbols) -> {symbol: price}
+        self._batch_size = batch_size # Attribute 3: symbols per call
+        self._max_concurrency = max_concurrency # Attribute 4: calls in flight at once
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def batch_size(self):
+        return self._batch_size
+
+    @property
+    def max_concurrency(self):
+        return self._max_concurrency
+
+    def fetch(self, symbols):
+        return self._fetch(symbols)
+
+########################################################################
+class FetchResult:
+    def __init__(self):
+        self.prices = {} # provider name -> {symbol: price}
+        self.errors = {} # provider name -> {symbol: error message}
+        self.elapsed = 0.0
+
+    def get(self, provider):
+        # Prices found for one provider.
+        return self.prices.get(provider, {})
+
+    def failed(self, provider):
+        # Symbols of one provider that could not be priced, with the reason.
+        return self.errors.get(provider, {})
+
+    @property
+    def complete(self):
+        return not any(self.errors.values())
+
+########################################################################
+class FetchEngine:
+    def __init__(self, providers, timeout=15.0):
+        self._providers = {provider.name: provider for provider in providers}
+        self._timeout = timeout # Default deadline for a whole fetch, in seconds
+        # One pool per provider, sized to its concurrency limit and reused across fetches
+        self._executors = {}
+
+    @property
+    def providers(self):
+        return self._providers
+
+    def _executor(self, provider):
+        if provider.name not in self._executors:
+            self._executors[provider.name] = ThreadPoolExecutor(
+                max_workers=provider.max_concurrency,
+                thread_name_prefix=f"fetch-{provider.name}"
+            )
+        return self._executors[provider.name]
+
+    def fetch(self, symbols_by_provider, timeout=None):
+        # Fetch every provider's symbols at the same time.
+        # symbols_by_provider is {provider name: [symbols]}. Batches that fail or do not
+        # finish before the deadline are reported in FetchResult.errors; everything that
+        # did arrive is still returned.
+        timeout = self._timeout if timeout is None else timeout
+        started = time.perf_counter()
+        result = FetchResult()
+        futures = {}
+
+        for name, symbols in symbols_by_provider.items():
+            if name not in self._providers:
+                raise ValueError(f"Unknown price provider '{name}'.")
+            provider = self._providers[name]
+            symbols = list(dict.fromkeys(symbols))
+            result.prices[name] = {}
+            result.errors[name] = {}
+
+            for start in range(0, len(symbols), provider.batch_size):
+                batch = symbols[start:start + provider.batch_size]
+                future = self._executor(provider).submit(provider.fetch, batch)
+                futures[future] = (name, batch)
+
+        done, not_done = wait(futures, timeout=timeout)
+
+        for future in not_done:
+            future.cancel()
+            name, batch = futures[future]
+            for symbol in batch:
+                result.errors[name][symbol] = f"timed out after {timeout}s"
+
+        for future in done:
+            name, batch = futures[future]
+            try:
+                prices = future.result()
+            except Exception as error: # One failing batch must not sink the others
+                for symbol in batch:
+                    result.errors[name][symbol] = str(error) or type(error).__name__
+                continue
+
+            for symbol in batch:
+                if symbol in prices:
+                    result.prices[name][symbol] = prices[symbol]
+                else:
+                    result.errors[name][symbol] = "no price returned"
+
+        result.elapsed = time.perf_counter() - started
+        return result
+
+    def close(self):
+        for executor in self._executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+        self._executors.clear()
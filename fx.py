@@ -0,0 +1,142 @@
+import functools
+
+import numpy as np
+
+# Buy prices, sell prices and realised PnL are entered and stored in USD
+BASE_CURRENCY = 'USD'
+
+# Yahoo ticker suffix -> (currency the price is usually quoted in, currency units per quoted
+# unit). Only a fallback for when Yahoo hasn't told us the quote currency: most London lines
+# are quoted in pence (GBp), but many ETFs there trade in USD or GBP. Tickers without a
+# suffix are US listings in USD.
+TICKER_SUFFIXES = {
+    '.L': ('GBP', 0.01),
+    '.IL': ('USD', 1.0),
+    '.T': ('JPY', 1.0),
+    '.TO': ('CAD', 1.0),
+    '.V': ('CAD', 1.0),
+    '.DE': ('EUR', 1.0),
+    '.F': ('EUR', 1.0),
+    '.PA': ('EUR', 1.0),
+    '.AS': ('EUR', 1.0),
+    '.BR': ('EUR', 1.0),
+    '.MI': ('EUR', 1.0),
+    '.MC': ('EUR', 1.0),
+    '.LS': ('EUR', 1.0),
+    '.HE': ('EUR', 1.0),
+    '.VI': ('EUR', 1.0),
+    '.IR': ('EUR', 1.0),
+    '.SW': ('CHF', 1.0),
+    '.ST': ('SEK', 1.0),
+    '.OL': ('NOK', 1.0),
+    '.CO': ('DKK', 1.0),
+    '.HK': ('HKD', 1.0),
+    '.SI': ('SGD', 1.0),
+    '.AX': ('AUD', 1.0),
+    '.NZ': ('NZD', 1.0),
+    '.KS': ('KRW', 1.0),
+    '.SS': ('CNY', 1.0),
+    '.SZ': ('CNY', 1.0),
+    '.NS': ('INR', 1.0),
+    '.BO': ('INR', 1.0)
+}
+
+# Yahoo's codes for prices quoted in a currency's minor unit
+MINOR_UNITS = {
+    'GBp': ('GBP', 0.01),
+    'GBX': ('GBP', 0.01),
+    'ZAc': ('ZAR', 0.01),
+    'ZAC': ('ZAR', 0.01),
+    'ILA': ('ILS', 0.01)
+}
+
+# Symbols shown in front of amounts; other currencies are shown by code
+CURRENCY_SYMBOLS = {'USD': "$", 'EUR': "€", 'GBP': "£", 'JPY': "¥", 'SGD': "S$"}
+
+# Ticker -> (currency, units per quoted unit) from the currency Yahoo reports with the
+# quote; filled by project.get_quote_currencies and preferred over the suffix table
+QUOTE_CURRENCIES = {}
+
+def parse_quote_currency(code):
+    # (currency, currency units per quoted unit) for a Yahoo currency code such as 'GBp'.
+    return MINOR_UNITS.get(code) or (code.upper(), 1.0)
+
+def set_quote_currency(ticker, code):
+    QUOTE_CURRENCIES[ticker] = parse_quote_currency(code)
+
+def has_listing_suffix(ticker):
+    # True for tickers listed outside the US (VOD.L), whose quote currency varies.
+    return ticker.rfind('.') > 0
+
+@functools.lru_cache(maxsize=None)
+def suffix_currency(ticker):
+    # (currency, currency units per quoted unit) guessed from a Yahoo ticker's suffix.
+    dot = ticker.rfind('.')
+    if dot > 0:
+        listing = TICKER_SUFFIXES.get(ticker[dot:].upper())
+        if listing:
+            return listing
+    return BASE_CURRENCY, 1.0
+
+def ticker_currency(ticker):
+    # (currency, currency units per quoted unit) for a Yahoo ticker: what Yahoo reported
+    # for its quote when known, otherwise the suffix table.
+    return QUOTE_CURRENCIES.get(ticker) or suffix_currency(ticker)
+
+def fx_pair(currency):
+    # Yahoo symbol for the price of one unit of currency in USD.
+    return f"{currency}{BASE_CURRENCY}=X"
+
+def format_money(value, currency=BASE_CURRENCY):
+    symbol = CURRENCY_SYMBOLS.get(currency)
+    if symbol:
+        return f"{symbol}{value:,.2f}"
+    return f"{value:,.2f} {currency}"
+
+########################################################################
+# A snapshot of exchange rates, as USD per one unit of each currency,
+# used to convert a whole valuation into the reporting currency at once.
+# Currencies missing from the table convert to NaN, so positions quoted in
+# them show up as unpriced rather than being valued at the wrong rate.
+class FXRates:
+    def __init__(self, usd_rates, target=BASE_CURRENCY, crypto_currency=BASE_CURRENCY):
+        self._codes = {BASE_CURRENCY: 0} # Attribute 1: currency -> position in _rates
+        self._rates = [1.0] # Attribute 2: USD per unit
+        for currency, rate in usd_rates.items():
+            if currency != BASE_CURRENCY:
+                self._codes[currency] = len(self._rates)
+                self._rates.append(float(rate))
+        self._rates = np.array(self._rates + [np.nan]) # Unknown currencies point at the NaN
+        self.target = target # Attribute 3: reporting currency
+        self.crypto_currency = crypto_currency # Attribute 4: currency crypto prices are quoted in
+        if target not in self._codes:
+            raise ValueError(f"No exchange rate for the reporting currency '{target}'.")
+
+    def __contains__(self, currency):
+        return currency in self._codes
+
+    def factor(self, currency, target=None):
+        # Units of target per unit of currency (NaN if the rate is unknown).
+        target = target or self.target
+        unknown = len(self._rates) - 1
+        return float(self._rates[self._codes.get(currency, unknown)] / self._rates[self._codes.get(target, unknown)])
+
+    def price_factors(self, symbols, asset_classes):
+        # Multipliers taking each holding's quoted price into the target currency:
+        # stocks by ticker suffix (including the pence scale), crypto from
+        # crypto_currency.
+        unknown = len(self._rates) - 1
+        codes = np.empty(len(symbols), dtype=np.intp)
+        scales = np.ones(len(symbols))
+        crypto_code = self._codes.get(self.crypto_currency, unknown)
+        for index, symbol in enumerate(symbols):
+            if asset_classes[index] == 'stock':
+                currency, scales[index] = ticker_currency(symbol)
+                codes[index] = self._codes.get(currency, unknown)
+            else:
+                codes[index] = crypto_code
+        return self._rates[codes] * scales / self._rates[self._codes[self.target]]
+
+def stock_currencies(tickers):
+    # Currencies the given Yahoo tickers are quoted in.
+    return list(dict.fromkeys(ticker_currency(ticker)[0] for ticker in tickers))
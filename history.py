@@ -0,0 +1,337 @@
+import json
+import os
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+from fx import BASE_CURRENCY
+
+# One daily bar; day is days since 1970-01-01 (UTC)
+BAR_DTYPE = np.dtype([
+    ('day', '<i8'),
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('volume', '<f8')
+])
+SECONDS_PER_DAY = 24 * 60 * 60
+HISTORY_BATCH_SIZE = 200
+EPOCH = date(1970, 1, 1)
+
+def to_day(value):
+    # Day number for a Unix timestamp, date or ISO date string.
+    if isinstance(value, str):
+        value = date.fromisoformat(value)
+    if isinstance(value, date):
+        return (value - EPOCH).days
+    return int(value // SECONDS_PER_DAY)
+
+def to_date(day):
+    return EPOCH + timedelta(days=int(day))
+
+########################################################################
+# On-disk OHLCV store: one .npy file of BAR_DTYPE rows per symbol, sorted
+# by day and opened memory-mapped, so reading years of bars costs a page-in
+# rather than a parse. coverage.json records which day ranges have already
+# been fetched for each symbol, as sorted non-overlapping spans (weekends and
+# holidays have no bars, so the bars alone can't tell what is missing).
+class HistoryStore:
+    def __init__(self, root, clock=time.time):
+        self._root = root # Attribute 1: directory holding the store
+        self._clock = clock
+        self._coverage = None # "asset_class:symbol" -> [[first day, last day], ...] fetched
+        self._bars = {} # Open memory maps
+
+    @property
+    def root(self):
+        return self._root
+
+    def _key(self, asset_class, symbol):
+        return f"{asset_class}:{symbol}"
+
+    def _path(self, asset_class, symbol):
+        return os.path.join(self._root, asset_class, symbol.replace(os.sep, '_') + '.npy')
+
+    def _coverage_path(self):
+        return os.path.join(self._root, 'coverage.json')
+
+    def _ensure_loaded(self):
+        if self._coverage is not None:
+            return
+        self._coverage = {}
+        if os.path.exists(self._coverage_path()):
+            with open(self._coverage_path(), 'r') as file:
+                self._coverage = json.load(file)
+            for key, spans in self._coverage.items():
+                # Older stores kept a single [first day, last day] span
+                if spans and not isinstance(spans[0], list):
+                    self._coverage[key] = [spans]
+
+    def _save_coverage(self):
+        os.makedirs(self._root, exist_ok=True)
+        temp_path = self._coverage_path() + '.tmp'
+        with open(temp_path, 'w') as file:
+            json.dump(self._coverage, file, separators=(',', ':'))
+        os.replace(temp_path, self._coverage_path())
+
+    #########################################################################
+    def coverage(self, asset_class, symbol):
+        # ((first day, last day), ...) spans already fetched for a symbol, or None.
+        self._ensure_loaded()
+        spans = self._coverage.get(self._key(asset_class, symbol))
+        return tuple(tuple(span) for span in spans) if spans else None
+
+    def bars(self, asset_class, symbol):
+        # All stored bars for a symbol as a read-only memory-mapped array.
+        key = self._key(asset_class, symbol)
+        if key not in self._bars:
+            path = self._path(asset_class, symbol)
+            if os.path.exists(path):
+                self._bars[key] = np.load(path, mmap_mode='r')
+            else:
+                self._bars[key] = np.empty(0, dtype=BAR_DTYPE)
+        return self._bars[key]
+
+    def write(self, asset_class, symbol, bars, first_day, last_day):
+        # Merge newly fetched bars and mark [first_day, last_day] as fetched.
+        self._ensure_loaded()
+        existing = self.bars(asset_class, symbol)
+        bars = np.asarray(bars, dtype=BAR_DTYPE)
+        merged = np.concatenate([bars, existing]) # New bars first so they win duplicates
+        _, first = np.unique(merged['day'], return_index=True)
+        merged = merged[first] # np.unique returns the days sorted
+
+        # Drop every reference to the old file's memory map before replacing it;
+        # Windows refuses to replace a file that is still mapped.
+        del existing
+        self._bars.pop(self._key(asset_class, symbol), None)
+
+        path = self._path(asset_class, symbol)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = path + '.tmp.npy'
+        np.save(temp_path, merged)
+        os.replace(temp_path, path)
+
+        # Add the span, joining it with any spans it overlaps or touches
+        spans = sorted(list(self.coverage(asset_class, symbol) or ()) + [(int(first_day), int(last_day))])
+        joined = [list(spans[0])]
+        for start, end in spans[1:]:
+            if start <= joined[-1][1] + 1:
+                joined[-1][1] = max(joined[-1][1], end)
+            else:
+                joined.append([start, end])
+        self._coverage[self._key(asset_class, symbol)] = joined
+
+    def missing_ranges(self, asset_class, symbol, first_day, last_day):
+        # Day ranges inside [first_day, last_day] that have not been fetched yet,
+        # including gaps between earlier fetches.
+        ranges = []
+        start = first_day
+        for span_first, span_last in self.coverage(asset_class, symbol) or ():
+            if span_last < start:
+                continue
+            if span_first > last_day:
+                break
+            if span_first > start:
+                ranges.append((start, span_first - 1))
+            start = span_last + 1
+        if start <= last_day:
+            ranges.append((start, last_day))
+        return ranges
+
+    def backfill(self, asset_class, symbols, first_day, last_day, fetch):
+        # Fetch only the missing ranges. Symbols missing the same range share
+        # one fetch(symbols, first_day, last_day) -> {symbol: bars} call.
+        # Today's bar is still moving, so coverage stops at yesterday.
+        last_day = min(last_day, to_day(self._clock()) - 1)
+        wanted = {}
+        for symbol in dict.fromkeys(symbols):
+            for span in self.missing_ranges(asset_class, symbol, first_day, last_day):
+                wanted.setdefault(span, []).append(symbol)
+
+        calls = 0
+        for (start, end), group in wanted.items():
+            if start > end:
+                continue
+            fetched = fetch(group, start, end)
+            calls += 1
+            for symbol in group:
+                # Symbols with no bars (not listed yet, delisted) are still marked as fetched
+                self.write(asset_class, symbol, fetched.get(symbol, np.empty(0, dtype=BAR_DTYPE)), start, end)
+        if calls:
+            self._save_coverage()
+        return calls
+
+    #########################################################################
+    def close_matrix(self, assets, days):
+        # Closing prices as a (len(days), len(assets)) array for (asset_class, symbol)
+        # pairs. Days without a bar carry the previous close forward; days before
+        # the first bar use the first close. Symbols with no bars at all are NaN.
+        days = np.asarray(days, dtype=np.int64)
+        closes = np.full((len(days), len(assets)), np.nan)
+        for column, (asset_class, symbol) in enumerate(assets):
+            bars = self.bars(asset_class, symbol)
+            if len(bars) == 0:
+                continue
+            index = np.searchsorted(bars['day'], days, side='right') - 1
+            closes[:, column] = bars['close'][np.maximum(index, 0)]
+        return closes
+
+########################################################################
+# Fetching daily bars with yfinance
+def frame_to_bars(frame):
+    # Convert a yfinance OHLCV DataFrame for one ticker to BAR_DTYPE rows.
+    frame = frame.dropna(subset=['Close'])
+    bars = np.empty(len(frame), dtype=BAR_DTYPE)
+    bars['day'] = frame.index.values.astype('datetime64[D]').astype(np.int64)
+    for field in ('open', 'high', 'low', 'close', 'volume'):
+        bars[field] = frame[field.capitalize()].to_numpy(dtype=np.float64)
+    return bars
+
+def fetch_yfinance_history(tickers, first_day, last_day, batch_size=HISTORY_BATCH_SIZE, timeout=10):
+    # Daily bars for many tickers over [first_day, last_day], in batched downloads.
+    import pandas as pd
+    import yfinance as yf
+
+    bars = {}
+    tickers = list(dict.fromkeys(tickers))
+    for start in range(0, len(tickers), batch_size):
+        chunk = tickers[start:start + batch_size]
+        data = yf.download(chunk, start=to_date(first_day).isoformat(), end=to_date(last_day + 1).isoformat(),
+                           interval='1d', auto_adjust=True, group_by='ticker', progress=False,
+                           threads=True, timeout=timeout)
+        if data.empty:
+            continue
+        for ticker in chunk:
+            if isinstance(data.columns, pd.MultiIndex):
+                if ticker not in data.columns.get_level_values(0):
+                    continue
+                frame = data[ticker]
+            else:
+                frame = data
+            bars[ticker] = frame_to_bars(frame)
+    return bars
+
+def fetch_stock_history(tickers, first_day, last_day):
+    return fetch_yfinance_history(tickers, first_day, last_day)
+
+def fetch_crypto_history(symbols, first_day, last_day):
+    # CMC's historical OHLCV endpoints need a paid plan, so daily crypto bars
+    # come from Yahoo's SYMBOL-USD pairs instead.
+    pairs = {f"{symbol.upper()}-USD": symbol for symbol in symbols}
+    fetched = fetch_yfinance_history(list(pairs), first_day, last_day)
+    return {pairs[pair]: bars for pair, bars in fetched.items()}
+
+HISTORY_FETCHERS = {'stock': fetch_stock_history, 'crypto': fetch_crypto_history}
+
+########################################################################
+# Daily value, returns and drawdown of a portfolio from its trade history.
+class PortfolioHistory:
+    def __init__(self, days, value, flows, missing=(), currency=BASE_CURRENCY):
+        self.days = days # Attribute 1: day numbers
+        self.value = value # Attribute 2: market value at each day's close
+        self.flows = flows # Attribute 3: money put in (buys) minus taken out (sells) that day
+        self.missing = list(missing) # Traded symbols with no bars, left out of value and flows
+        self.currency = currency
+        self.invested = np.cumsum(flows)
+
+        # Daily returns with that day's trades taken out, so buying more isn't a gain
+        previous = np.concatenate([[np.nan], value[:-1]])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns = (value - previous - flows) / previous
+        self.returns = np.where(np.isfinite(returns), returns, 0.0)
+
+        # Drawdown of the time-weighted growth of 1, from its running peak
+        self.growth = np.cumprod(1 + self.returns)
+        self.drawdown = self.growth / np.maximum.accumulate(self.growth) - 1
+
+    def __len__(self):
+        return len(self.days)
+
+    @property
+    def total_return(self):
+        return float(self.growth[-1] - 1) if len(self) else 0.0
+
+    @property
+    def max_drawdown(self):
+        return float(self.drawdown.min()) if len(self) else 0.0
+
+    def to_frame(self):
+        import pandas as pd
+
+        return pd.DataFrame({
+            'value': self.value,
+            'flows': self.flows,
+            'invested': self.invested,
+            'returns': self.returns,
+            'drawdown': self.drawdown
+        }, index=pd.Index(self.days.astype('datetime64[D]'), name='date'))
+
+def position_matrix(ledger, days):
+    # Quantity held of each ledger symbol at the end of each day, shape (len(days), symbols).
+    columns = ledger.columns()
+    order = np.argsort(columns['timestamp'], kind='stable')
+    symbol_id = columns['symbol_id'][order]
+    quantity = columns['quantity'][order]
+    trade_day = (columns['timestamp'][order] // SECONDS_PER_DAY).astype(np.int64)
+
+    held = np.zeros((len(days), len(ledger.symbols)))
+    for column in range(len(ledger.symbols)):
+        mask = symbol_id == column
+        if not mask.any():
+            continue
+        running = np.cumsum(quantity[mask])
+        index = np.searchsorted(trade_day[mask], days, side='right') - 1
+        held[:, column] = np.where(index >= 0, running[np.maximum(index, 0)], 0.0)
+    return held
+
+def daily_flows(ledger, days, priced=None):
+    # Cash put in (positive) or taken out on each day by the ledger's trades.
+    # priced (one bool per ledger symbol) leaves out trades in symbols that aren't valued.
+    columns = ledger.columns()
+    trade_day = (columns['timestamp'] // SECONDS_PER_DAY).astype(np.int64)
+    offset = trade_day - days[0]
+    inside = (offset >= 0) & (offset < len(days))
+    if priced is not None:
+        inside &= np.asarray(priced, dtype=bool)[columns['symbol_id']]
+    return np.bincount(offset[inside], weights=(columns['quantity'] * columns['price'])[inside], minlength=len(days))
+
+def portfolio_history(store, portfolio, first_day, last_day, fx=None):
+    # Value a portfolio at every day's close from first_day to last_day, offline.
+    # Run backfill_portfolio first to make sure the bars are in the store. Symbols
+    # with no bars at all are left out of both the value and the flows, so buying
+    # them doesn't show up as a loss; they are listed in the result's missing.
+    # Closes are in each listing's quote currency (crypto bars in USD) and trade prices
+    # in USD, so any non-USD holding needs fx (project.history_fx_rates) to put both
+    # into fx.target.
+    days = np.arange(first_day, last_day + 1, dtype=np.int64)
+    value = np.zeros(len(days))
+    flows = np.zeros(len(days))
+    missing = []
+
+    for asset_class, ledger in (('stock', portfolio.stock_ledger), ('crypto', portfolio.crypto_ledger)):
+        if len(ledger) == 0:
+            continue
+        held = position_matrix(ledger, days)
+        closes = store.close_matrix([(asset_class, symbol) for symbol in ledger.symbols], days)
+        if fx is not None:
+            closes = closes * fx.price_factors(ledger.symbols, [asset_class] * len(ledger.symbols))
+        priced = np.array([len(store.bars(asset_class, symbol)) > 0 for symbol in ledger.symbols], dtype=bool)
+        missing += [symbol for symbol, has_bars in zip(ledger.symbols, priced) if not has_bars]
+        value += np.nansum(held * closes, axis=1)
+        flows += daily_flows(ledger, days, priced)
+    if fx is None:
+        return PortfolioHistory(days, value, flows, missing)
+    return PortfolioHistory(days, value, flows * fx.factor(BASE_CURRENCY), missing, fx.target)
+
+def backfill_portfolio(store, portfolio, first_day, last_day, fetchers=None):
+    # Make sure every symbol the portfolio ever traded has bars for the range.
+    # Returns the number of fetch calls made.
+    fetchers = fetchers or HISTORY_FETCHERS
+    calls = 0
+    for asset_class, ledger in (('stock', portfolio.stock_ledger), ('crypto', portfolio.crypto_ledger)):
+        if ledger.symbols:
+            calls += store.backfill(asset_class, ledger.symbols, first_day, last_day, fetchers[asset_class])
+    return calls
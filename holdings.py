@@ -0,0 +1,160 @@
+import sys
+from collections.abc import MutableMapping
+
+########################################################################
+# Compact holdings. A holding used to be a dict like
+# {'shares': 2, 'buy_price': 150, 'realised_pnl': 10}; Holding keeps the
+# same three values in __slots__ and still behaves like that dict
+# (holding['shares'], holding['shares'] += 1, 'realised_pnl' in holding,
+# holding.get(...), == with a dict), so the rest of the code is unchanged.
+class Holding(MutableMapping):
+    __slots__ = ('quantity', 'buy_price', 'realised_pnl')
+    QUANTITY_FIELD = None # 'shares' or 'amount', set by the subclasses
+
+    def __init__(self, quantity, buy_price, realised_pnl=None):
+        self.quantity = quantity # Attribute 1: shares or amount held
+        self.buy_price = buy_price # Attribute 2: average buy price
+        self.realised_pnl = realised_pnl # Attribute 3: None until the first sale
+
+    @classmethod
+    def from_mapping(cls, data):
+        return cls(data[cls.QUANTITY_FIELD], data['buy_price'], data.get('realised_pnl'))
+
+    def _slot(self, key):
+        if key == self.QUANTITY_FIELD:
+            return 'quantity'
+        if key in ('buy_price', 'realised_pnl'):
+            return key
+        raise KeyError(key)
+
+    def __getitem__(self, key):
+        value = getattr(self, self._slot(key))
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        setattr(self, self._slot(key), value)
+
+    def __delitem__(self, key):
+        if self._slot(key) != 'realised_pnl' or self.realised_pnl is None:
+            raise KeyError(key)
+        self.realised_pnl = None
+
+    def __iter__(self):
+        yield self.QUANTITY_FIELD
+        yield 'buy_price'
+        if self.realised_pnl is not None:
+            yield 'realised_pnl'
+
+    def __len__(self):
+        return 2 if self.realised_pnl is None else 3
+
+    def __repr__(self):
+        return repr(dict(self))
+
+class StockHolding(Holding):
+    __slots__ = ()
+    QUANTITY_FIELD = 'shares'
+
+class CryptoHolding(Holding):
+    __slots__ = ()
+    QUANTITY_FIELD = 'amount'
+
+########################################################################
+# symbol -> Holding for one asset class of one portfolio. Plain dicts
+# assigned to it are converted to Holding records, and symbols are
+# interned so thousands of portfolios holding AAPL share one string.
+class Holdings(MutableMapping):
+    __slots__ = ('_holding_class', '_records')
+
+    def __init__(self, holding_class, data=None):
+        self._holding_class = holding_class # Attribute 1: StockHolding or CryptoHolding
+        self._records = {} # Attribute 2: symbol -> Holding
+        if data:
+            for symbol, holding in data.items():
+                self[symbol] = holding
+
+    def __getitem__(self, symbol):
+        return self._records[symbol]
+
+    def __setitem__(self, symbol, holding):
+        if not isinstance(holding, self._holding_class):
+            holding = self._holding_class.from_mapping(holding)
+        self._records[sys.intern(symbol)] = holding
+
+    def __delitem__(self, symbol):
+        del self._records[symbol]
+
+    def __contains__(self, symbol):
+        return symbol in self._records
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def __len__(self):
+        return len(self._records)
+
+    def __repr__(self):
+        return repr({symbol: dict(holding) for symbol, holding in self._records.items()})
+
+def stock_holdings(data=None):
+    return Holdings(StockHolding, data)
+
+def crypto_holdings(data=None):
+    return Holdings(CryptoHolding, data)
+
+########################################################################
+# {name: Portfolio} view of a PortfolioStore that only reads a portfolio's
+# holdings the first time it is used. Names are read up front; iterating
+# values()/items() streams every holding that is still unread in one query.
+class PortfolioCatalog(MutableMapping):
+    def __init__(self, store, factory):
+        self._store = store # Attribute 1: PortfolioStore to read from
+        self._factory = factory # Attribute 2: (name, data) -> Portfolio
+        self._portfolios = dict.fromkeys(store.portfolio_names()) # name -> Portfolio, None until loaded
+
+    def is_loaded(self, name):
+        return self._portfolios.get(name) is not None
+
+    def __getitem__(self, name):
+        portfolio = self._portfolios[name]
+        if portfolio is None:
+            portfolio = self._factory(name, self._store.load_portfolio(name))
+            self._portfolios[name] = portfolio
+        return portfolio
+
+    def __setitem__(self, name, portfolio):
+        self._portfolios[name] = portfolio
+
+    def __delitem__(self, name):
+        del self._portfolios[name]
+
+    def __contains__(self, name):
+        return name in self._portfolios
+
+    def __iter__(self):
+        return iter(list(self._portfolios))
+
+    def __len__(self):
+        return len(self._portfolios)
+
+    def _load_all(self):
+        unloaded = {name for name, portfolio in self._portfolios.items() if portfolio is None}
+        if not unloaded:
+            return
+        for name, data in self._store.iter_portfolios():
+            if name in unloaded:
+                self._portfolios[name] = self._factory(name, data)
+                unloaded.discard(name)
+        # Portfolios without any holdings never appear in the stream
+        for name in unloaded:
+            self._portfolios[name] = self._factory(name, {'stocks': {}, 'crypto': {}})
+
+    def values(self):
+        self._load_all()
+        return [self._portfolios[name] for name in self._portfolios]
+
+    def items(self):
+        self._load_all()
+        return [(name, self._portfolios[name]) for name in self._portfolios]
@@ -0,0 +1,394 @@
+import time
+
+import numpy as np
+
+# Lot matching methods for realised PnL
+METHODS = ('fifo', 'lifo', 'average')
+
+# Quantities smaller than this are treated as zero (float noise from partial sells)
+EPSILON = 1e-9
+
+########################################################################
+# Append-only trade ledger stored as columns (NumPy arrays that grow by
+# doubling), so millions of fills stay compact and can be replayed in one
+# vectorized pass. Symbols are interned to small integer ids.
+class TradeLedger:
+    def __init__(self, capacity=1024):
+        self._symbols = [] # Attribute 1: symbol for each id
+        self._symbol_ids = {} # Attribute 2: symbol -> id
+        self._size = 0 # Attribute 3: number of trades
+        self._symbol_id = np.empty(capacity, dtype=np.int32)
+        self._quantity = np.empty(capacity, dtype=np.float64) # + for buys, - for sells
+        self._price = np.empty(capacity, dtype=np.float64)
+        self._timestamp = np.empty(capacity, dtype=np.float64) # Unix time in seconds
+        self._positions = {} # method -> Positions cached for incremental updates
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def symbols(self):
+        return list(self._symbols)
+
+    #########################################################################
+    def intern(self, symbol):
+        # Return the integer id for a symbol, adding it if new.
+        symbol_id = self._symbol_ids.get(symbol)
+        if symbol_id is None:
+            symbol_id = len(self._symbols)
+            self._symbols.append(symbol)
+            self._symbol_ids[symbol] = symbol_id
+        return symbol_id
+
+    def _reserve(self, extra):
+        needed = self._size + extra
+        capacity = len(self._quantity)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name in ('_symbol_id', '_quantity', '_price', '_timestamp'):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    def append(self, symbol, quantity, price, timestamp=None):
+        # Record one fill; quantity is positive for a buy and negative for a sell.
+        if quantity == 0:
+            raise ValueError("Trade quantity cannot be 0.")
+        if price < 0:
+            raise ValueError("Trade price cannot be negative.")
+        self._reserve(1)
+        index = self._size
+        self._symbol_id[index] = self.intern(symbol)
+        self._quantity[index] = quantity
+        self._price[index] = price
+        self._timestamp[index] = time.time() if timestamp is None else timestamp
+        self._size += 1
+
+    def extend(self, symbols, quantities, prices, timestamps=None):
+        # Record many fills at once from equal-length sequences/arrays.
+        quantities = np.asarray(quantities, dtype=np.float64)
+        prices = np.asarray(prices, dtype=np.float64)
+        count = len(quantities)
+        if len(symbols) != count or len(prices) != count:
+            raise ValueError("symbols, quantities and prices must have the same length.")
+        if np.any(quantities == 0) or np.any(prices < 0):
+            raise ValueError("Trades need a non-zero quantity and a non-negative price.")
+        if timestamps is None:
+            timestamps = np.full(count, time.time())
+
+        self._reserve(count)
+        end = self._size + count
+        self._symbol_id[self._size:end] = [self.intern(symbol) for symbol in symbols]
+        self._quantity[self._size:end] = quantities
+        self._price[self._size:end] = prices
+        self._timestamp[self._size:end] = np.asarray(timestamps, dtype=np.float64)
+        self._size = end
+
+    def columns(self, start=0):
+        # Read-only views of the trade columns from row start onwards.
+        views = {
+            'symbol_id': self._symbol_id[start:self._size],
+            'quantity': self._quantity[start:self._size],
+            'price': self._price[start:self._size],
+            'timestamp': self._timestamp[start:self._size]
+        }
+        for view in views.values():
+            view.flags.writeable = False
+        return views
+
+    #########################################################################
+    def positions(self, method='fifo'):
+        # Positions, average cost and realised PnL per symbol under a lot matching method.
+        # The first call replays the whole ledger; later calls only replay the open lots of
+        # symbols that traded since, plus the new trades.
+        if method not in METHODS:
+            raise ValueError(f"Unknown lot matching method '{method}'. Use one of {METHODS}.")
+
+        cached = self._positions.get(method)
+        if cached is not None and cached.trade_count == self._size:
+            return cached
+
+        symbol_count = len(self._symbols)
+        if cached is None:
+            positions = match_lots(self._symbol_id[:self._size], self._quantity[:self._size],
+                                   self._price[:self._size], symbol_count, method)
+        else:
+            positions = self._apply_new_trades(cached, method)
+
+        positions.symbols = list(self._symbols)
+        positions.trade_count = self._size
+        self._positions[method] = positions
+        return positions
+
+    def _apply_new_trades(self, cached, method):
+        # Replay only the symbols touched by new trades: their open lots behave exactly
+        # like earlier buys of the same size and price, so the result matches a full replay.
+        start = cached.trade_count
+        new_ids = self._symbol_id[start:self._size]
+        touched = np.unique(new_ids)
+        touched_lots = np.isin(cached.lot_symbol_id, touched)
+
+        replay = match_lots(
+            np.concatenate([cached.lot_symbol_id[touched_lots], new_ids]),
+            np.concatenate([cached.lot_quantity[touched_lots], self._quantity[start:self._size]]),
+            np.concatenate([cached.lot_price[touched_lots], self._price[start:self._size]]),
+            len(self._symbols), method
+        )
+
+        # Untouched symbols keep their cached numbers
+        symbol_count = len(self._symbols)
+        quantity = np.zeros(symbol_count)
+        cost_basis = np.zeros(symbol_count)
+        realised_pnl = np.zeros(symbol_count)
+        known = len(cached.quantity)
+        quantity[:known] = cached.quantity
+        cost_basis[:known] = cached.cost_basis
+        realised_pnl[:known] = cached.realised_pnl
+        quantity[touched] = replay.quantity[touched]
+        cost_basis[touched] = replay.cost_basis[touched]
+        realised_pnl[touched] += replay.realised_pnl[touched]
+
+        return Positions(
+            quantity, cost_basis, realised_pnl,
+            np.concatenate([cached.lot_symbol_id[~touched_lots], replay.lot_symbol_id]),
+            np.concatenate([cached.lot_quantity[~touched_lots], replay.lot_quantity]),
+            np.concatenate([cached.lot_price[~touched_lots], replay.lot_price])
+        )
+
+    #########################################################################
+    def save(self, path):
+        np.savez(
+            path,
+            symbols=np.array(self._symbols, dtype=str),
+            symbol_id=self._symbol_id[:self._size],
+            quantity=self._quantity[:self._size],
+            price=self._price[:self._size],
+            timestamp=self._timestamp[:self._size]
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            ledger = cls(capacity=max(len(data['quantity']), 1))
+            for symbol in data['symbols']:
+                ledger.intern(str(symbol))
+            ledger._size = len(data['quantity'])
+            ledger._symbol_id[:ledger._size] = data['symbol_id']
+            ledger._quantity[:ledger._size] = data['quantity']
+            ledger._price[:ledger._size] = data['price']
+            ledger._timestamp[:ledger._size] = data['timestamp']
+        return ledger
+
+########################################################################
+class Positions:
+    def __init__(self, quantity, cost_basis, realised_pnl, lot_symbol_id, lot_quantity, lot_price):
+        self.symbols = [] # Symbol for each id (filled in by TradeLedger)
+        self.trade_count = 0 # Ledger rows covered
+        self.quantity = quantity # Open quantity per symbol id
+        self.cost_basis = cost_basis # Cost of the open quantity per symbol id
+        self.realised_pnl = realised_pnl # Realised PnL per symbol id
+        # Open lots in trade order, used to apply new trades incrementally
+        self.lot_symbol_id = lot_symbol_id
+        self.lot_quantity = lot_quantity
+        self.lot_price = lot_price
+
+    @property
+    def average_cost(self):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(self.quantity > EPSILON, self.cost_basis / self.quantity, 0.0)
+
+    def as_dict(self):
+        # {symbol: {'quantity', 'average_cost', 'realised_pnl'}} for every symbol traded.
+        average_cost = self.average_cost
+        return {
+            symbol: {
+                'quantity': float(self.quantity[index]),
+                'average_cost': float(average_cost[index]),
+                'realised_pnl': float(self.realised_pnl[index])
+            }
+            for index, symbol in enumerate(self.symbols)
+        }
+
+########################################################################
+# Lot matching
+def _groups(symbol_id):
+    # Stable sort by symbol so each symbol's trades stay in time order.
+    order = np.argsort(symbol_id, kind='stable')
+    sorted_ids = symbol_id[order]
+    first = np.ones(len(sorted_ids), dtype=bool)
+    first[1:] = sorted_ids[1:] != sorted_ids[:-1]
+    starts = np.flatnonzero(first)
+    group = np.cumsum(first) - 1
+    return order, sorted_ids, starts, group
+
+def _grouped_cumsum(values, starts, group):
+    totals = np.cumsum(values)
+    return totals - (totals - values)[starts][group]
+
+def match_lots(symbol_id, quantity, price, symbol_count, method='fifo'):
+    # Replay trades (in time order) and match sells against buy lots.
+    symbol_id = np.asarray(symbol_id, dtype=np.int64)
+    quantity = np.asarray(quantity, dtype=np.float64)
+    price = np.asarray(price, dtype=np.float64)
+    if len(quantity) == 0:
+        empty = np.zeros(symbol_count)
+        return Positions(empty, empty.copy(), empty.copy(), np.empty(0, np.int32), np.empty(0), np.empty(0))
+
+    order, ids, starts, group = _groups(symbol_id)
+    q = quantity[order]
+    p = price[order]
+
+    # Running position per symbol; selling more than is held is not allowed
+    position = _grouped_cumsum(q, starts, group)
+    if position.min() < -EPSILON:
+        row = order[np.argmin(position)]
+        raise ValueError(f"Trade {row} sells more than the open position.")
+
+    if method == 'fifo':
+        result = _match_fifo(ids, q, p, starts, group)
+    elif method == 'average':
+        result = _match_average(ids, q, p, starts, group, position)
+        if result is None: # Float overflow on an extreme history, fall back to the scan
+            result = _match_scan(ids, q, p, 'average')
+    elif method == 'lifo':
+        result = _match_scan(ids, q, p, 'lifo')
+    else:
+        raise ValueError(f"Unknown lot matching method '{method}'. Use one of {METHODS}.")
+
+    realised, lot_row, lot_quantity, lot_price = result
+    keep = lot_quantity > EPSILON
+    lot_row, lot_quantity, lot_price = lot_row[keep], lot_quantity[keep], lot_price[keep]
+
+    positions_quantity = np.bincount(ids, weights=q, minlength=symbol_count)
+    positions_quantity[np.abs(positions_quantity) < EPSILON] = 0.0
+    cost_basis = np.bincount(ids[lot_row], weights=lot_quantity * lot_price, minlength=symbol_count)
+    realised_pnl = np.bincount(ids, weights=realised, minlength=symbol_count)
+
+    # Lots go back into original trade order so LIFO stacks replay correctly
+    lot_order = np.argsort(order[lot_row], kind='stable')
+    return Positions(
+        positions_quantity, cost_basis, realised_pnl,
+        ids[lot_row][lot_order].astype(np.int32), lot_quantity[lot_order], lot_price[lot_order]
+    )
+
+def _match_fifo(ids, q, p, starts, group):
+    # FIFO in one vectorized pass: in "units bought so far" space, the units a sell
+    # consumes are exactly the next ones after everything sold before it, so the cost of
+    # a sell is a difference of the cumulative buy-cost curve, found with np.interp.
+    bought = np.where(q > 0, q, 0.0)
+    sold = np.where(q < 0, -q, 0.0)
+    cum_bought = np.cumsum(bought)
+    cum_cost = np.cumsum(bought * p)
+
+    # Each symbol's sells start where that symbol's buys start on the global curve
+    bought_before_group = (cum_bought - bought)[starts][group]
+    sold_after = bought_before_group + _grouped_cumsum(sold, starts, group)
+    sold_before = sold_after - sold
+
+    is_buy = q > 0
+    curve_x = np.concatenate([[0.0], cum_bought[is_buy]])
+    curve_cost = np.concatenate([[0.0], cum_cost[is_buy]])
+    cost_of_sold = np.interp(sold_after, curve_x, curve_cost) - np.interp(sold_before, curve_x, curve_cost)
+    realised = np.where(q < 0, sold * p - cost_of_sold, 0.0)
+
+    # Units of each buy lot not yet consumed by that symbol's sells
+    sold_end = bought_before_group + np.add.reduceat(sold, starts)[group]
+    remaining = np.clip(cum_bought - np.maximum(cum_bought - bought, sold_end), 0.0, bought)
+    lot_row = np.flatnonzero(is_buy)
+    return realised, lot_row, remaining[lot_row], p[lot_row]
+
+def _match_average(ids, q, p, starts, group, position):
+    # Average cost without a Python loop. Each sell keeps a fraction r = after/before of
+    # every open unit, so with G = running product of r (reset whenever the position goes
+    # flat), the average cost after any trade is
+    #     sum(q_k * p_k / G_k) / sum(q_k / G_k)   over the buys k since the last flat point.
+    before = position - q
+    is_sell = q < 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        retention = np.where(is_sell & (before > EPSILON), position / before, 1.0)
+    retention[retention <= EPSILON] = 1.0
+
+    # Segments restart at each symbol's first trade and after each trade that went flat
+    new_segment = np.zeros(len(q), dtype=bool)
+    new_segment[starts] = True
+    new_segment[1:] |= np.abs(position[:-1]) < EPSILON
+    segment_starts = np.flatnonzero(new_segment)
+    segment = np.cumsum(new_segment) - 1
+
+    log_g = _grouped_cumsum(np.log(retention), segment_starts, segment)
+    with np.errstate(over='ignore'):
+        weight = np.where(q > 0, q * np.exp(-log_g), 0.0)
+    numerator = _grouped_cumsum(weight * p, segment_starts, segment)
+    denominator = _grouped_cumsum(weight, segment_starts, segment)
+    if not (np.all(np.isfinite(numerator)) and np.all(np.isfinite(denominator))):
+        return None
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        average_after = np.where(denominator > 0, numerator / denominator, 0.0)
+    # A sell realises against the average cost before it, which a sell does not change
+    realised = np.where(is_sell, -q * (p - average_after), 0.0)
+
+    # One lot per symbol: the open position at the final average cost
+    ends = np.r_[starts[1:] - 1, len(q) - 1]
+    return realised, ends, np.where(np.abs(position[ends]) < EPSILON, 0.0, position[ends]), average_after[ends]
+
+def _match_scan(ids, q, p, method):
+    # Sequential matching for LIFO (a stack cannot be vectorized) and as a fallback
+    # for the average method. Trades arrive grouped by symbol, in time order.
+    realised = np.zeros(len(q))
+    lot_rows = []
+    lot_quantities = []
+    lot_prices = []
+    lots = []
+    average_quantity = average_cost = 0.0
+
+    for row in range(len(q)):
+        if row == 0 or ids[row] != ids[row - 1]:
+            if method == 'average' and row > 0:
+                lot_rows.append(row - 1)
+                lot_quantities.append(average_quantity)
+                lot_prices.append(average_cost)
+            else:
+                for lot_row, lot_quantity in lots:
+                    lot_rows.append(lot_row)
+                    lot_quantities.append(lot_quantity)
+            lots = []
+            average_quantity = average_cost = 0.0
+
+        quantity = q[row]
+        if method == 'average':
+            if quantity > 0:
+                average_cost = (average_quantity * average_cost + quantity * p[row]) / (average_quantity + quantity)
+                average_quantity += quantity
+            else:
+                realised[row] = -quantity * (p[row] - average_cost)
+                average_quantity += quantity
+            continue
+
+        if quantity > 0:
+            lots.append([row, quantity])
+            continue
+        to_sell = -quantity
+        while to_sell > EPSILON:
+            lot = lots[-1]
+            used = min(lot[1], to_sell)
+            realised[row] += used * (p[row] - p[lot[0]])
+            lot[1] -= used
+            to_sell -= used
+            if lot[1] <= EPSILON:
+                lots.pop()
+
+    if method == 'average':
+        lot_rows.append(len(q) - 1)
+        lot_quantities.append(average_quantity)
+        lot_prices.append(average_cost)
+        return realised, np.array(lot_rows, dtype=np.int64), np.array(lot_quantities), np.array(lot_prices)
+
+    for lot_row, lot_quantity in lots:
+        lot_rows.append(lot_row)
+        lot_quantities.append(lot_quantity)
+    lot_rows = np.array(lot_rows, dtype=np.int64)
+    return realised, lot_rows, np.array(lot_quantities, dtype=np.float64), p[lot_rows]
@@ -0,0 +1,292 @@
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from fx import BASE_CURRENCY, fx_pair
+
+########################################################################
+# Market data providers. Everything the app asks the network for goes
+# through one of these: latest prices and symbol metadata (name,
+# exchange) for one asset class. Unknown symbols are left out of the
+# results rather than raising; network failures raise. A provider missing
+# latest_prices or metadata fails when it is created, not mid-fetch.
+class MarketDataProvider(ABC):
+    asset_class = None # 'stock', 'crypto' or 'fx'
+    currency = 'USD' # Currency crypto prices are quoted in (stocks are quoted in their listing currency)
+
+    @abstractmethod
+    def latest_prices(self, symbols):
+        # {symbol: latest price} for the symbols that have one.
+        raise NotImplementedError
+
+    @abstractmethod
+    def metadata(self, symbols):
+        # {symbol: {'name': ..., 'exchange': ...}} for the symbols that exist; stock
+        # sources may add the 'currency' Yahoo quotes the price in (e.g. 'GBp').
+        raise NotImplementedError
+
+    def quote_currencies(self, symbols):
+        # {symbol: currency code its price is quoted in} for the symbols the source knows.
+        return {symbol: info['currency'] for symbol, info in self.metadata(symbols).items() if info.get('currency')}
+
+    def quotes(self, symbols):
+        # {symbol: {'name', 'exchange', 'price'}} in as few calls as the source allows.
+        # Sources that return both at once (CMC) override this.
+        prices = self.latest_prices(symbols)
+        info = self.metadata(list(prices))
+        return {symbol: {**info.get(symbol, {'name': None, 'exchange': None}), 'price': price}
+                for symbol, price in prices.items()}
+
+########################################################################
+class YFinanceProvider(MarketDataProvider):
+    asset_class = 'stock'
+
+    def __init__(self, batch_size=200, timeout=10):
+        self._batch_size = batch_size # Attribute 1: tickers per yf.download call
+        self._timeout = timeout # Attribute 2: per-request timeout in seconds
+
+    def latest_prices(self, tickers):
+        # Latest close for many tickers in batched yfinance downloads.
+        import pandas as pd
+        import yfinance as yf
+
+        unique_tickers = list(dict.fromkeys(tickers))
+        prices = {}
+
+        for start in range(0, len(unique_tickers), self._batch_size):
+            chunk = unique_tickers[start:start + self._batch_size]
+            # A few days of history so weekends/holidays and mixed exchanges still have a close
+            data = yf.download(chunk, period="5d", auto_adjust=True, progress=False, threads=True,
+                               timeout=self._timeout)
+            if data.empty:
+                continue
+
+            closes = data["Close"]
+            if isinstance(closes, pd.Series):
+                closes = closes.to_frame(chunk[0])
+            # Last available close per ticker
+            for ticker, price in closes.ffill().iloc[-1].dropna().items():
+                prices.setdefault(ticker, float(price))
+        return prices
+
+    def metadata(self, tickers):
+        # Yahoo has no bulk endpoint for names, so this is one request per ticker.
+        import yfinance as yf
+
+        info = {}
+        for ticker in dict.fromkeys(tickers):
+            try:
+                details = yf.Ticker(ticker).info
+                info[ticker] = {'name': details['shortName'], 'exchange': details.get('exchange'),
+                                'currency': details.get('currency')}
+            except Exception: # Unknown ticker, or Yahoo unreachable
+                continue
+        return info
+
+    def quote_currencies(self, tickers):
+        # The currency on each ticker's quote ('GBp' for pence), one light request per ticker.
+        import yfinance as yf
+
+        currencies = {}
+        for ticker in dict.fromkeys(tickers):
+            try:
+                currency = yf.Ticker(ticker).fast_info['currency']
+            except Exception: # Unknown ticker, or Yahoo unreachable
+                continue
+            if currency:
+                currencies[ticker] = currency
+        return currencies
+
+########################################################################
+# Exchange rates as USD per unit of each currency, from Yahoo's CCYUSD=X
+# pairs: every currency of a valuation in one batched download.
+class YFinanceFXProvider(MarketDataProvider):
+    asset_class = 'fx'
+
+    def __init__(self, prices=None):
+        self._prices = prices or YFinanceProvider() # Attribute 1: provider the pairs are priced with
+
+    def latest_prices(self, currencies):
+        pairs = {fx_pair(currency): currency for currency in currencies if currency != BASE_CURRENCY}
+        rates = {pairs[pair]: rate for pair, rate in self._prices.latest_prices(list(pairs)).items()}
+        if BASE_CURRENCY in currencies:
+            rates[BASE_CURRENCY] = 1.0
+        return rates
+
+    def metadata(self, currencies):
+        return {currency: {'name': currency, 'exchange': None} for currency in currencies}
+
+########################################################################
+class CMCProvider(MarketDataProvider):
+    asset_class = 'crypto'
+
+    # client, api_key and convert may be zero-argument functions; they are only
+    # called when the first request is made, so configuration is read lazily.
+    def __init__(self, client, api_key=True, batch_size=100, convert='USD'):
+        self._client = client # Attribute 1: CMCClient, or a function returning one
+        self._api_key = api_key # Attribute 2: checked when the first request is made
+        self._batch_size = batch_size # Attribute 3: symbols per quotes/latest request
+        self._convert = convert # Attribute 4: currency every quote is requested in
+
+    @property
+    def client(self):
+        if callable(self._client):
+            self._client = self._client()
+        return self._client
+
+    @property
+    def currency(self):
+        if callable(self._convert):
+            self._convert = self._convert()
+        return self._convert
+
+    def quotes(self, symbols):
+        # Quotes for many symbols, sent comma-separated in chunks of batch_size,
+        # priced in one currency (CMC charges a credit per extra convert currency).
+        api_key = self._api_key() if callable(self._api_key) else self._api_key
+        if not api_key:
+            raise ValueError("API Key not found! Please set CMC_API_KEY in your .env file.")
+        unique_symbols = list(dict.fromkeys(symbol.upper() for symbol in symbols))
+        currency = self.currency
+        quotes = {}
+
+        for start in range(0, len(unique_symbols), self._batch_size):
+            chunk = unique_symbols[start:start + self._batch_size]
+            data = self.client.quotes_latest(chunk, convert=currency)
+            for symbol in chunk:
+                if symbol in data:
+                    platform = data[symbol].get('platform') or {}
+                    quotes[symbol] = {
+                        'name': data[symbol]['name'],
+                        'exchange': platform.get('name'),
+                        'price': data[symbol]['quote'][currency]['price']
+                    }
+        return quotes
+
+    def latest_prices(self, symbols):
+        return {symbol: quote['price'] for symbol, quote in self.quotes(symbols).items()}
+
+    def metadata(self, symbols):
+        return {symbol: {'name': quote['name'], 'exchange': quote['exchange']}
+                for symbol, quote in self.quotes(symbols).items()}
+
+########################################################################
+# Record/replay. A fixture file holds what a provider returned, per symbol:
+# {"asset_class": "stock", "prices": {"AAPL": 150.0},
+#  "metadata": {"AAPL": {"name": "Apple Inc.", "exchange": "NMS", "currency": "USD"}}}
+# plus, for crypto, the "currency" the prices are in (USD when missing).
+# RecordingProvider writes one while using a live provider; ReplayProvider
+# answers from one with no network, so tests and benchmarks run offline.
+def fixture_path(directory, asset_class):
+    return os.path.join(directory, f"{asset_class}.json")
+
+def load_fixture(path):
+    with open(path, 'r') as file:
+        fixture = json.load(file)
+    fixture.setdefault('prices', {})
+    fixture.setdefault('metadata', {})
+    return fixture
+
+class ReplayProvider(MarketDataProvider):
+    # latency (seconds) is slept for every request to stand in for a network round trip.
+    # With batch_size, a call for more symbols counts (and sleeps) as one request per batch,
+    # like the live providers.
+    def __init__(self, fixture, asset_class=None, latency=0.0, batch_size=None, sleep=time.sleep):
+        if isinstance(fixture, str):
+            fixture = load_fixture(fixture)
+        self._prices = dict(fixture.get('prices', {})) # Attribute 1: symbol -> price
+        self._metadata = dict(fixture.get('metadata', {})) # Attribute 2: symbol -> {'name', 'exchange'}
+        self.asset_class = asset_class or fixture.get('asset_class')
+        self.currency = fixture.get('currency', 'USD')
+        self._latency = latency
+        self._batch_size = batch_size
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self.calls = 0 # Number of provider calls served, like network requests
+
+    @classmethod
+    def from_directory(cls, directory, asset_class, latency=0.0, batch_size=None):
+        path = fixture_path(directory, asset_class)
+        if not os.path.exists(path):
+            return cls({}, asset_class, latency, batch_size)
+        return cls(path, asset_class, latency, batch_size)
+
+    def _key(self, symbol):
+        return symbol.upper() if self.asset_class == 'crypto' else symbol
+
+    def _count(self, symbols):
+        requests = 1
+        if self._batch_size and len(symbols) > self._batch_size:
+            requests = -(-len(symbols) // self._batch_size)
+        with self._lock:
+            self.calls += requests
+        if self._latency:
+            self._sleep(self._latency * requests)
+
+    def latest_prices(self, symbols):
+        keys = list(dict.fromkeys(self._key(symbol) for symbol in symbols))
+        self._count(keys)
+        return {key: self._prices[key] for key in keys if key in self._prices}
+
+    def metadata(self, symbols):
+        keys = list(dict.fromkeys(self._key(symbol) for symbol in symbols))
+        self._count(keys)
+        return {key: dict(self._metadata[key]) for key in keys if key in self._metadata}
+
+    def quotes(self, symbols):
+        keys = list(dict.fromkeys(self._key(symbol) for symbol in symbols))
+        self._count(keys)
+        quotes = {}
+        for key in keys:
+            if key in self._prices:
+                info = self._metadata.get(key, {'name': None, 'exchange': None})
+                quotes[key] = {**info, 'price': self._prices[key]}
+        return quotes
+
+class RecordingProvider(MarketDataProvider):
+    def __init__(self, provider, path):
+        self._provider = provider # Attribute 1: live provider being recorded
+        self._path = path # Attribute 2: fixture file, extended after every call
+        self.asset_class = provider.asset_class
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            self._fixture = load_fixture(path)
+        else:
+            self._fixture = {'asset_class': self.asset_class, 'prices': {}, 'metadata': {}}
+
+    @property
+    def currency(self):
+        return getattr(self._provider, 'currency', 'USD')
+
+    def _save(self, prices=None, metadata=None):
+        with self._lock:
+            self._fixture['currency'] = self.currency
+            self._fixture['prices'].update(prices or {})
+            self._fixture['metadata'].update(metadata or {})
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temp_path = f"{self._path}.tmp"
+            with open(temp_path, 'w') as file:
+                json.dump(self._fixture, file, indent=2, sort_keys=True)
+            os.replace(temp_path, self._path)
+
+    def latest_prices(self, symbols):
+        prices = self._provider.latest_prices(symbols)
+        self._save(prices=prices)
+        return prices
+
+    def metadata(self, symbols):
+        metadata = self._provider.metadata(symbols)
+        self._save(metadata=metadata)
+        return metadata
+
+    def quotes(self, symbols):
+        quotes = self._provider.quotes(symbols)
+        self._save(
+            prices={symbol: quote['price'] for symbol, quote in quotes.items()},
+            metadata={symbol: {'name': quote['name'], 'exchange': quote['exchange']} for symbol, quote in quotes.items()}
+        )
+        return quotes
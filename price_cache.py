@@ -0,0 +1,148 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Default time-to-live in seconds for each asset class.
+# Prices go stale quickly; symbol names/validation results barely change.
+DEFAULT_TTLS = {
+    'stock': 60,
+    'crypto': 30,
+    'fx': 15 * 60,
+    'stock_info': 24 * 60 * 60,
+    'stock_currency': 24 * 60 * 60,
+    'crypto_info': 24 * 60 * 60,
+}
+
+########################################################################
+# LRU cache of prices and symbol details with a TTL per asset class. The
+# fetch engine's worker pools and the server's executor use it at the same
+# time, so every read or change of the entries and counters holds _lock.
+class PriceCache:
+    def __init__(self, ttls=None, max_size=2048, clock=time.time):
+        self._ttls = dict(DEFAULT_TTLS) # Attribute 1: TTL per asset class
+        if ttls:
+            self._ttls.update(ttls)
+        self._max_size = max_size # Attribute 2: maximum number of entries
+        self._clock = clock # Attribute 3: time source (wall clock so entries survive a restart)
+        self._entries = OrderedDict() # (asset_class, symbol) -> (value, stored_at), oldest first
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    ########################################################################
+    # Getter for TTLs
+    @property
+    def ttls(self):
+        return self._ttls
+
+    # Getter for maximum size
+    @property
+    def max_size(self):
+        return self._max_size
+
+    def __len__(self):
+        return len(self._entries)
+
+    #########################################################################
+    def get(self, asset_class, symbol, default=None):
+        # Return a fresh cached value, or default if missing or expired.
+        key = (asset_class, symbol)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            value, stored_at = entry
+            if self._clock() - stored_at > self._ttls.get(asset_class, 0):
+                del self._entries[key]
+                self.misses += 1
+                return default
+
+            # Mark as most recently used
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, asset_class, symbol, value):
+        key = (asset_class, symbol)
+        with self._lock:
+            self._entries[key] = (value, self._clock())
+            self._entries.move_to_end(key)
+
+            # Evict least recently used entries once over capacity
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, asset_class=None, symbol=None):
+        # Drop matching entries (everything if no filter is given).
+        with self._lock:
+            for key in list(self._entries):
+                if asset_class is not None and key[0] != asset_class:
+                    continue
+                if symbol is not None and key[1] != symbol:
+                    continue
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self._max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+    #########################################################################
+    # Persistence so a restart starts with a warm cache.
+    def save(self, path):
+        now = self._clock()
+        with self._lock:
+            entries = [
+                [asset_class, symbol, value, stored_at]
+                for (asset_class, symbol), (value, stored_at) in self._entries.items()
+                if now - stored_at <= self._ttls.get(asset_class, 0)
+            ]
+        # Write to a temporary file first so a crash never leaves a half-written cache
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w') as file:
+            json.dump(entries, file)
+        os.replace(temp_path, path)
+
+    def load(self, path):
+        # Load entries saved by save(); expired or unreadable entries are ignored.
+        if not os.path.exists(path):
+            return 0
+        try:
+            with open(path, 'r') as file:
+                entries = json.load(file)
+        except (OSError, ValueError):
+            return 0
+
+        now = self._clock()
+        loaded = 0
+        with self._lock:
+            for asset_class, symbol, value, stored_at in entries:
+                if now - stored_at > self._ttls.get(asset_class, 0):
+                    continue
+                self._entries[(asset_class, symbol)] = (value, stored_at)
+                self._entries.move_to_end((asset_class, symbol))
+                loaded += 1
+
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+        return loaded
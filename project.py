@@ -1,28 +1,125 @@
-import yfinance as yf
-from tabulate import tabulate
-from dotenv import load_dotenv
-import requests
 import os
-import json
+import sys
+import time
 import logging
+from collections.abc import Mapping
+from price_cache import PriceCache
+from fetch_engine import FetchEngine, Provider
+from cmc_client import CMCClient
+from storage import PortfolioStore
+from ledger import TradeLedger
+from valuation import value_portfolio, value_portfolios
+from symbol_index import SymbolIndex
+from holdings import PortfolioCatalog, crypto_holdings, stock_holdings
+from timing import timed, timer
+from market_data import CMCProvider, RecordingProvider, ReplayProvider, YFinanceFXProvider, YFinanceProvider, fixture_path
+from fx import (BASE_CURRENCY, FXRates, format_money, has_listing_suffix, set_quote_currency, stock_currencies,
+                ticker_currency)
 
 ########################################################################
-# Coinmarketcap API key and URL
-load_dotenv()
-CMC_API_KEY = os.getenv("CMC_API_KEY")
-if not CMC_API_KEY:
-    raise ValueError("API Key not found! Please set CMC_API_KEY in your .env file.")
-CMC_URL = "https://pro-api.coinmarketcap.com/v1/cryptocurrency/quotes/latest"
-
-# JSON file to store portfolio data
+# Configuration. pandas, yfinance, requests, tabulate and python-dotenv are
+# only imported by the code paths that use them, and settings from the
+# environment / .env file are read the first time they are needed, so
+# starting the menu or importing this module for scripting stays fast.
+_config_loaded = False
+
+def get_config(name, default=None):
+    # A setting from the environment, loading the .env file on first use.
+    global _config_loaded
+    if not _config_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _config_loaded = True
+    return os.getenv(name, default)
+
+def reporting_currency():
+    # Currency values are shown in (REPORTING_CURRENCY, default USD).
+    return get_config("REPORTING_CURRENCY", BASE_CURRENCY).upper()
+
+# Coinmarketcap API key (CMC_API_KEY) is checked when the first CoinMarketCap request is made.
+# Requests per minute allowed by the CoinMarketCap plan (CMC_RATE_LIMIT, Basic plan: 30)
+DEFAULT_CMC_RATE_LIMIT = 30
+# Maximum number of symbols sent in one quotes/latest request
+CMC_BATCH_SIZE = 100
+# Maximum number of tickers sent in one yfinance download
+STOCK_BATCH_SIZE = 200
+# Per-request network timeout in seconds
+REQUEST_TIMEOUT = 10
+# Maximum number of requests in flight at once for each provider
+STOCK_CONCURRENCY = 4
+CRYPTO_CONCURRENCY = 2
+
+# Pooled CoinMarketCap client with retries and rate limiting, shared by all crypto lookups.
+# Created on first use.
+_cmc_client = None
+
+def get_cmc_client():
+    global _cmc_client
+    if _cmc_client is None:
+        rate_limit = int(get_config("CMC_RATE_LIMIT", DEFAULT_CMC_RATE_LIMIT))
+        _cmc_client = CMCClient(get_config("CMC_API_KEY"), timeout=REQUEST_TIMEOUT, rate_limit_per_minute=rate_limit)
+    return _cmc_client
+
+def __getattr__(name):
+    # project.cmc_client still works for scripts, creating the client on first access
+    if name == 'cmc_client':
+        return get_cmc_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Market data providers. MARKET_DATA_REPLAY=<dir> serves saved responses from <dir>/stock.json,
+# <dir>/crypto.json and <dir>/fx.json with no network; MARKET_DATA_RECORD=<dir> saves live
+# responses there. These two are read from the process environment only, not the .env file.
+def make_providers(replay_dir=None, record_dir=None):
+    if replay_dir:
+        return ReplayProvider.from_directory(replay_dir, 'stock'), ReplayProvider.from_directory(replay_dir, 'crypto')
+
+    stock = YFinanceProvider(batch_size=STOCK_BATCH_SIZE, timeout=REQUEST_TIMEOUT)
+    # Crypto is quoted straight in the reporting currency, one convert for every symbol
+    crypto = CMCProvider(get_cmc_client, lambda: get_config("CMC_API_KEY"), batch_size=CMC_BATCH_SIZE,
+                         convert=reporting_currency)
+    if record_dir:
+        stock = RecordingProvider(stock, fixture_path(record_dir, 'stock'))
+        crypto = RecordingProvider(crypto, fixture_path(record_dir, 'crypto'))
+    return stock, crypto
+
+def make_fx_provider(replay_dir=None, record_dir=None):
+    if replay_dir:
+        return ReplayProvider.from_directory(replay_dir, 'fx')
+    fx = YFinanceFXProvider(YFinanceProvider(batch_size=STOCK_BATCH_SIZE, timeout=REQUEST_TIMEOUT))
+    if record_dir:
+        fx = RecordingProvider(fx, fixture_path(record_dir, 'fx'))
+    return fx
+
+stock_provider, crypto_provider = make_providers(os.getenv("MARKET_DATA_REPLAY"), os.getenv("MARKET_DATA_RECORD"))
+fx_provider = make_fx_provider(os.getenv("MARKET_DATA_REPLAY"), os.getenv("MARKET_DATA_RECORD"))
+
+# SQLite database storing portfolio data, written on every change
+PORTFOLIO_DB = 'portfolios.db'
+# Old JSON file, migrated into PORTFOLIO_DB once
 PORTFOLIO_FILE = 'portfolios.json'
 
+# Shared price/validation cache used by every menu action, saved on exit for a warm restart
+PRICE_CACHE_FILE = 'price_cache.json'
+price_cache = PriceCache()
+
+# Local index of verified symbols so validation rarely needs the network
+SYMBOL_INDEX_FILE = 'symbols.json'
+symbol_index = SymbolIndex(SYMBOL_INDEX_FILE)
+
+# Daily OHLCV bars for the history command
+HISTORY_DIR = 'history'
+
 ########################################################################
 class Portfolio:
-    def __init__(self, name):
+    def __init__(self, name, store=None):
         self._name = name # Attribute 1: portfolio name
-        self._stocks = {} # Attribute 2: stocks
-        self._crypto = {} # Attribute 3: crypto
+        self._stocks = stock_holdings() # Attribute 2: stocks
+        self._crypto = crypto_holdings() # Attribute 3: crypto
+        self._store = store # Attribute 4: PortfolioStore that changes are saved to (optional)
+        self._stock_ledger = None # Attribute 5: TradeLedger of stock fills
+        self._crypto_ledger = None # Attribute 6: TradeLedger of crypto fills
+        if store is not None:
+            store.create_portfolio(name)
 
     ########################################################################
     # Getter for portfolio name
@@ -35,6 +132,8 @@ class Portfolio:
     def name(self, new_name):
         if not new_name:
             raise ValueError("\nPortfolio name cannot be empty.")
+        if self._store is not None:
+            self._store.rename_portfolio(self._name, new_name)
         self._name = new_name
 
     #########################################################################
@@ -58,49 +157,346 @@ class Portfolio:
     @crypto.setter
     def crypto(self, value):
         raise ValueError("\nPlease use add_crypto method.")
+
+    #########################################################################
+    # Trade ledgers (every fill, loaded from the store on first use)
+    @property
+    def stock_ledger(self):
+        if self._stock_ledger is None:
+            self._stock_ledger = self._load_ledger('stocks')
+        return self._stock_ledger
+
+    @property
+    def crypto_ledger(self):
+        if self._crypto_ledger is None:
+            self._crypto_ledger = self._load_ledger('crypto')
+        return self._crypto_ledger
+
+    def _load_ledger(self, asset_class):
+        ledger = TradeLedger()
+        if self._store is not None:
+            trades = list(self._store.iter_trades(self._name, asset_class))
+            if trades:
+                symbols, quantities, prices, timestamps = zip(*trades)
+                ledger.extend(symbols, quantities, prices, timestamps)
+        return ledger
+
     #########################################################################
+    # Record a fill (negative quantity for sells) after the holding changed:
+    # appended to the ledger and saved with the holding, if this portfolio has a store.
+    def record_stock_trade(self, ticker, quantity, price):
+        timestamp = time.time()
+        if self._store is not None:
+            with timed('persist'):
+                self._store.save_holding_and_trade(self._name, 'stocks', ticker, self._stocks.get(ticker), quantity, price, timestamp)
+        if self._stock_ledger is not None or self._store is None:
+            self.stock_ledger.append(ticker, quantity, price, timestamp)
+
+    def record_crypto_trade(self, symbol, quantity, price):
+        timestamp = time.time()
+        if self._store is not None:
+            with timed('persist'):
+                self._store.save_holding_and_trade(self._name, 'crypto', symbol, self._crypto.get(symbol), quantity, price, timestamp)
+        if self._crypto_ledger is not None or self._store is None:
+            self.crypto_ledger.append(symbol, quantity, price, timestamp)
 
     def get_stock_price(self, ticker):
-        stock = yf.Ticker(ticker)
-        price = stock.history(period="1d")
-        return price["Close"].iloc[0]
+        return get_stock_prices([ticker])[ticker]
 
     def get_crypto_price(self, symbol):
-        headers = {'X-CMC_PRO_API_KEY': CMC_API_KEY}
-        params = {
-        'symbol': symbol.upper(),
-        'convert': 'USD'
-        }
-        response = requests.get(CMC_URL, headers = headers, params = params)
-        price = response.json()
-        return price['data'][symbol]['quote']['USD']['price']
+        return get_crypto_prices([symbol])[symbol.upper()]
 
 ########################################################################
-# Function to load portfolios from JSON file.
-def load_portfolios():
-    if os.path.exists(PORTFOLIO_FILE):
-        with open(PORTFOLIO_FILE, 'r') as file:
-            portfolios_data = json.load(file)
-        portfolios = {}
-        for name, data in portfolios_data.items():
-            portfolio = Portfolio(name)
-            portfolio._stocks = data.get('stocks', {})
-            portfolio._crypto = data.get('crypto', {})
-            portfolios[name] = portfolio
-        return portfolios
+# Bulk stock prices
+def collect_stock_tickers(portfolios):
+    # Collect every unique stock ticker held across the given portfolios.
+    if isinstance(portfolios, Portfolio):
+        portfolios = [portfolios]
+    elif isinstance(portfolios, Mapping):
+        portfolios = portfolios.values()
+
+    tickers = {}
+    for portfolio in portfolios:
+        for ticker in portfolio.stocks:
+            tickers[ticker] = None
+    return list(tickers)
+
+def get_stock_prices(tickers):
+    # Latest close for many tickers, served from price_cache where fresh.
+    # Returns a pandas Series of prices indexed by ticker; tickers without data are dropped.
+    cached = {}
+    missing = []
+    for ticker in dict.fromkeys(tickers):
+        price = price_cache.get('stock', ticker)
+        if price is None:
+            missing.append(ticker)
+        else:
+            cached[ticker] = price
+
+    import pandas as pd
+
+    fetched = download_stock_prices(missing) if missing else pd.Series(dtype=float)
+    for ticker, price in fetched.items():
+        price_cache.set('stock', ticker, float(price))
+
+    if not cached:
+        return fetched
+    return pd.concat([pd.Series(cached, dtype=float), fetched])
+
+def download_stock_prices(tickers):
+    # Latest close for many tickers from the stock provider, as a pandas Series.
+    import pandas as pd
+
+    return pd.Series(stock_provider.latest_prices(tickers), dtype=float)
+
+########################################################################
+# Batched crypto quotes
+def collect_crypto_symbols(portfolios):
+    # Collect every unique crypto symbol held across the given portfolios.
+    if isinstance(portfolios, Portfolio):
+        portfolios = [portfolios]
+    elif isinstance(portfolios, Mapping):
+        portfolios = portfolios.values()
+
+    symbols = {}
+    for portfolio in portfolios:
+        for symbol in portfolio.crypto:
+            symbols[symbol.upper()] = None
+    return list(symbols)
+
+def get_crypto_quotes(symbols):
+    # Fetch {symbol: {'name', 'exchange', 'price'}} for many symbols from the crypto provider,
+    # which batches them into as few requests as possible.
+    # Unknown symbols are simply missing from the result.
+    quotes = crypto_provider.quotes(symbols)
+    for symbol, quote in quotes.items():
+        # Every quote also carries the name, so warm both caches
+        price_cache.set('crypto', crypto_cache_key(symbol), quote['price'])
+        price_cache.set('crypto_info', symbol, (True, quote['name']))
+    return quotes
+
+def crypto_cache_key(symbol):
+    # Crypto prices are cached per quote currency, so changing REPORTING_CURRENCY
+    # never serves a price in the old one.
+    currency = crypto_provider.currency
+    return symbol if currency == BASE_CURRENCY else f"{symbol}/{currency}"
+
+def get_crypto_prices(symbols):
+    # Return {symbol: price in crypto_provider.currency} for every symbol CMC knows about,
+    # using price_cache where fresh.
+    prices = {}
+    missing = []
+    for symbol in dict.fromkeys(symbol.upper() for symbol in symbols):
+        price = price_cache.get('crypto', crypto_cache_key(symbol))
+        if price is None:
+            missing.append(symbol)
+        else:
+            prices[symbol] = price
+
+    if missing:
+        quotes = get_crypto_quotes(missing)
+        for symbol, quote in quotes.items():
+            prices[symbol] = quote['price']
+    return prices
+
+########################################################################
+# Exchange rates (USD per unit of each currency), cached like prices
+def get_fx_rates(currencies):
+    # {currency: USD per unit}, fetching every stale rate in one batch.
+    rates = {}
+    missing = []
+    for currency in dict.fromkeys(currencies):
+        rate = 1.0 if currency == BASE_CURRENCY else price_cache.get('fx', currency)
+        if rate is None:
+            missing.append(currency)
+        else:
+            rates[currency] = rate
+
+    if missing:
+        for currency, rate in fx_provider.latest_prices(missing).items():
+            price_cache.set('fx', currency, float(rate))
+            rates[currency] = float(rate)
+    return rates
+
+def get_quote_currencies(tickers, offline=False):
+    # Learn the currency Yahoo quotes each non-US ticker in (VOD.L in GBp, CSPX.L in USD),
+    # so valuation converts it correctly. Cached for a day; tickers without a listing
+    # suffix are US lines in USD, and ones Yahoo doesn't answer for fall back to the
+    # suffix table in fx.py. offline uses only the cached answers.
+    missing = []
+    for ticker in dict.fromkeys(tickers):
+        if not has_listing_suffix(ticker):
+            continue
+        code = price_cache.get('stock_currency', ticker)
+        if code is None:
+            missing.append(ticker)
+        else:
+            set_quote_currency(ticker, code)
+
+    if missing and not offline:
+        for ticker, code in stock_provider.quote_currencies(missing).items():
+            price_cache.set('stock_currency', ticker, code)
+            set_quote_currency(ticker, code)
+    return {ticker: ticker_currency(ticker) for ticker in tickers}
+
+def fx_rates(result, currency=None):
+    # FXRates for a FetchResult, converting into currency (default: the reporting
+    # currency), or None when everything is already in USD.
+    currency = currency or reporting_currency()
+    rates = result.get('fx')
+    if currency == BASE_CURRENCY and not rates:
+        return None
+    if currency != BASE_CURRENCY and currency not in rates:
+        reason = result.failed('fx').get(currency, "no rate returned")
+        raise ValueError(f"No exchange rate for {currency} ({reason}).")
+    return FXRates(rates, currency, crypto_provider.currency)
+
+def history_fx_rates(tickers, currency=None, offline=False):
+    # FXRates for daily bars (stocks in their quote currency, crypto in USD from Yahoo)
+    # and USD trade prices, converting into currency (default: the reporting currency).
+    # Today's rates are used for every day. None when everything is already in USD.
+    # offline uses only rates still in the price cache and raises ValueError if one is missing.
+    currency = currency or reporting_currency()
+    get_quote_currencies(tickers, offline)
+    currencies = [code for code in dict.fromkeys(stock_currencies(tickers) + [currency]) if code != BASE_CURRENCY]
+    if not currencies:
+        return None
+    if offline:
+        rates = {code: price_cache.get('fx', code) for code in currencies}
+        rates = {code: rate for code, rate in rates.items() if rate is not None}
     else:
-        return {}
+        rates = get_fx_rates(currencies)
+    missing = [code for code in currencies if code not in rates]
+    if missing:
+        hint = " (run without --offline)" if offline else ""
+        raise ValueError(f"No exchange rate for {', '.join(missing)}{hint}.")
+    return FXRates(rates, currency, BASE_CURRENCY)
+
+def display_fx_rates(result):
+    # fx_rates for the menu: without a rate for the reporting currency, show USD instead.
+    try:
+        return fx_rates(result)
+    except ValueError as error:
+        print(f"\nWarning: {error} Showing values in {BASE_CURRENCY}.")
+        return fx_rates(result, BASE_CURRENCY)
 
-# Function to save portfolios to JSON file.
-def save_portfolios(portfolios):
+########################################################################
+# Concurrent price fetching for stocks and crypto together
+def fetch_stock_prices(tickers):
+    return get_stock_prices(tickers).to_dict()
+
+fetch_engine = FetchEngine([
+    Provider('stock', fetch_stock_prices, STOCK_BATCH_SIZE, STOCK_CONCURRENCY),
+    Provider('crypto', get_crypto_prices, CMC_BATCH_SIZE, CRYPTO_CONCURRENCY),
+    Provider('fx', get_fx_rates, STOCK_BATCH_SIZE, 1)
+])
+
+@timer('fetch')
+def fetch_prices(portfolios, timeout=None, extra=None, currency=None):
+    # Price every stock and crypto held in the given portfolio(s) concurrently.
+    # extra ({'stock': [...], 'crypto': [...]}) adds symbols that are not held, e.g. for alerts.
+    # Returns a FetchResult: result.get('stock') / result.get('crypto') hold the prices,
+    # result.failed(...) the symbols that could not be priced. When any price or the
+    # reporting currency (currency, default REPORTING_CURRENCY) is not USD, the exchange
+    # rates needed are fetched in the same round into result.get('fx'); see fx_rates.
+    return fetch_engine.fetch(price_requests(portfolios, extra, currency), timeout=timeout)
+
+def price_requests(portfolios, extra=None, currency=None):
+    # {provider: [symbols]} that fetch_prices asks the fetch engine for.
+    extra = extra or {}
+    tickers = list(dict.fromkeys(collect_stock_tickers(portfolios) + list(extra.get('stock', []))))
+    symbols = list(dict.fromkeys(collect_crypto_symbols(portfolios) + list(extra.get('crypto', []))))
+    wanted = {'stock': tickers, 'crypto': symbols}
+
+    get_quote_currencies(tickers)
+    currencies = stock_currencies(tickers) + [currency or reporting_currency()]
+    if symbols:
+        currencies.append(crypto_provider.currency)
+    currencies = [code for code in dict.fromkeys(currencies) if code != BASE_CURRENCY]
+    if currencies:
+        wanted['fx'] = currencies
+    return wanted
+
+########################################################################
+# Function to load portfolios from JSON file.
+portfolio_store = None
+
+def open_portfolio_store():
+    # Open the shared portfolio store, migrating the old JSON file the first time.
+    global portfolio_store
+    if portfolio_store is None:
+        portfolio_store = PortfolioStore(PORTFOLIO_DB)
+        portfolio_store.migrate_json(PORTFOLIO_FILE)
+    return portfolio_store
+
+# Function to load portfolios from the store.
+# Portfolios are read from the store the first time each one is used.
+@timer('load_portfolios')
+def load_portfolios(store=None):
+    store = store or open_portfolio_store()
+
+    def build(name, data):
+        portfolio = Portfolio(name)
+        portfolio._stocks = stock_holdings(data.get('stocks'))
+        portfolio._crypto = crypto_holdings(data.get('crypto'))
+        portfolio._store = store
+        return portfolio
+
+    return PortfolioCatalog(store, build)
+
+# Function to save all portfolios to the store in one transaction.
+# Changes made through add/sell are already saved as they happen, so this is only
+# needed for portfolios that were built without a store.
+@timer('persist')
+def save_portfolios(portfolios, store=None):
+    store = store or open_portfolio_store()
     portfolios_data ={}
     for name, portfolio in portfolios.items():
         portfolios_data[name] = {
             'stocks': portfolio.stocks,
             'crypto': portfolio.crypto
         }
-    with open(PORTFOLIO_FILE, 'w') as file:
-        json.dump(portfolios_data, file, indent=4)
+        portfolio._store = store
+    store.save_all(portfolios_data)
+
+########################################################################
+# Holding updates shared by the add/sell functions and bulk imports.
+# quantity_field is 'shares' for stocks and 'amount' for crypto.
+def apply_buy(holdings, symbol, quantity_field, quantity, buy_price):
+    if symbol in holdings:
+        # Get the current quantity and (average) buy price
+        old_quantity = holdings[symbol][quantity_field]
+        old_buy_price = holdings[symbol]['buy_price']
+
+        # Calculate the new total quantity
+        new_total_quantity = old_quantity + quantity
+
+        # Calculate the new weighted average buy price
+        new_buy_price = ((old_quantity * old_buy_price) + (quantity * buy_price)) / new_total_quantity
+
+        # Update the holding with the new total quantity and new average buy price
+        holdings[symbol][quantity_field] = new_total_quantity
+        holdings[symbol]['buy_price'] = new_buy_price
+    else:
+        holdings[symbol] = {quantity_field: quantity, 'buy_price': buy_price}
+
+def apply_sell(holdings, symbol, quantity_field, quantity, sell_price):
+    # Sell from a holding the caller has checked is large enough.
+    # Returns (realised PnL of this sale, quantity left).
+    realised_pnl = (sell_price - holdings[symbol]['buy_price']) * quantity
+
+    if 'realised_pnl' not in holdings[symbol]:
+        holdings[symbol]['realised_pnl'] = 0
+
+    holdings[symbol]['realised_pnl'] += realised_pnl
+
+    new_quantity = holdings[symbol][quantity_field] - quantity
+    if new_quantity > 0:
+        holdings[symbol][quantity_field] = new_quantity
+    else:
+        # Remove the holding if nothing is left
+        del holdings[symbol]
+    return realised_pnl, new_quantity
 
 ########################################################################
 # stock
@@ -109,14 +505,45 @@ logging.getLogger("yfinance").setLevel(logging.CRITICAL)
 
 def validate_ticker(ticker):
     # Validate if the ticker symbol exists and get the company name.
-    stock = yf.Ticker(ticker)
+    # The symbol index answers for known, recently verified tickers without a network call.
+    entry = symbol_index.lookup('stock', ticker)
+    if entry is not None:
+        return True, entry['name']
 
-    try:
-        company_name = stock.info['shortName']
-        return True, company_name
-    except Exception: # If the ticker does not exist
+    cached = price_cache.get('stock_info', ticker)
+    if cached is not None:
+        return tuple(cached)
+
+    info = stock_provider.metadata([ticker]).get(ticker)
+    if info is None: # If the ticker does not exist (or Yahoo is unreachable, so don't cache)
         return False, None
 
+    company_name = info['name']
+    price_cache.set('stock_info', ticker, (True, company_name))
+    symbol_index.add('stock', ticker, company_name, info.get('exchange'))
+    return True, company_name
+
+def validate_tickers(tickers):
+    # Validate many tickers at once: a ticker is valid if the bulk download has a price for it.
+    # Returns {ticker: (is_valid, company_name)}; the name is only known if already cached.
+    results = {}
+    missing = []
+    for ticker in dict.fromkeys(tickers):
+        entry = symbol_index.lookup('stock', ticker)
+        cached = price_cache.get('stock_info', ticker) if entry is None else None
+        if entry is not None:
+            results[ticker] = (True, entry['name'])
+        elif cached is not None:
+            results[ticker] = tuple(cached)
+        else:
+            missing.append(ticker)
+
+    prices = get_stock_prices(missing) if missing else {}
+    for ticker in missing:
+        results[ticker] = (ticker in prices, None)
+    return results
+
+@timer('add_stock')
 def add_stock(portfolio, ticker, shares, buy_price, confirmation=None):
     # Validate the ticker symbol first.
     is_valid, company_name = validate_ticker(ticker)
@@ -131,47 +558,51 @@ def add_stock(portfolio, ticker, shares, buy_price, confirmation=None):
         return ("\nOperation cancelled.")
 
 
-    if ticker in portfolio.stocks:
-        # Get the current amount of shares and (average) buy price
-        old_shares = portfolio.stocks[ticker]['shares']
-        old_buy_price = portfolio.stocks[ticker]['buy_price']
-
-        # Calculate the new total shares
-        new_total_shares = old_shares + shares
-
-        # Calculate the new weighted average buy price
-        new_buy_price = ((old_shares * old_buy_price) + (shares * buy_price)) / new_total_shares
-
-        # Update the stock with the new total shares and new average buy price
-        portfolio.stocks[ticker]['shares'] = new_total_shares
-        portfolio.stocks[ticker]['buy_price'] = new_buy_price
-    else:
-        portfolio.stocks[ticker] = {'shares': shares, 'buy_price': buy_price}
+    apply_buy(portfolio.stocks, ticker, 'shares', shares, buy_price)
+    portfolio.record_stock_trade(ticker, shares, buy_price)
 
     return (f"\nAdded {shares} shares of {ticker} to portfolio '{portfolio.name}' at {buy_price} per share.")
 
 # crypto
 def validate_crypto(symbol):
     # Validate if the crypto symbol exists and get its name.
-    headers = {'X-CMC_PRO_API_KEY': CMC_API_KEY}
-    params = {
-        'symbol': symbol.upper(),
-        'convert': 'USD'
-    }
+    return validate_cryptos([symbol])[symbol.upper()]
+
+def validate_cryptos(symbols):
+    # Validate many crypto symbols with batched quote requests.
+    # Returns {symbol: (is_valid, crypto_name)}.
+    results = {}
+    missing = []
+    for symbol in dict.fromkeys(symbol.upper() for symbol in symbols):
+        entry = symbol_index.lookup('crypto', symbol)
+        cached = price_cache.get('crypto_info', symbol) if entry is None else None
+        if entry is not None:
+            results[symbol] = (True, entry['name'])
+        elif cached is not None:
+            results[symbol] = tuple(cached)
+        else:
+            missing.append(symbol)
+    if not missing:
+        return results
 
     try:
-        response = requests.get(CMC_URL, headers=headers, params=params)
-        data = response.json()
-
-        # Check if the cryptocurrency symbol exists in the API response
-        if symbol.upper() in data['data']:
-            crypto_name = data['data'][symbol.upper()]['name']
-            return True, crypto_name
+        quotes = get_crypto_quotes(missing)
+    except Exception: # If the API request fails (not cached, so it is retried next time)
+        for symbol in missing:
+            results[symbol] = (False, None)
+        return results
+
+    # Check if each cryptocurrency symbol exists in the API response
+    for symbol in missing:
+        if symbol in quotes:
+            results[symbol] = (True, quotes[symbol]['name'])
+            symbol_index.add('crypto', symbol, quotes[symbol]['name'], quotes[symbol]['exchange'])
         else:
-            return False, None
-    except Exception: # If the symbol does not exist
-        return False, None
+            results[symbol] = (False, None)
+            price_cache.set('crypto_info', symbol, results[symbol])
+    return results
 
+@timer('add_crypto')
 def add_crypto(portfolio, symbol, amount, buy_price, confirmation=None):
     # Validate the crypto symbol first.
     is_valid, crypto_name = validate_crypto(symbol)
@@ -184,158 +615,193 @@ def add_crypto(portfolio, symbol, amount, buy_price, confirmation=None):
     if confirmation != 'y':
         return ("\nOperation cancelled.")
 
-    if symbol in portfolio.crypto:
-        # Get the current amount and (average) buy price
-        old_amount = portfolio.crypto[symbol]['amount']
-        old_buy_price = portfolio.crypto[symbol]['buy_price']
-
-        # Calculate the new total amount
-        new_total_amount = old_amount + amount
-
-        # Calculate the new weighted average buy price
-        new_buy_price = ((old_amount * old_buy_price) + (amount * buy_price)) / new_total_amount
-
-        # Update the crypto with the new total amount and new average buy price
-        portfolio.crypto[symbol]['amount'] = new_total_amount
-        portfolio.crypto[symbol]['buy_price'] = new_buy_price
-    else:
-        portfolio.crypto[symbol] = {'amount': amount, 'buy_price': buy_price}
+    apply_buy(portfolio.crypto, symbol, 'amount', amount, buy_price)
+    portfolio.record_crypto_trade(symbol, amount, buy_price)
 
     return (f"\nAdded {amount} units of {symbol} ({crypto_name}) to portfolio '{portfolio.name}' at {buy_price} per unit.")
 
 ########################################################################
 #stock
+@timer('sell_stock')
 def sell_stock(portfolio, ticker, shares_to_sell, sell_price):
     # Validate the ticker symbol exists in the portfolio.
     if ticker not in portfolio.stocks:
         return (f"\nError: You do not own any shares of '{ticker}'!")
 
     current_shares = portfolio.stocks[ticker]['shares']
-    avg_buy_price = portfolio.stocks[ticker]['buy_price']
 
     # Check if enough shares to sell.
     if shares_to_sell > current_shares:
         return (f"\nError: You only own {current_shares} shares of '{ticker}', cannot sell {shares_to_sell}.")
 
-    realised_pnl = (sell_price - avg_buy_price) * shares_to_sell
-
-    if 'realised_pnl' not in portfolio.stocks[ticker]:
-        portfolio.stocks[ticker]['realised_pnl'] = 0
+    realised_pnl, new_share_count = apply_sell(portfolio.stocks, ticker, 'shares', shares_to_sell, sell_price)
+    portfolio.record_stock_trade(ticker, -shares_to_sell, sell_price)
 
-    portfolio.stocks[ticker]['realised_pnl'] += realised_pnl
-
-    new_share_count = current_shares - shares_to_sell
     if new_share_count > 0:
-        portfolio.stocks[ticker]['shares'] = new_share_count
         return (f"\nSold {shares_to_sell} shares of {ticker}. Realised PnL: ${realised_pnl:,.2f}. You now own {new_share_count:,.2f} shares.")
     else:
-        # Remove the stock if the new share count is zero
-        del portfolio.stocks[ticker]
         return (f"\nSold all shares of {ticker}. Realised PnL: ${realised_pnl:,.2f}. You no longer own any shares of {ticker}.")
 
 #crypto
+@timer('sell_crypto')
 def sell_crypto(portfolio, symbol, amount_to_sell, sell_price):
     # Validate the crypto symbol exists in the portfolio.
     if symbol not in portfolio.crypto:
         return (f"\nError: You do not own any units of '{symbol}'!")
 
     current_amount = portfolio.crypto[symbol]['amount']
-    avg_buy_price = portfolio.crypto[symbol]['buy_price']
 
     # Check if enough units to sell.
     if amount_to_sell > current_amount:
         return (f"\nError: You only own {current_amount} units of '{symbol}', cannot sell {amount_to_sell}.")
 
-    realised_pnl = (sell_price - avg_buy_price) * amount_to_sell
-
-    if 'realised_pnl' not in portfolio.crypto[symbol]:
-        portfolio.crypto[symbol]['realised_pnl'] = 0
+    realised_pnl, new_amount = apply_sell(portfolio.crypto, symbol, 'amount', amount_to_sell, sell_price)
+    portfolio.record_crypto_trade(symbol, -amount_to_sell, sell_price)
 
-    portfolio.crypto[symbol]['realised_pnl'] += realised_pnl
-
-    new_amount = current_amount - amount_to_sell
     if new_amount > 0:
-        portfolio.crypto[symbol]['amount'] = new_amount
         return (f"\nSold {amount_to_sell} units of {symbol}. Realised PnL: ${realised_pnl:,.2f}. You now own {new_amount:,.2f} units.")
     else:
-        # Remove the crypto if the new amount is zero
-        del portfolio.crypto[symbol]
         return (f"\nSold all units of {symbol}. Realised PnL: ${realised_pnl:,.2f}. You no longer own any shares of {symbol}.")
 
 ########################################################################
 # Calculate total portfolio value by fetching real-time prices.
-def display_portfolio(portfolio):
+def display_portfolio(portfolio, stock_prices=None, crypto_prices=None, fx=None):
     # Display portfolio holdings in a table using tabulate.
-
-    # Create a list to store table data
-    table = []
-    total_value = 0
-    total_realised_pnl = 0
-    total_unrealised_pnl = 0
-
-    # Iterate over stocks and cryptos in the portfolio
-    # stock value
-    for ticker, data in portfolio.stocks.items():
-        stock_price = portfolio.get_stock_price(ticker)
-        total_value += data['shares'] * stock_price
-
-        unrealised_pnl = (stock_price - data['buy_price'])* data['shares']
-        unrealised_pnl_percentage = (unrealised_pnl / (data['buy_price'] * data['shares'])) * 100
-        total_unrealised_pnl += unrealised_pnl
-
-        realised_pnl = data.get('realised_pnl', 0)
-        total_realised_pnl += realised_pnl
-
-        table.append([
-            ticker,
-            f"{data['shares']:,.2f} shares",
-            f"${stock_price:,.2f} per share",
-            f"${data['shares'] * stock_price:,.2f}",
-            f"${data['buy_price']:,.2f}",
-            f"${unrealised_pnl:,.2f}",
-            f"{unrealised_pnl_percentage:.2f} %"
+    # stock_prices/crypto_prices can be prefetched (e.g. for all portfolios)
+    # with get_stock_prices/get_crypto_prices, and fx with fx_rates.
+
+    # Fetch stock and crypto prices concurrently; a failing provider only blanks its own rows
+    failed = {}
+    if stock_prices is None or crypto_prices is None:
+        result = fetch_prices(portfolio)
+        if stock_prices is None:
+            stock_prices = result.get('stock')
+            failed.update(result.failed('stock'))
+        if crypto_prices is None:
+            crypto_prices = result.get('crypto')
+            failed.update(result.failed('crypto'))
+        if fx is None:
+            fx = display_fx_rates(result)
+
+    with timed('compute'):
+        valuation = value_portfolio(portfolio, stock_prices, crypto_prices, fx)
+    with timed('render'):
+        print(render_valuation(valuation, portfolio.name, failed))
+    return valuation.total_value
+
+def display_all_portfolios(portfolios):
+    # Display every portfolio's totals and the combined exposure per asset.
+    # Each symbol is priced once however many portfolios hold it.
+    result = fetch_prices(portfolios)
+    with timed('compute'):
+        aggregate = value_portfolios(portfolios, result.get('stock'), result.get('crypto'), display_fx_rates(result))
+    failed = {**result.failed('stock'), **result.failed('crypto')}
+    with timed('render'):
+        print(render_aggregate(aggregate, failed))
+    return aggregate.total_value
+
+def render_aggregate(aggregate, failed=None):
+    # Format an AggregateValuation as a per-portfolio table and an exposure table.
+    from tabulate import tabulate
+
+    currency = aggregate.currency
+    portfolio_table = []
+    for name, valuation in aggregate.valuations.items():
+        share = valuation.total_value / aggregate.total_value * 100 if aggregate.total_value else 0.0
+        portfolio_table.append([
+            name,
+            format_money(valuation.total_value, currency),
+            format_money(valuation.total_unrealised_pnl, currency),
+            format_money(valuation.total_realised_pnl, currency),
+            f"{share:.2f} %"
         ])
 
-    # cryptocurrency value
-    for symbol, data in portfolio.crypto.items():
-        crypto_price = portfolio.get_crypto_price(symbol)
-        total_value += data['amount'] * crypto_price
-
-        unrealised_pnl = (crypto_price - data['buy_price'])* data['amount']
-        unrealised_pnl_percentage = (unrealised_pnl / (data['buy_price'] * data['amount'])) * 100
-        total_unrealised_pnl += unrealised_pnl
-
-        realised_pnl = data.get('realised_pnl', 0)
-        total_realised_pnl += realised_pnl
-
-        table.append([
-            symbol,
-            f"{data['amount']:,.2f} amount",
-            f"${crypto_price:,.2f} per unit",
-            f"${data['amount'] * crypto_price:,.2f}",
-            f"${data['buy_price']:,.2f}",
-            f"${unrealised_pnl:,.2f}",
-            f"{unrealised_pnl_percentage:.2f} %"
+    exposure_table = []
+    exposures = aggregate.exposures
+    # Largest positions first
+    for index in sorted(range(len(aggregate)), key=lambda index: -exposures[index]):
+        priced = aggregate.priced[index]
+        exposure_table.append([
+            aggregate.symbols[index],
+            f"{aggregate.quantity[index]:,.2f}",
+            format_money(aggregate.price[index], currency) if priced else "N/A",
+            format_money(aggregate.market_value[index], currency) if priced else "N/A",
+            f"{exposures[index] * 100:.2f} %"
         ])
 
-    # Headers for table
-    headers = [
-        "Asset",
-        "Quantity",
-        "Current Price",
-        "Total Value",
-        "Avg Buy Price",
-        "Unrealised PnL",
-        "Unrealised PnL (%)"
-        ]
+    lines = [
+        "\n" + tabulate(portfolio_table, ["Portfolio", "Total Value", "Unrealised PnL", "Realised PnL", "Share"], tablefmt="grid"),
+        "\n" + tabulate(exposure_table, ["Asset", "Quantity", "Current Price", "Total Value", "Exposure"], tablefmt="grid"),
+        f"Total value across all portfolios: {format_money(aggregate.total_value, currency)}",
+        f"Total unrealised gain/loss across all portfolios: {format_money(aggregate.total_unrealised_pnl, currency)}",
+        f"Total realised gain/loss across all portfolios: {format_money(aggregate.total_realised_pnl, currency)}\n"
+    ]
+
+    failed = failed or {}
+    for symbol in aggregate.missing:
+        reason = failed.get(symbol, failed.get(symbol.upper(), "no price"))
+        lines.append(f"Warning: no price for '{symbol}' ({reason}).")
+    return "\n".join(lines)
+
+# Headers for the holdings table
+VALUATION_HEADERS = [
+    "Asset",
+    "Quantity",
+    "Current Price",
+    "Total Value",
+    "Avg Buy Price",
+    "Unrealised PnL",
+    "Unrealised PnL (%)"
+    ]
+
+def valuation_row(valuation, index):
+    # Format one asset of a Valuation as a table row.
+    quantity_unit, price_unit = {'stock': ("shares", "per share"), 'crypto': ("amount", "per unit")}[valuation.asset_classes[index]]
+    symbol = valuation.symbols[index]
+    currency = valuation.currency
+    quantity = f"{valuation.quantity[index]:,.2f} {quantity_unit}"
+    buy_price = format_money(valuation.buy_price[index], currency)
+
+    if not valuation.priced[index]:
+        return [symbol, quantity, "N/A", "N/A", buy_price, "N/A", "N/A"]
+
+    return [
+        symbol,
+        quantity,
+        f"{format_money(valuation.price[index], currency)} {price_unit}",
+        format_money(valuation.market_value[index], currency),
+        buy_price,
+        format_money(valuation.unrealised_pnl[index], currency),
+        f"{valuation.unrealised_pnl_pct[index]:.2f} %"
+    ]
+
+def valuation_totals(valuation, portfolio_name):
+    # Total lines printed under the holdings table.
+    currency = valuation.currency
+    return [
+        f"Total portfolio value for '{portfolio_name}': {format_money(valuation.total_value, currency)}",
+        f"Total unrealised gain/loss for '{portfolio_name}': {format_money(valuation.total_unrealised_pnl, currency)}",
+        f"Total realised gain/loss for '{portfolio_name}': {format_money(valuation.total_realised_pnl, currency)}"
+    ]
+
+def render_valuation(valuation, portfolio_name, failed=None):
+    # Format a Valuation as the holdings table plus totals.
+    from tabulate import tabulate
+
+    # Create a list to store table data
+    table = [valuation_row(valuation, index) for index in range(len(valuation))]
 
-    print("\n" + tabulate(table, headers, tablefmt="grid"))
+    lines = ["\n" + tabulate(table, VALUATION_HEADERS, tablefmt="grid")]
+    lines += valuation_totals(valuation, portfolio_name)
+    lines[-1] += "\n"
 
-    print(f"Total portfolio value for '{portfolio.name}': ${total_value:,.2f}")
-    print(f"Total unrealised gain/loss for '{portfolio.name}': ${total_unrealised_pnl:,.2f}")
-    print(f"Total realised gain/loss for '{portfolio.name}': ${total_realised_pnl:,.2f}\n")
+    # Holdings without a price are excluded from the totals above
+    failed = failed or {}
+    for symbol in valuation.missing:
+        reason = failed.get(symbol, failed.get(symbol.upper(), "no price"))
+        lines.append(f"Warning: no price for '{symbol}' ({reason}).")
 
-    return total_value
+    return "\n".join(lines)
 
 ########################################################################
 def print_boxed_message(message):
@@ -353,6 +819,7 @@ def print_boxed_message(message):
 ########################################################################
 def main():
     portfolios = load_portfolios() # Load portfolios when run.
+    price_cache.load(PRICE_CACHE_FILE) # Start with prices still fresh from the last run.
 
     while True:
         print("\n* CryptoStock Tracker *")
@@ -384,7 +851,7 @@ def main():
             if portfolio_name in portfolios:
                 print(f"\nPortfolio '{portfolio_name}' already exists.")
             else:
-                portfolios[portfolio_name] = Portfolio(portfolio_name) # Creating an instance from the class Portfolio
+                portfolios[portfolio_name] = Portfolio(portfolio_name, store=open_portfolio_store()) # Creating an instance from the class Portfolio
                 print(f"\nPortfolio '{portfolio_name}' created.")
 
         elif choice == 2:
@@ -484,9 +951,11 @@ def main():
                 print(f"\nPortfolio '{portfolio_name}' does not exist.")
 
         elif choice == 6:
-            portfolio_name = input("\nEnter the portfolio name: ")
+            portfolio_name = input("\nEnter the portfolio name (or 'all' for every portfolio): ")
             if portfolio_name in portfolios:
                 display_portfolio(portfolios[portfolio_name])
+            elif portfolio_name.lower() == 'all':
+                display_all_portfolios(portfolios)
             else:
                 print(f"\nPortfolio '{portfolio_name}' does not exist.")
 
@@ -506,7 +975,9 @@ def main():
                 print(f"\nPortfolio '{old_name}' does not exist.")
 
         elif choice == 8:
-            save_portfolios(portfolios) # Save portfolios then exit.
+            # Every change is already saved to the store as it happens.
+            price_cache.save(PRICE_CACHE_FILE)
+            symbol_index.save()
             print("\nPortfolios successfully saved. Exiting Portfolio Manager.")
             break
 
@@ -514,4 +985,8 @@ def main():
             print("\nInvalid choice. Please try again.")
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        # Non-interactive subcommands, e.g. `python project.py import trades.csv`
+        import batch
+        sys.exit(batch.run(sys.argv[1:]))
     main()
@@ -0,0 +1,181 @@
+from collections import OrderedDict
+from statistics import NormalDist
+
+import numpy as np
+
+from fx import BASE_CURRENCY
+from valuation import holdings_arrays, price_vector
+
+# Stocks and crypto are lined up on calendar days (stock closes carry over
+# weekends, so Monday's return holds the whole weekend's move), which makes
+# a year 365 return observations for both.
+DAYS_PER_YEAR = 365
+DEFAULT_CONFIDENCE = 0.95
+# Reports kept for repeated questions about unchanged holdings and prices
+REPORT_CACHE_SIZE = 64
+
+########################################################################
+# Risk numbers for one set of holdings over one window of daily returns.
+# Money amounts are in currency; VaR is the loss (a positive number) not
+# exceeded with the given confidence over horizon days.
+class RiskReport:
+    def __init__(self, symbols, asset_classes, value, returns, confidence, horizon, missing, currency=BASE_CURRENCY):
+        self.symbols = symbols # Attribute 1: symbols with return history, in column order
+        self.asset_classes = asset_classes
+        self.value = value # Attribute 2: current market value of each position
+        self.returns = returns # Attribute 3: (days, assets) daily simple returns
+        self.confidence = confidence
+        self.horizon = horizon
+        self.missing = missing # Held symbols without a price or history, left out
+        self.currency = currency
+
+        observations = len(returns)
+        usable = observations > 1 and len(symbols) > 0
+        self.total_value = float(value.sum())
+        self.weights = value / self.total_value if self.total_value else np.zeros(len(value))
+        if usable:
+            self.covariance = np.cov(returns, rowvar=False, ddof=1).reshape(len(symbols), len(symbols))
+        else:
+            self.covariance = np.full((len(symbols), len(symbols)), np.nan)
+        self.volatility = np.sqrt(np.diag(self.covariance) * DAYS_PER_YEAR)
+        daily = np.sqrt(np.diag(self.covariance))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.correlation = self.covariance / np.outer(daily, daily)
+        np.fill_diagonal(self.correlation, 1.0)
+
+        # Daily PnL the current positions would have made on each day of the window
+        self.pnl = returns @ value
+        scale = np.sqrt(horizon)
+        if usable:
+            daily_sigma = float(np.sqrt(value @ self.covariance @ value))
+            self.portfolio_volatility = daily_sigma / self.total_value * np.sqrt(DAYS_PER_YEAR) if self.total_value else 0.0
+            self.var_parametric = NormalDist().inv_cdf(confidence) * daily_sigma * scale
+            self.var_historical = max(0.0, -float(np.percentile(self.pnl, (1 - confidence) * 100))) * scale
+        else:
+            self.portfolio_volatility = self.var_parametric = self.var_historical = float('nan')
+
+    def __len__(self):
+        return len(self.symbols)
+
+    @property
+    def observations(self):
+        return len(self.returns)
+
+    def to_dict(self):
+        def clean(value):
+            # JSON has no NaN
+            return None if value != value else float(value)
+
+        return {
+            'currency': self.currency,
+            'observations': self.observations,
+            'confidence': self.confidence,
+            'horizon_days': self.horizon,
+            'total_value': self.total_value,
+            'portfolio_volatility': clean(self.portfolio_volatility),
+            'var_historical': clean(self.var_historical),
+            'var_parametric': clean(self.var_parametric),
+            'assets': [
+                {
+                    'symbol': symbol,
+                    'asset_class': self.asset_classes[index],
+                    'market_value': clean(self.value[index]),
+                    'weight': clean(self.weights[index]),
+                    'volatility': clean(self.volatility[index])
+                }
+                for index, symbol in enumerate(self.symbols)
+            ],
+            'correlation': [[clean(value) for value in row] for row in self.correlation],
+            'missing': list(self.missing)
+        }
+
+########################################################################
+# Daily returns of many assets from a HistoryStore, and risk reports built
+# on them. Return matrices are kept per (assets, window) until the store
+# fetches more bars for one of the assets; reports are kept per (holdings,
+# prices, window, confidence, horizon), so asking again is a dict lookup.
+class RiskEngine:
+    def __init__(self, store, cache_size=REPORT_CACHE_SIZE):
+        self._store = store # Attribute 1: HistoryStore with the daily bars
+        self._cache_size = cache_size # Attribute 2: reports kept
+        self._returns = {} # (assets, first day, last day) -> (coverage, first day used, returns)
+        self._reports = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _coverage(self, assets):
+        return tuple(self._store.coverage(asset_class, symbol) for asset_class, symbol in assets)
+
+    def returns(self, assets, first_day, last_day):
+        # (first day used, returns) for (asset_class, symbol) pairs over [first_day, last_day].
+        # The window starts at the youngest asset's first bar, so every column is real history
+        # rather than a price carried back; returns has one row per day after that.
+        assets = tuple(assets)
+        key = (assets, first_day, last_day)
+        coverage = self._coverage(assets)
+        cached = self._returns.get(key)
+        if cached is not None and cached[0] == coverage:
+            return cached[1], cached[2]
+
+        start = first_day
+        for asset_class, symbol in assets:
+            bars = self._store.bars(asset_class, symbol)
+            if len(bars):
+                start = max(start, int(bars['day'][0]))
+        days = np.arange(start, last_day + 1, dtype=np.int64)
+        closes = self._store.close_matrix(list(assets), days)
+        returns = closes[1:] / closes[:-1] - 1 if len(days) > 1 else np.empty((0, len(assets)))
+        self._returns[key] = (coverage, start, returns)
+        if len(self._returns) > self._cache_size:
+            del self._returns[next(iter(self._returns))]
+        return start, returns
+
+    def report(self, portfolio, first_day, last_day, stock_prices=None, crypto_prices=None,
+               confidence=DEFAULT_CONFIDENCE, horizon=1, fx=None):
+        # RiskReport for a Portfolio's current holdings. Positions are valued at the given
+        # {symbol: price} mappings, or at their last stored close when none are given, and
+        # converted into fx.target with fx (project.fx_rates for live prices,
+        # project.history_fx_rates for stored closes). Returns are taken in each
+        # asset's own currency.
+        if not 0 < confidence < 1:
+            raise ValueError("confidence must be between 0 and 1")
+        if horizon < 1:
+            raise ValueError("horizon must be at least 1 day")
+        symbols, asset_classes, quantity, _, _ = holdings_arrays(portfolio.stocks, portfolio.crypto)
+        assets = tuple(zip(asset_classes, symbols))
+        if stock_prices is None and crypto_prices is None:
+            price = self._store.close_matrix(list(assets), [last_day])[0] if assets else np.empty(0)
+        else:
+            price = price_vector(symbols, asset_classes,
+                                 {} if stock_prices is None else stock_prices,
+                                 {} if crypto_prices is None else crypto_prices)
+        currency = BASE_CURRENCY
+        if fx is not None:
+            price = price * fx.price_factors(symbols, asset_classes)
+            currency = fx.target
+
+        key = (assets, quantity.tobytes(), price.tobytes(), first_day, last_day, confidence, horizon,
+               self._coverage(assets), currency)
+        if key in self._reports:
+            self._reports.move_to_end(key)
+            self.hits += 1
+            return self._reports[key]
+        self.misses += 1
+
+        # Leave out what can't be valued or has no history at all
+        has_history = np.array([len(self._store.bars(asset_class, symbol)) > 0 for asset_class, symbol in assets],
+                               dtype=bool)
+        keep = ~np.isnan(price) & has_history
+        kept = [asset for asset, kept in zip(assets, keep) if kept]
+        _, returns = self.returns(kept, first_day, last_day)
+        report = RiskReport(
+            [symbol for _, symbol in kept], [asset_class for asset_class, _ in kept],
+            (quantity * price)[keep], returns, confidence, horizon,
+            [symbol for (_, symbol), kept in zip(assets, keep) if not kept],
+            currency
+        )
+
+        self._reports[key] = report
+        if len(self._reports) > self._cache_size:
+            self._reports.popitem(last=False)
+        return report
@@ -0,0 +1,312 @@
+import asyncio
+import json
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import project
+from batch import parse_trade
+from fetch_engine import FetchResult
+from valuation import value_portfolio, value_portfolios
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+# Largest request body accepted (trades are tiny)
+MAX_BODY = 64 * 1024
+# Seconds an idle keep-alive connection is kept open
+IDLE_TIMEOUT = 30.0
+
+STATUS_TEXT = {
+    200: "OK",
+    201: "Created",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    502: "Bad Gateway"
+}
+
+logger = logging.getLogger(__name__)
+
+########################################################################
+class HTTPError(Exception):
+    # Raised by a handler to answer with an error status and {"error": message}.
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+########################################################################
+# Shares upstream price fetches between concurrent requests. Every
+# (provider, symbol) being fetched maps to the fetch in flight for it; a
+# request waits on the fetches already covering its symbols and starts one
+# fetch for the rest, so a burst of requests for the same portfolio makes
+# a single upstream call. Once a fetch finishes, later requests are served
+# from the shared price cache as usual.
+class PriceCoalescer:
+    def __init__(self, fetch=None):
+        self._fetch = fetch or (lambda wanted: project.fetch_engine.fetch(wanted)) # Attribute 1: {provider: [symbols]} -> FetchResult
+        self._in_flight = {} # Attribute 2: (provider, symbol) -> future of the fetch covering it
+        self.fetches = 0 # Upstream fetches started
+
+    async def fetch(self, wanted):
+        # FetchResult for {provider: [symbols]}, joining fetches already in flight.
+        loop = asyncio.get_running_loop()
+        waiting = set()
+        new = {}
+        for provider, symbols in wanted.items():
+            for symbol in symbols:
+                future = self._in_flight.get((provider, symbol))
+                if future is None:
+                    new.setdefault(provider, []).append(symbol)
+                else:
+                    waiting.add(future)
+
+        if new:
+            future = loop.run_in_executor(None, self._fetch, new)
+            self.fetches += 1
+            keys = [(provider, symbol) for provider, symbols in new.items() for symbol in symbols]
+            for key in keys:
+                self._in_flight[key] = future
+            future.add_done_callback(lambda done: self._finished(keys, done))
+            waiting.add(future)
+
+        results = await asyncio.gather(*waiting)
+        return merge_results(wanted, results)
+
+    def _finished(self, keys, future):
+        for key in keys:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+def merge_results(wanted, results):
+    # One FetchResult holding just the wanted symbols, from several (possibly wider) results.
+    merged = FetchResult()
+    for provider, symbols in wanted.items():
+        prices, errors = {}, {}
+        for symbol in symbols:
+            for result in results:
+                if symbol in result.get(provider):
+                    prices[symbol] = result.get(provider)[symbol]
+                    break
+            else:
+                errors[symbol] = next((result.failed(provider)[symbol] for result in results
+                                       if symbol in result.failed(provider)), "no price returned")
+        merged.prices[provider] = prices
+        merged.errors[provider] = errors
+    return merged
+
+########################################################################
+# JSON API over the portfolios, for dashboards and other services:
+#   GET  /portfolios                  names of every portfolio
+#   GET  /portfolios/<name>           one portfolio valued ({"currency", "assets", totals})
+#   GET  /value                       every portfolio valued, {name: valuation}
+#   GET  /value?summary=1             combined totals and exposures
+#   POST /portfolios/<name>/trades    {"asset_class", "symbol", "side", "quantity", "price"}
+# Valuation endpoints take ?currency=EUR. Prices are fetched off the event
+# loop through the PriceCoalescer. Everything that reads or changes the
+# holdings runs on one worker thread, so trades are applied (and written to
+# the store) one at a time and never while a valuation is reading them.
+class PortfolioServer:
+    def __init__(self, portfolios, coalescer=None):
+        self._portfolios = portfolios # Attribute 1: {name: Portfolio}, e.g. from load_portfolios()
+        self._coalescer = coalescer or PriceCoalescer() # Attribute 2: shared price fetching
+        self._portfolio_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="portfolios")
+        self._server = None
+        self.requests = 0
+
+    @property
+    def coalescer(self):
+        return self._coalescer
+
+    @property
+    def port(self):
+        return self._server.sockets[0].getsockname()[1]
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        return self._server
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        self._portfolio_thread.shutdown(wait=True)
+
+    async def _on_portfolio_thread(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._portfolio_thread, function, *args)
+
+    #########################################################################
+    # HTTP/1.1 with keep-alive; just enough for JSON clients
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line.strip():
+                    break
+                keep_alive = await self._handle_request(request_line, reader, writer)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle_request(self, request_line, reader, writer):
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        keep_alive = headers.get('connection', '').lower() != 'close'
+        try:
+            parts = request_line.decode('latin-1').split()
+            if len(parts) != 3:
+                raise HTTPError(400, "malformed request line")
+            method, target, version = parts
+            if version == 'HTTP/1.0':
+                keep_alive = headers.get('connection', '').lower() == 'keep-alive'
+
+            try:
+                length = int(headers.get('content-length') or 0)
+            except ValueError:
+                length = -1
+            if length < 0:
+                # The body can't be skipped, so the rest of the connection can't be parsed
+                keep_alive = False
+                raise HTTPError(400, "invalid Content-Length")
+            if length > MAX_BODY:
+                keep_alive = False
+                raise HTTPError(413, "request body too large")
+            body = await reader.readexactly(length) if length else b''
+
+            self.requests += 1
+            status, payload = await self.dispatch(method, target, body)
+        except HTTPError as error:
+            status, payload = error.status, {'error': str(error)}
+        except ValueError as error:
+            status, payload = 400, {'error': str(error)}
+        except Exception:
+            logger.exception("Request failed: %r", request_line)
+            status, payload = 500, {'error': "internal error"}
+
+        data = json.dumps(payload).encode()
+        writer.write(
+            f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + data
+        )
+        return keep_alive
+
+    #########################################################################
+    async def dispatch(self, method, target, body=b''):
+        # Route one request; returns (status, JSON-serialisable payload).
+        url = urlsplit(target)
+        path = [unquote(part) for part in url.path.strip('/').split('/') if part]
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        currency = query['currency'].upper() if query.get('currency') else None
+
+        if path == ['portfolios']:
+            self._allow(method, 'GET')
+            return 200, {'portfolios': list(self._portfolios)}
+        if path == ['value']:
+            self._allow(method, 'GET')
+            return 200, await self.value_all(currency, query.get('summary') in ('1', 'true'))
+        if len(path) == 2 and path[0] == 'portfolios':
+            self._allow(method, 'GET')
+            return 200, await self.value_one(path[1], currency)
+        if len(path) == 3 and path[0] == 'portfolios' and path[2] == 'trades':
+            self._allow(method, 'POST')
+            try:
+                trade = json.loads(body or b'{}')
+            except ValueError:
+                raise HTTPError(400, "body must be JSON")
+            if not isinstance(trade, dict):
+                raise HTTPError(400, "body must be a JSON object")
+            return 201, await self.trade(path[1], trade)
+        raise HTTPError(404, f"no route for {url.path}")
+
+    def _allow(self, method, allowed):
+        if method != allowed:
+            raise HTTPError(405, f"use {allowed}")
+
+    def _portfolio(self, name):
+        if name not in self._portfolios:
+            raise HTTPError(404, f"portfolio '{name}' does not exist")
+        return self._portfolios[name]
+
+    async def _prices(self, wanted, currency):
+        result = await self._coalescer.fetch(wanted)
+        try:
+            return result, project.fx_rates(result, currency)
+        except ValueError as error:
+            raise HTTPError(502, str(error))
+
+    async def value_one(self, name, currency=None):
+        portfolio = await self._on_portfolio_thread(self._portfolio, name)
+        wanted = await self._on_portfolio_thread(project.price_requests, portfolio, None, currency)
+        result, fx = await self._prices(wanted, currency)
+        valuation = await self._on_portfolio_thread(
+            value_portfolio, portfolio, result.get('stock'), result.get('crypto'), fx)
+        return valuation.to_dict()
+
+    async def value_all(self, currency=None, summary=False):
+        def snapshot():
+            portfolios = dict(self._portfolios.items())
+            return portfolios, project.price_requests(portfolios, None, currency)
+
+        portfolios, wanted = await self._on_portfolio_thread(snapshot)
+        result, fx = await self._prices(wanted, currency)
+
+        def value():
+            if summary:
+                return value_portfolios(portfolios, result.get('stock'), result.get('crypto'), fx).to_dict()
+            return {name: value_portfolio(portfolio, result.get('stock'), result.get('crypto'), fx).to_dict()
+                    for name, portfolio in portfolios.items()}
+        return await self._on_portfolio_thread(value)
+
+    async def trade(self, name, body):
+        # Apply one buy or sell through add_stock/sell_stock/add_crypto/sell_crypto.
+        trade = parse_trade({**body, 'portfolio': name})
+
+        def apply():
+            portfolio = self._portfolio(name)
+            quantity, price, symbol = trade['quantity'], trade['price'], trade['symbol']
+            if trade['asset_class'] == 'stocks':
+                if quantity > 0:
+                    return project.add_stock(portfolio, symbol, quantity, price, confirmation='y')
+                return project.sell_stock(portfolio, symbol, -quantity, price)
+            if quantity > 0:
+                return project.add_crypto(portfolio, symbol, quantity, price, confirmation='y')
+            return project.sell_crypto(portfolio, symbol, -quantity, price)
+
+        message = (await self._on_portfolio_thread(apply)).strip()
+        if message.startswith("Error:"):
+            raise HTTPError(400, message[len("Error:"):].strip())
+        return {'message': message, 'portfolio': name}
+
+########################################################################
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, portfolios=None):
+    # Run the API until Ctrl+C.
+    async def main():
+        server = PortfolioServer(portfolios if portfolios is not None else project.load_portfolios())
+        await server.start(host, port)
+        print(f"Serving portfolios on http://{host}:{server.port} (Ctrl+C to stop)", file=sys.stderr)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await server.close()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
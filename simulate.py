@@ -0,0 +1,209 @@
+import numpy as np
+
+from fx import BASE_CURRENCY
+from valuation import convert_holdings, holdings_arrays, price_vector, value_holdings
+
+########################################################################
+# What-if trades on a frozen copy of a portfolio. A Snapshot holds the
+# holdings as arrays plus the prices they are valued at; applying trades
+# returns a new Snapshot with freshly computed quantity, buy price and
+# realised PnL arrays (only the symbols, asset classes and prices are
+# shared), so neither the live Portfolio nor the starting Snapshot is
+# touched. with_assets copies every array. Trades follow the same
+# average-cost rules as apply_buy/apply_sell: buys re-average the buy
+# price, sells book (price - buy price) * quantity as realised PnL.
+class Snapshot:
+    def __init__(self, symbols, asset_classes, quantity, buy_price, realised_pnl, price, currency=BASE_CURRENCY):
+        self.symbols = symbols # Attribute 1: list of symbols (shared between snapshots)
+        self.asset_classes = asset_classes # Attribute 2: list of 'stock' / 'crypto'
+        self.quantity = quantity
+        self.buy_price = buy_price
+        self.realised_pnl = realised_pnl
+        self.price = price # Fixed prices every scenario is valued and traded at
+        self.currency = currency
+        self._index = None # (asset_class, symbol) -> position, built on first lookup
+
+    @classmethod
+    def from_portfolio(cls, portfolio, stock_prices, crypto_prices, fx=None):
+        # Copy a Portfolio's holdings; with fx (an FXRates) amounts are in fx.target.
+        symbols, asset_classes, quantity, buy_price, realised_pnl = holdings_arrays(portfolio.stocks, portfolio.crypto)
+        price = price_vector(symbols, asset_classes, stock_prices, crypto_prices)
+        buy_price, realised_pnl, price = convert_holdings(fx, symbols, asset_classes, buy_price, realised_pnl, price)
+        return cls(symbols, asset_classes, quantity, buy_price, realised_pnl, price,
+                   BASE_CURRENCY if fx is None else fx.target)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def index(self, asset_class, symbol):
+        # Position of a holding, or None if the snapshot doesn't have it.
+        if self._index is None:
+            self._index = {key: position for position, key in enumerate(zip(self.asset_classes, self.symbols))}
+        return self._index.get((asset_class, symbol))
+
+    def with_assets(self, assets):
+        # Snapshot that also has zero holdings of the given (asset_class, symbol, price)
+        # entries, so trades and target weights can buy into new assets.
+        new = [(asset_class, symbol, price) for asset_class, symbol, price in assets
+               if self.index(asset_class, symbol) is None]
+        if not new:
+            return self
+        count = len(new)
+        return Snapshot(
+            self.symbols + [symbol for _, symbol, _ in new],
+            self.asset_classes + [asset_class for asset_class, _, _ in new],
+            np.concatenate([self.quantity, np.zeros(count)]),
+            np.concatenate([self.buy_price, np.zeros(count)]),
+            np.concatenate([self.realised_pnl, np.zeros(count)]),
+            np.concatenate([self.price, np.array([price for _, _, price in new], dtype=np.float64)]),
+            self.currency
+        )
+
+    def trade_vector(self, trades):
+        # Quantity change per holding from [(asset_class, symbol, quantity)] (negative sells).
+        delta = np.zeros(len(self))
+        for asset_class, symbol, quantity in trades:
+            position = self.index(asset_class, symbol)
+            if position is None:
+                raise ValueError(f"'{symbol}' is not in the snapshot; add it with with_assets first.")
+            delta[position] += quantity
+        return delta
+
+    def apply(self, trades):
+        # New Snapshot after [(asset_class, symbol, quantity)] at the snapshot prices.
+        results = simulate(self, self.trade_vector(trades)[np.newaxis, :])
+        if not results.valid[0]:
+            raise ValueError("A sell is larger than the holding.")
+        return results.snapshot(0)
+
+    def valuation(self):
+        return value_holdings(self.symbols, self.asset_classes, self.quantity, self.buy_price,
+                              self.realised_pnl, self.price, self.currency)
+
+########################################################################
+# Outcome of many scenarios applied to one Snapshot; row i is scenario i.
+class ScenarioResults:
+    def __init__(self, base, delta, quantity, buy_price, realised_pnl, valid):
+        self.base = base # Attribute 1: Snapshot the scenarios start from
+        self.delta = delta # Attribute 2: (scenarios, holdings) quantity traded
+        self.quantity = quantity # Holdings after each scenario
+        self.buy_price = buy_price
+        self.realised_pnl = realised_pnl
+        self.valid = valid # False where a scenario sells more than is held
+
+        price = base.price
+        self.market_value = quantity * price
+        self.total_value = np.nansum(self.market_value, axis=1)
+        self.unrealised_pnl = np.nansum(self.market_value - quantity * buy_price, axis=1)
+        self.total_realised_pnl = realised_pnl.sum(axis=1)
+        # Realised PnL booked by the scenario's own sells
+        self.trade_realised_pnl = self.total_realised_pnl - base.realised_pnl.sum()
+        # Cash the trades take (buys) or free up (sells) at the snapshot prices
+        self.cash = -np.nansum(delta * price, axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.weights = np.nan_to_num(self.market_value) / self.total_value[:, np.newaxis]
+
+    def __len__(self):
+        return len(self.delta)
+
+    def snapshot(self, scenario):
+        return Snapshot(self.base.symbols, self.base.asset_classes, self.quantity[scenario],
+                        self.buy_price[scenario], self.realised_pnl[scenario], self.base.price, self.base.currency)
+
+    def trades(self, scenario):
+        # [(asset_class, symbol, quantity, price)] traded by one scenario, sells first.
+        trades = [
+            (self.base.asset_classes[index], self.base.symbols[index], float(self.delta[scenario, index]),
+             float(self.base.price[index]))
+            for index in np.flatnonzero(self.delta[scenario])
+        ]
+        return sorted(trades, key=lambda trade: trade[2] > 0)
+
+    def to_dict(self, scenario):
+        return {
+            'currency': self.base.currency,
+            'trades': [
+                {'asset_class': asset_class, 'symbol': symbol, 'quantity': quantity, 'price': price}
+                for asset_class, symbol, quantity, price in self.trades(scenario)
+            ],
+            'valid': bool(self.valid[scenario]),
+            'total_value': float(self.total_value[scenario]),
+            'cash': float(self.cash[scenario]),
+            'unrealised_pnl': float(self.unrealised_pnl[scenario]),
+            'realised_pnl': float(self.total_realised_pnl[scenario]),
+            'trade_realised_pnl': float(self.trade_realised_pnl[scenario]),
+            'weights': {symbol: float(weight) for symbol, weight in zip(self.base.symbols, self.weights[scenario])}
+        }
+
+def simulate(snapshot, delta):
+    # Apply a (scenarios, holdings) matrix of quantity changes to one Snapshot at its
+    # prices, every scenario at once. Buys and sells of the same holding net out first.
+    delta = np.atleast_2d(np.asarray(delta, dtype=np.float64))
+    if delta.shape[1] != len(snapshot):
+        raise ValueError(f"Expected {len(snapshot)} columns of trades, got {delta.shape[1]}.")
+    quantity, buy_price, price = snapshot.quantity, snapshot.buy_price, snapshot.price
+
+    new_quantity = quantity + delta
+    # Tolerate float noise from weight arithmetic when a holding is sold down to zero
+    tolerance = 1e-9 * np.maximum(np.abs(quantity), 1.0)
+    valid = (new_quantity >= -tolerance).all(axis=1)
+    new_quantity = np.where(np.abs(new_quantity) <= tolerance, 0.0, new_quantity)
+
+    buys = delta > 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        averaged = (quantity * buy_price + delta * price) / new_quantity
+    new_buy_price = np.where(buys, averaged, buy_price)
+    new_buy_price = np.where(buys & (quantity == 0), price, new_buy_price)
+    sold = np.where(delta < 0, -delta, 0.0)
+    # Only sells book PnL; an unpriced holding that isn't sold keeps its realised PnL
+    new_realised = snapshot.realised_pnl + np.where(sold > 0, (price - buy_price) * sold, 0.0)
+    return ScenarioResults(snapshot, delta, new_quantity, new_buy_price, new_realised, valid)
+
+########################################################################
+# Rebalancing to target weights at the snapshot prices
+def target_deltas(snapshot, weights, total=None):
+    # Quantity changes taking each holding to weights * total, row by row for a
+    # (scenarios, holdings) weight matrix. total defaults to the current value, so
+    # the trades pay for themselves.
+    weights = np.atleast_2d(np.asarray(weights, dtype=np.float64))
+    if weights.shape[1] != len(snapshot):
+        raise ValueError(f"Expected {len(snapshot)} weights per target, got {weights.shape[1]}.")
+    if (weights < 0).any():
+        raise ValueError("Target weights can't be negative.")
+    priced = ~np.isnan(snapshot.price)
+    if (weights[:, ~priced] > 0).any():
+        raise ValueError("Can't target a weight in a holding without a price.")
+    if total is None:
+        total = float(np.nansum(snapshot.quantity * snapshot.price))
+    target_value = weights * total
+    with np.errstate(divide='ignore', invalid='ignore'):
+        target_quantity = np.where(priced, target_value / snapshot.price, snapshot.quantity)
+    return target_quantity - snapshot.quantity
+
+def weight_matrix(snapshot, targets):
+    # Rows of weights aligned with the snapshot from [{(asset_class, symbol): weight}],
+    # normalised to sum to 1. Holdings missing from a target are sold; targets must be
+    # in the snapshot. Keyed by asset class too, as a stock and a crypto can share a ticker.
+    matrix = np.zeros((len(targets), len(snapshot)))
+    for row, target in enumerate(targets):
+        for (asset_class, symbol), weight in target.items():
+            position = snapshot.index(asset_class, symbol)
+            if position is None:
+                raise ValueError(f"'{symbol}' is not in the snapshot; add it with with_assets first.")
+            matrix[row, position] = weight
+        total = matrix[row].sum()
+        if total <= 0:
+            raise ValueError("Target weights must add up to more than 0.")
+        matrix[row] /= total
+    return matrix
+
+def rebalance(snapshot, targets, total=None):
+    # ScenarioResults for one or many targets ({(asset_class, symbol): weight} or weight vectors):
+    # the trades to reach each allocation, and the PnL and weights after them.
+    if isinstance(targets, dict):
+        targets = [targets]
+    if len(targets) and isinstance(targets[0], dict):
+        weights = weight_matrix(snapshot, targets)
+    else:
+        weights = np.atleast_2d(np.asarray(targets, dtype=np.float64))
+    return simulate(snapshot, target_deltas(snapshot, weights, total))
@@ -0,0 +1,315 @@
+import json
+import os
+import sqlite3
+import threading
+
+# Name of the quantity field for each asset class, as used by Portfolio
+QUANTITY_FIELDS = {'stocks': 'shares', 'crypto': 'amount'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS portfolios (
+    name TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS holdings (
+    portfolio TEXT NOT NULL REFERENCES portfolios(name) ON UPDATE CASCADE ON DELETE CASCADE,
+    asset_class TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    quantity REAL NOT NULL,
+    buy_price REAL NOT NULL,
+    realised_pnl REAL,
+    PRIMARY KEY (portfolio, asset_class, symbol)
+);
+CREATE TABLE IF NOT EXISTS trades (
+    id INTEGER PRIMARY KEY,
+    portfolio TEXT NOT NULL REFERENCES portfolios(name) ON UPDATE CASCADE ON DELETE CASCADE,
+    asset_class TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    quantity REAL NOT NULL,
+    price REAL NOT NULL,
+    timestamp REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS trades_by_portfolio ON trades (portfolio, asset_class, id);
+CREATE TABLE IF NOT EXISTS alerts (
+    id INTEGER PRIMARY KEY,
+    portfolio TEXT NOT NULL REFERENCES portfolios(name) ON UPDATE CASCADE ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    asset_class TEXT,
+    symbol TEXT,
+    direction TEXT NOT NULL,
+    threshold REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS alerts_by_portfolio ON alerts (portfolio);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+########################################################################
+# SQLite (WAL mode) store for portfolios. Every mutation is written as
+# its own small transaction, so a crash loses at most the change in flight
+# and a write only touches the rows that changed.
+class PortfolioStore:
+    def __init__(self, path):
+        self._path = path # Attribute 1: database file
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("PRAGMA foreign_keys=ON")
+        self._connection.executescript(SCHEMA)
+        self._lock = threading.RLock() # Serialises writers sharing this connection
+
+    @property
+    def path(self):
+        return self._path
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    #########################################################################
+    def _transaction(self, statements):
+        # Run (sql, params) pairs atomically; returns the number of rows they changed.
+        changed = 0
+        with self._lock:
+            cursor = self._connection.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, params in statements:
+                    cursor.execute(sql, params)
+                    changed += max(cursor.rowcount, 0)
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+            cursor.execute("COMMIT")
+        return changed
+
+    @staticmethod
+    def _upsert(portfolio_name, asset_class, symbol, data):
+        return (
+            "INSERT INTO holdings (portfolio, asset_class, symbol, quantity, buy_price, realised_pnl) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (portfolio, asset_class, symbol) DO UPDATE SET "
+            "quantity = excluded.quantity, buy_price = excluded.buy_price, realised_pnl = excluded.realised_pnl",
+            (portfolio_name, asset_class, symbol, data[QUANTITY_FIELDS[asset_class]],
+             data['buy_price'], data.get('realised_pnl'))
+        )
+
+    #########################################################################
+    # Incremental writes
+    def create_portfolio(self, name):
+        self._transaction([("INSERT OR IGNORE INTO portfolios (name) VALUES (?)", (name,))])
+
+    def rename_portfolio(self, old_name, new_name):
+        self._transaction([("UPDATE portfolios SET name = ? WHERE name = ?", (new_name, old_name))])
+
+    def delete_portfolio(self, name):
+        self._transaction([("DELETE FROM portfolios WHERE name = ?", (name,))])
+
+    def save_holding(self, portfolio_name, asset_class, symbol, data):
+        # Write one holding; data of None means the holding was sold off and is removed.
+        if data is None:
+            self._transaction([(
+                "DELETE FROM holdings WHERE portfolio = ? AND asset_class = ? AND symbol = ?",
+                (portfolio_name, asset_class, symbol)
+            )])
+        else:
+            self._transaction([
+                ("INSERT OR IGNORE INTO portfolios (name) VALUES (?)", (portfolio_name,)),
+                self._upsert(portfolio_name, asset_class, symbol, data)
+            ])
+
+    def append_trade(self, portfolio_name, asset_class, symbol, quantity, price, timestamp):
+        # Append one fill to the trade ledger (quantity is negative for sells).
+        self._transaction([
+            ("INSERT OR IGNORE INTO portfolios (name) VALUES (?)", (portfolio_name,)),
+            ("INSERT INTO trades (portfolio, asset_class, symbol, quantity, price, timestamp) "
+             "VALUES (?, ?, ?, ?, ?, ?)", (portfolio_name, asset_class, symbol, quantity, price, timestamp))
+        ])
+
+    def save_holding_and_trade(self, portfolio_name, asset_class, symbol, data, quantity, price, timestamp):
+        # Save a changed holding together with the fill that changed it, atomically.
+        if data is None:
+            holding = ("DELETE FROM holdings WHERE portfolio = ? AND asset_class = ? AND symbol = ?",
+                       (portfolio_name, asset_class, symbol))
+        else:
+            holding = self._upsert(portfolio_name, asset_class, symbol, data)
+        self._transaction([
+            ("INSERT OR IGNORE INTO portfolios (name) VALUES (?)", (portfolio_name,)),
+            holding,
+            ("INSERT INTO trades (portfolio, asset_class, symbol, quantity, price, timestamp) "
+             "VALUES (?, ?, ?, ?, ?, ?)", (portfolio_name, asset_class, symbol, quantity, price, timestamp))
+        ])
+
+    def apply_batch(self, holdings, trades):
+        # Save many changes in one transaction.
+        # holdings: (portfolio, asset_class, symbol, data or None); trades: (portfolio, asset_class,
+        # symbol, quantity, price, timestamp).
+        statements = []
+        names = {change[0] for change in holdings} | {trade[0] for trade in trades}
+        for name in names:
+            statements.append(("INSERT OR IGNORE INTO portfolios (name) VALUES (?)", (name,)))
+        for portfolio_name, asset_class, symbol, data in holdings:
+            if data is None:
+                statements.append(("DELETE FROM holdings WHERE portfolio = ? AND asset_class = ? AND symbol = ?",
+                                   (portfolio_name, asset_class, symbol)))
+            else:
+                statements.append(self._upsert(portfolio_name, asset_class, symbol, data))
+        for trade in trades:
+            statements.append(("INSERT INTO trades (portfolio, asset_class, symbol, quantity, price, timestamp) "
+                               "VALUES (?, ?, ?, ?, ?, ?)", tuple(trade)))
+        self._transaction(statements)
+
+    def save_all(self, portfolios_data):
+        # Replace all holdings with {name: {'stocks': {...}, 'crypto': {...}}} in one transaction.
+        # Portfolios that are kept also keep their trade history.
+        self._transaction(self._save_all_statements(portfolios_data))
+
+    def _save_all_statements(self, portfolios_data):
+        statements = [("DELETE FROM holdings", ())]
+        for name in self.portfolio_names():
+            if name not in portfolios_data:
+                statements.append(("DELETE FROM portfolios WHERE name = ?", (name,)))
+        for name, data in portfolios_data.items():
+            statements.append(("INSERT OR IGNORE INTO portfolios (name) VALUES (?)", (name,)))
+            for asset_class in QUANTITY_FIELDS:
+                for symbol, holding in data.get(asset_class, {}).items():
+                    statements.append(self._upsert(name, asset_class, symbol, holding))
+        return statements
+
+    #########################################################################
+    # Reads
+    def portfolio_names(self):
+        with self._lock:
+            rows = self._connection.execute("SELECT name FROM portfolios ORDER BY rowid").fetchall()
+        return [name for (name,) in rows]
+
+    def load_portfolio(self, name):
+        # Holdings of one portfolio as {'stocks': {...}, 'crypto': {...}}.
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT asset_class, symbol, quantity, buy_price, realised_pnl "
+                "FROM holdings WHERE portfolio = ? ORDER BY rowid", (name,)
+            ).fetchall()
+
+        data = {'stocks': {}, 'crypto': {}}
+        for asset_class, symbol, quantity, buy_price, realised_pnl in rows:
+            holding = {QUANTITY_FIELDS[asset_class]: quantity, 'buy_price': buy_price}
+            if realised_pnl is not None:
+                holding['realised_pnl'] = realised_pnl
+            data[asset_class][symbol] = holding
+        return data
+
+    def load(self):
+        return {name: self.load_portfolio(name) for name in self.portfolio_names()}
+
+    def iter_portfolios(self, chunk_size=10000):
+        # Stream (name, {'stocks': {...}, 'crypto': {...}}) for every portfolio with holdings,
+        # reading the rows in chunks instead of all at once.
+        with self._lock:
+            cursor = self._connection.execute(
+                "SELECT portfolio, asset_class, symbol, quantity, buy_price, realised_pnl "
+                "FROM holdings ORDER BY portfolio, rowid"
+            )
+        name, data = None, None
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for portfolio, asset_class, symbol, quantity, buy_price, realised_pnl in rows:
+                if portfolio != name:
+                    if name is not None:
+                        yield name, data
+                    name, data = portfolio, {'stocks': {}, 'crypto': {}}
+                holding = {QUANTITY_FIELDS[asset_class]: quantity, 'buy_price': buy_price}
+                if realised_pnl is not None:
+                    holding['realised_pnl'] = realised_pnl
+                data[asset_class][symbol] = holding
+        if name is not None:
+            yield name, data
+
+    def iter_trades(self, portfolio_name, asset_class):
+        # Yield (symbol, quantity, price, timestamp) for one portfolio in trade order.
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT symbol, quantity, price, timestamp FROM trades "
+                "WHERE portfolio = ? AND asset_class = ? ORDER BY id", (portfolio_name, asset_class)
+            ).fetchall()
+        yield from rows
+
+    #########################################################################
+    # Alert rules (see alerts.py)
+    def add_alerts(self, rules):
+        # Insert (portfolio, kind, asset_class, symbol, direction, threshold) tuples in one
+        # transaction; returns their ids. Every portfolio must already exist.
+        with self._lock:
+            cursor = self._connection.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            ids = []
+            try:
+                for portfolio_name, kind, asset_class, symbol, direction, threshold in rules:
+                    if cursor.execute("SELECT 1 FROM portfolios WHERE name = ?", (portfolio_name,)).fetchone() is None:
+                        raise ValueError(f"Portfolio '{portfolio_name}' does not exist.")
+                    cursor.execute(
+                        "INSERT INTO alerts (portfolio, kind, asset_class, symbol, direction, threshold) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (portfolio_name, kind, asset_class, symbol, direction, threshold))
+                    ids.append(cursor.lastrowid)
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+            cursor.execute("COMMIT")
+        return ids
+
+    def delete_alert(self, alert_id):
+        # True if the alert existed and was deleted.
+        return self._transaction([("DELETE FROM alerts WHERE id = ?", (alert_id,))]) > 0
+
+    def iter_alerts(self, portfolio_name=None):
+        # Yield (id, portfolio, kind, asset_class, symbol, direction, threshold), optionally for one portfolio.
+        sql = "SELECT id, portfolio, kind, asset_class, symbol, direction, threshold FROM alerts"
+        params = ()
+        if portfolio_name is not None:
+            sql += " WHERE portfolio = ?"
+            params = (portfolio_name,)
+        with self._lock:
+            rows = self._connection.execute(sql + " ORDER BY id", params).fetchall()
+        yield from rows
+
+    #########################################################################
+    # One-time migration from the old portfolios.json file
+    def get_meta(self, key):
+        with self._lock:
+            row = self._connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        self._transaction([("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))])
+
+    def migrate_json(self, json_path):
+        # Import json_path once; returns True if a migration happened.
+        if self.get_meta('migrated_from_json') or not os.path.exists(json_path):
+            return False
+
+        with open(json_path, 'r') as file:
+            contents = file.read()
+        # An empty file just means no portfolios were ever saved
+        portfolios_data = json.loads(contents) if contents.strip() else {}
+        statements = self._save_all_statements(portfolios_data)
+
+        # The JSON file has no trade history, so each holding starts the ledger as one opening buy
+        timestamp = os.path.getmtime(json_path)
+        for name, data in portfolios_data.items():
+            for asset_class, quantity_field in QUANTITY_FIELDS.items():
+                for symbol, holding in data.get(asset_class, {}).items():
+                    statements.append((
+                        "INSERT INTO trades (portfolio, asset_class, symbol, quantity, price, timestamp) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (name, asset_class, symbol, holding[quantity_field], holding['buy_price'], timestamp)))
+        # Holdings, opening trades and the flag go in together, so a crash part way
+        # leaves nothing behind and the next start simply migrates again
+        statements.append(("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                           ('migrated_from_json', os.path.abspath(json_path))))
+        self._transaction(statements)
+        return True
@@ -0,0 +1,164 @@
+import bisect
+import json
+import os
+import time
+
+# How long a verified symbol is trusted before validation goes back to the network
+DEFAULT_MAX_AGE = 30 * 24 * 60 * 60
+
+# Public NASDAQ Trader symbol directory (pipe-delimited, updated daily)
+NASDAQ_LISTED_URL = "https://www.nasdaqtrader.com/dynamic/SymDir/nasdaqlisted.txt"
+OTHER_LISTED_URL = "https://www.nasdaqtrader.com/dynamic/SymDir/otherlisted.txt"
+# Exchange codes used in otherlisted.txt
+OTHER_EXCHANGES = {'A': "NYSE American", 'N': "NYSE", 'P': "NYSE Arca", 'Z': "Cboe BZX", 'V': "IEX"}
+
+########################################################################
+# Local index of known symbols: name, asset class, exchange and when it was
+# last verified. Kept on disk as JSON and searched by prefix with bisect
+# over a sorted key list per asset class.
+class SymbolIndex:
+    def __init__(self, path=None, max_age=DEFAULT_MAX_AGE, clock=time.time):
+        self._path = path # Attribute 1: JSON file (optional)
+        self._max_age = max_age # Attribute 2: seconds before an entry is stale
+        self._clock = clock
+        self._entries = {} # asset_class -> {symbol: {'name', 'exchange', 'verified_at'}}
+        self._sorted = {} # asset_class -> sorted symbols, rebuilt lazily after changes
+        self._loaded = path is None
+        self._dirty = False
+
+    @property
+    def path(self):
+        return self._path
+
+    def __len__(self):
+        self._ensure_loaded()
+        return sum(len(entries) for entries in self._entries.values())
+
+    #########################################################################
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        if self._path and os.path.exists(self._path):
+            try:
+                with open(self._path, 'r') as file:
+                    self._entries = json.load(file)
+            except (OSError, ValueError): # A corrupt index is rebuilt from the network
+                self._entries = {}
+        self._sorted = {}
+
+    def save(self, path=None):
+        # Write the index atomically; does nothing if unchanged.
+        path = path or self._path
+        self._ensure_loaded()
+        if not path or (not self._dirty and path == self._path and os.path.exists(path)):
+            return
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w') as file:
+            json.dump(self._entries, file, separators=(',', ':'))
+        os.replace(temp_path, path)
+        self._dirty = False
+
+    #########################################################################
+    def add(self, asset_class, symbol, name, exchange=None, verified_at=None):
+        self._ensure_loaded()
+        entries = self._entries.setdefault(asset_class, {})
+        if symbol not in entries:
+            self._sorted.pop(asset_class, None)
+        entries[symbol] = {
+            'name': name,
+            'exchange': exchange,
+            'verified_at': self._clock() if verified_at is None else verified_at
+        }
+        self._dirty = True
+
+    def add_many(self, asset_class, listings, verified_at=None):
+        # Add (symbol, name, exchange) tuples from a bulk listing.
+        verified_at = self._clock() if verified_at is None else verified_at
+        count = 0
+        for symbol, name, exchange in listings:
+            self.add(asset_class, symbol, name, exchange, verified_at)
+            count += 1
+        return count
+
+    def get(self, asset_class, symbol):
+        # Entry for a symbol, fresh or not.
+        self._ensure_loaded()
+        entry = self._entries.get(asset_class, {}).get(symbol)
+        if entry is None:
+            return None
+        return {'symbol': symbol, 'asset_class': asset_class, **entry}
+
+    def lookup(self, asset_class, symbol):
+        # Entry for a symbol only if it was verified within max_age, else None.
+        entry = self.get(asset_class, symbol)
+        if entry is None or self._clock() - entry['verified_at'] > self._max_age:
+            return None
+        return entry
+
+    def prefix(self, asset_class, prefix, limit=20):
+        # Symbols starting with prefix, in sorted order.
+        self._ensure_loaded()
+        symbols = self._sorted.get(asset_class)
+        if symbols is None:
+            symbols = sorted(self._entries.get(asset_class, {}))
+            self._sorted[asset_class] = symbols
+
+        prefix = prefix.upper()
+        results = []
+        index = bisect.bisect_left(symbols, prefix)
+        while index < len(symbols) and symbols[index].startswith(prefix) and len(results) < limit:
+            results.append(self.get(asset_class, symbols[index]))
+            index += 1
+        return results
+
+########################################################################
+# Bulk listings
+def fetch_crypto_listings(client, page_size=5000):
+    # Every active coin from CMC /map as (symbol, name, platform/exchange); about 1 credit per page.
+    # Several coins can share a symbol; pages are sorted by rank, so the best-ranked one wins.
+    seen = set()
+    start = 1
+    while True:
+        page = client.cryptocurrency_map(start=start, limit=page_size)
+        for coin in page:
+            symbol = coin['symbol'].upper()
+            if symbol in seen:
+                continue
+            seen.add(symbol)
+            platform = coin.get('platform') or {}
+            yield symbol, coin['name'], platform.get('name')
+        if len(page) < page_size:
+            return
+        start += page_size
+
+def parse_nasdaq_directory(text, exchange_column=None):
+    # Parse a NASDAQ Trader pipe-delimited symbol file into (symbol, name, exchange).
+    lines = text.splitlines()
+    header = lines[0].split('|')
+    symbol_column = header.index('ACT Symbol') if 'ACT Symbol' in header else header.index('Symbol')
+    name_column = header.index('Security Name')
+    exchange_index = header.index(exchange_column) if exchange_column else None
+
+    for line in lines[1:]:
+        fields = line.split('|')
+        # The last line is a "File Creation Time" footer
+        if len(fields) != len(header) or line.startswith('File Creation Time'):
+            continue
+        if 'Test Issue' in header and fields[header.index('Test Issue')] == 'Y':
+            continue
+        exchange = "NASDAQ" if exchange_index is None else OTHER_EXCHANGES.get(fields[exchange_index], fields[exchange_index])
+        # yfinance writes class shares with a dash (BRK-B) where NASDAQ uses a dot
+        yield fields[symbol_column].replace('.', '-'), fields[name_column], exchange
+
+def fetch_stock_listings(session=None, timeout=30):
+    # Every US-listed stock/ETF from the NASDAQ Trader symbol directory. Uses a plain
+    # session by default; don't pass one carrying API keys for other services.
+    if session is None:
+        import requests
+
+        session = requests.Session()
+    for url, exchange_column in ((NASDAQ_LISTED_URL, None), (OTHER_LISTED_URL, 'Exchange')):
+        response = session.get(url, timeout=timeout)
+        response.raise_for_status()
+        yield from parse_nasdaq_directory(response.text, exchange_column)
@@ -0,0 +1,138 @@
+import io
+
+import numpy as np
+import pytest
+
+from alerts import AlertEngine, AlertRule, ThresholdIndex
+from fx import FXRates
+from storage import PortfolioStore
+from test_watch import Holdings, make_fetch, make_portfolio
+from watch import PortfolioWatch
+
+def fired_ids(alerts):
+    return sorted(alert.rule.id for alert in alerts)
+
+def test_threshold_index_fires_on_crossing():
+    index = ThresholdIndex()
+    for rule_id, (direction, threshold) in enumerate([('above', 110), ('above', 120), ('above', 150),
+                                                      ('below', 90), ('below', 80)]):
+        index.add(AlertRule("Test", 'price', direction, threshold, 'stock', "AAPL", id=rule_id))
+
+    # The first value only fires rules that already hold
+    assert index.update(100.0) == []
+    assert index.update(120.0) == [0, 1]
+    # Staying above a threshold does not fire again
+    assert index.update(125.0) == []
+    assert sorted(index.update(79.0)) == [3, 4]
+    assert index.update(float('nan')) == []
+    assert index.update(200.0) == [0, 1, 2]
+
+def test_threshold_index_first_value():
+    index = ThresholdIndex()
+    index.add(AlertRule("Test", 'price', 'above', 100, 'stock', "AAPL", id=1))
+    index.add(AlertRule("Test", 'price', 'below', 300, 'stock', "AAPL", id=2))
+    assert index.update(200.0) == [1, 2]
+
+def test_engine_matches_brute_force():
+    rng = np.random.default_rng(0)
+    engine = AlertEngine()
+    for threshold, direction in zip(rng.uniform(50, 150, 5000), rng.choice(['above', 'below'], 5000)):
+        engine.add(AlertRule("Test", 'price', direction, threshold, 'stock', "AAPL"))
+
+    last = None
+    for price in rng.uniform(40, 160, 50):
+        expected = sorted(
+            rule.id for rule in engine.rules
+            if (rule.direction == 'above' and price >= rule.threshold and (last is None or last < rule.threshold))
+            or (rule.direction == 'below' and price <= rule.threshold and (last is None or last > rule.threshold))
+        )
+        assert fired_ids(engine.update_prices({"AAPL": price}, {})) == expected
+        last = price
+
+def test_engine_pnl_and_value_rules():
+    engine = AlertEngine([
+        AlertRule("Test", 'pnl_pct', 'above', 30, 'stock', "AAPL", id=1),
+        AlertRule("Test", 'value', 'below', 30000, id=2),
+        AlertRule("Other", 'price', 'above', 50000, 'crypto', "btc", id=3)
+    ])
+    portfolio = make_portfolio()
+    alerts = engine.evaluate({"Test": portfolio}, {"AAPL": 180.0, "MSFT": 300.0}, {"BTC": 60000.0})
+    assert fired_ids(alerts) == [3]
+
+    alerts = engine.evaluate({"Test": portfolio}, {"AAPL": 200.0, "MSFT": 300.0}, {"BTC": 50.0})
+    assert fired_ids(alerts) == [1, 2]
+    assert "AAPL unrealised PnL above 30.00 % (now 33.33 %)" in alerts[0].message
+
+    engine.remove(1)
+    assert len(engine) == 2
+    assert engine.price_symbols() == {'stock': [], 'crypto': ["BTC"]}
+
+def test_value_rule_waits_for_every_price():
+    engine = AlertEngine([AlertRule("Test", 'value', 'below', 50000, id=1)])
+    portfolio = make_portfolio()
+    # BTC failed to fetch: $700 of stocks is not the portfolio's value
+    assert engine.evaluate({"Test": portfolio}, {"AAPL": 200.0, "MSFT": 300.0}, {}) == []
+    assert engine.evaluate({"Test": portfolio}, {"AAPL": 200.0, "MSFT": 300.0}, {"BTC": 120000.0}) == []
+
+    alerts = engine.evaluate({"Test": portfolio}, {"AAPL": 200.0, "MSFT": 300.0}, {"BTC": 90000.0})
+    assert fired_ids(alerts) == [1]
+    assert "(now $45,700.00)" in alerts[0].message
+
+def test_engine_in_reporting_currency():
+    engine = AlertEngine([
+        AlertRule("Test", 'value', 'above', 1000, id=1),
+        AlertRule("Test", 'price', 'above', 0.5, 'stock', "VOD.L", id=2)
+    ])
+    portfolio = Holdings({"VOD.L": {'shares': 100, 'buy_price': 1}}, {})
+    # 72.5 pence is 0.90625 USD: 100 shares are worth $90.63, not 7,250
+    alerts = engine.evaluate({"Test": portfolio}, {"VOD.L": 72.5}, {}, FXRates({'GBP': 1.25}))
+    assert fired_ids(alerts) == [2]
+    assert "VOD.L price above $0.50 (now $0.91)" in alerts[0].message
+
+    alerts = engine.evaluate({"Test": portfolio}, {"VOD.L": 1000.0}, {}, FXRates({'GBP': 1.25, 'EUR': 1.25}, 'EUR'))
+    assert fired_ids(alerts) == [1]
+    assert alerts[0].currency == 'EUR'
+
+def test_rule_validation():
+    with pytest.raises(ValueError):
+        AlertRule("Test", 'volume', 'above', 1, 'stock', "AAPL")
+    with pytest.raises(ValueError):
+        AlertRule("Test", 'price', 'sideways', 1, 'stock', "AAPL")
+    with pytest.raises(ValueError):
+        AlertRule("Test", 'price', 'above', 1)
+
+def test_alerts_round_trip(tmp_path):
+    store = PortfolioStore(str(tmp_path / "portfolios.db"))
+    store.create_portfolio("Growth")
+    store.create_portfolio("Income")
+    rules = [AlertRule("Growth", 'price', 'above', 200, 'stock', "AAPL"), AlertRule("Income", 'value', 'below', 1000)]
+    ids = store.add_alerts([rule.to_row() for rule in rules])
+    assert store.delete_alert(ids[0])
+    assert not store.delete_alert(ids[0])
+
+    engine = AlertEngine.from_store(store)
+    assert [(rule.id, rule.portfolio, rule.describe()) for rule in engine.rules] == [
+        (ids[1], "Income", "portfolio value below $1,000.00")
+    ]
+    assert len(AlertEngine.from_store(store, "Growth")) == 0
+    store.delete_portfolio("Income")
+    assert list(store.iter_alerts()) == []
+
+    # Alerts never create portfolios
+    with pytest.raises(ValueError):
+        store.add_alerts([AlertRule("Typo", 'value', 'below', 1000).to_row()])
+    assert store.portfolio_names() == ["Growth"]
+
+def test_watch_shows_last_alert():
+    fetch = make_fetch([
+        {'stock': {"AAPL": 200.0, "MSFT": 310.0}, 'crypto': {"BTC": 60000.0}},
+        {'stock': {"AAPL": 200.0, "MSFT": 330.0}, 'crypto': {"BTC": 60000.0}}
+    ])
+    engine = AlertEngine([AlertRule("Test", 'price', 'above', 320, 'stock', "MSFT")])
+    watch = PortfolioWatch(make_portfolio(), refresh=1, fetch=fetch, out=io.StringIO(), ansi=True, alerts=engine)
+
+    watch.tick()
+    assert "Last alert: none" in watch.table.lines
+    watch.tick()
+    assert [alert.value for alert in watch.fired] == [330.0]
+    assert any(line.startswith("Last alert: Alert for 'Test': MSFT price above $320.00") for line in watch.table.lines)
@@ -0,0 +1,169 @@
+import json
+import time
+
+import pytest
+
+import batch
+import project
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    validated = []
+
+    def validate_tickers(tickers):
+        validated.append(sorted(tickers))
+        return {ticker: (ticker != "NOPE", None) for ticker in tickers}
+
+    monkeypatch.setattr(project, "validate_tickers", validate_tickers)
+    monkeypatch.setattr(project, "validate_cryptos", lambda symbols: {symbol: (True, symbol) for symbol in symbols})
+    # No network: quote currencies for non-US tickers fall back to the suffix table
+    monkeypatch.setattr(project, "stock_provider", project.ReplayProvider({}, 'stock'))
+    monkeypatch.setattr(project, "PRICE_CACHE_FILE", str(tmp_path / "price_cache.json"))
+    store = project.PortfolioStore(str(tmp_path / "portfolios.db"))
+    store.validated = validated
+    return store
+
+def test_import_csv(tmp_path, store):
+    path = tmp_path / "trades.csv"
+    path.write_text(
+        "portfolio,asset_class,symbol,side,quantity,price,timestamp\n"
+        "Growth,stock,aapl,buy,10,100,2024-01-02T10:00:00\n"
+        "Growth,stock,AAPL,buy,10,200,2024-01-03T10:00:00\n"
+        "Growth,stock,AAPL,sell,5,250,2024-01-04T10:00:00\n"
+        "Growth,stock,NOPE,buy,1,1,\n"
+        "Growth,stock,MSFT,sell,1,1,\n"
+        "Income,crypto,BTC,buy,0.5,30000,\n"
+        "Income,bond,XYZ,buy,1,1,\n"
+    )
+    portfolios = {}
+    result = batch.import_trades(str(path), portfolios, store)
+
+    assert result.applied == 4
+    assert [number for number, _ in result.errors] == [5, 6, 8]
+    # Each unique ticker validated once, in one batch
+    assert store.validated == [["AAPL", "MSFT", "NOPE"]]
+
+    loaded = project.load_portfolios(store)
+    assert loaded["Growth"].stocks["AAPL"] == {'shares': 15, 'buy_price': 150, 'realised_pnl': 500}
+    assert loaded["Income"].crypto["BTC"] == {'amount': 0.5, 'buy_price': 30000}
+    assert loaded["Growth"].stock_ledger.positions('fifo').as_dict()["AAPL"]['realised_pnl'] == 750
+
+def test_import_jsonl_with_default_portfolio(tmp_path, store):
+    path = tmp_path / "trades.jsonl"
+    path.write_text("\n".join(json.dumps(row) for row in [
+        {'asset_class': "crypto", 'symbol': "ETH", 'quantity': 2, 'price': 2000},
+        {'asset_class': "crypto", 'symbol': "ETH", 'quantity': -1, 'price': 3000},
+    ]) + "\n")
+    result = batch.import_trades(str(path), {}, store, default_portfolio="Main")
+
+    assert result.errors == []
+    assert project.load_portfolios(store)["Main"].crypto["ETH"] == {'amount': 1, 'buy_price': 2000, 'realised_pnl': 1000}
+
+def test_value_all_json(tmp_path, store, monkeypatch, capsys):
+    store.save_holding("Growth", 'stocks', "AAPL", {'shares': 2, 'buy_price': 150})
+    store.save_holding("Income", 'crypto', "BTC", {'amount': 1, 'buy_price': 30000})
+    monkeypatch.setattr(project, "open_portfolio_store", lambda: store)
+    monkeypatch.setattr(project, "fetch_engine", project.FetchEngine([
+        project.Provider('stock', lambda tickers: {"AAPL": 200.0}),
+        project.Provider('crypto', lambda symbols: {"BTC": 40000.0})
+    ]))
+
+    assert batch.run(["value", "--all", "--json"]) == 0
+    output = json.loads(capsys.readouterr().out)
+    assert output["Growth"]['total_value'] == 400.0
+    assert output["Income"]['total_unrealised_pnl'] == 10000.0
+
+def test_value_all_summary(tmp_path, store, monkeypatch, capsys):
+    store.save_holding("Growth", 'stocks', "AAPL", {'shares': 2, 'buy_price': 150})
+    store.save_holding("Income", 'stocks', "AAPL", {'shares': 1, 'buy_price': 100})
+    store.save_holding("Income", 'crypto', "BTC", {'amount': 1, 'buy_price': 30000})
+    requested = []
+    monkeypatch.setattr(project, "open_portfolio_store", lambda: store)
+    monkeypatch.setattr(project, "fetch_engine", project.FetchEngine([
+        project.Provider('stock', lambda tickers: requested.extend(tickers) or {"AAPL": 200.0}),
+        project.Provider('crypto', lambda symbols: {"BTC": 40000.0})
+    ]))
+
+    assert batch.run(["value", "--all", "--summary", "--json"]) == 0
+    output = json.loads(capsys.readouterr().out)
+    assert requested == ["AAPL"]
+    assert output['total_value'] == 40600.0
+    assert output['portfolios']["Growth"]['total_value'] == 400.0
+    assert output['assets'][0] == {
+        'symbol': "AAPL", 'asset_class': 'stock', 'quantity': 3.0, 'price': 200.0,
+        'market_value': 600.0, 'unrealised_pnl': 200.0, 'exposure': 600.0 / 40600.0
+    }
+
+    assert batch.run(["value", "--all", "--summary"]) == 0
+    assert "Total value across all portfolios: $40,600.00" in capsys.readouterr().out
+
+def test_alerts_commands(tmp_path, store, monkeypatch, capsys):
+    store.save_holding("Growth", 'stocks', "AAPL", {'shares': 2, 'buy_price': 150})
+    monkeypatch.setattr(project, "open_portfolio_store", lambda: store)
+    requested = []
+    monkeypatch.setattr(project, "fetch_engine", project.FetchEngine([
+        project.Provider('stock', lambda tickers: requested.extend(tickers) or {"AAPL": 200.0, "MSFT": 400.0}),
+        project.Provider('crypto', lambda symbols: {})
+    ]))
+
+    assert batch.run(["alerts", "add", "Growth", "--symbol", "msft", "--above", "350"]) == 0
+    assert batch.run(["alerts", "add", "Growth", "--kind", "value", "--below", "500"]) == 0
+    assert batch.run(["alerts", "add", "Growth", "--kind", "pnl_pct", "--symbol", "AAPL", "--below", "0"]) == 0
+    capsys.readouterr()
+
+    assert batch.run(["alerts", "check"]) == 0
+    output = capsys.readouterr().out
+    # Symbols watched by price rules are fetched with the holdings
+    assert requested == ["AAPL", "MSFT"]
+    assert "MSFT price above $350.00 (now $400.00)" in output
+    assert "portfolio value below $500.00 (now $400.00)" in output
+    assert "2 of 3 alerts triggered." in output
+
+    assert batch.run(["alerts", "add", "Typo", "--kind", "value", "--below", "500"]) == 1
+    assert "Typo" not in store.portfolio_names()
+
+    assert batch.run(["alerts", "remove", "--id", "1"]) == 0
+    assert batch.run(["alerts", "list", "Growth"]) == 0
+    assert "MSFT" not in capsys.readouterr().out.split("Removed alert 1.")[1]
+
+    assert batch.run(["alerts", "remove", "--id", "1"]) == 1
+    assert "Alert 1 does not exist." in capsys.readouterr().err
+
+def test_risk_offline_json(tmp_path, store, monkeypatch, capsys):
+    import numpy as np
+    from history import BAR_DTYPE, HistoryStore, to_day
+
+    store.save_holding("Growth", 'stocks', "AAPL", {'shares': 2, 'buy_price': 150})
+    monkeypatch.setattr(project, "open_portfolio_store", lambda: store)
+    monkeypatch.setattr(project, "HISTORY_DIR", str(tmp_path / "history"))
+    last_day = to_day(time.time()) - 1
+    bars = np.zeros(30, dtype=BAR_DTYPE)
+    bars['day'] = np.arange(last_day - 29, last_day + 1)
+    bars['close'] = 100 * 1.01 ** np.arange(30) * (1 + 0.01 * (np.arange(30) % 2))
+    HistoryStore(project.HISTORY_DIR).write('stock', "AAPL", bars, last_day - 29, last_day)
+
+    assert batch.run(["risk", "Growth", "--days", "60", "--offline", "--json"]) == 0
+    output = json.loads(capsys.readouterr().out)
+    assert output['observations'] == 29
+    assert output['total_value'] == pytest.approx(2 * bars['close'][-1])
+    assert output['var_historical'] > 0
+
+def test_value_in_other_currency(tmp_path, store, monkeypatch, capsys):
+    store.save_holding("Growth", 'stocks', "AAPL", {'shares': 2, 'buy_price': 150})
+    store.save_holding("Growth", 'stocks', "VOD.L", {'shares': 100, 'buy_price': 1})
+    requested = []
+    monkeypatch.setattr(project, "open_portfolio_store", lambda: store)
+    monkeypatch.setattr(project, "fetch_engine", project.FetchEngine([
+        project.Provider('stock', lambda tickers: {"AAPL": 200.0, "VOD.L": 80.0}),
+        project.Provider('crypto', lambda symbols: {}),
+        project.Provider('fx', lambda currencies: requested.append(currencies) or {'GBP': 1.25, 'EUR': 1.0})
+    ]))
+
+    assert batch.run(["value", "Growth", "--currency", "eur", "--json"]) == 0
+    output = json.loads(capsys.readouterr().out)["Growth"]
+    assert requested == [['GBP', 'EUR']]
+    assert output['currency'] == 'EUR'
+    assert output['total_value'] == pytest.approx(400 + 100)
+
+    assert batch.run(["value", "Growth", "--currency", "CHF"]) == 1
+    assert "No exchange rate for CHF" in capsys.readouterr().err
@@ -0,0 +1,111 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from cmc_client import CMCClient, CMCCreditLimitError, CMCError, TokenBucket
+
+class StubCMC(BaseHTTPRequestHandler):
+    # Replays the scripted (status, headers, body) responses in server.script.
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers.get('X-CMC_PRO_API_KEY')))
+        self.server.ports.add(self.client_address[1])
+        status, headers, body = self.server.script.pop(0)
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubCMC)
+    server.script = []
+    server.requests = []
+    server.ports = set()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def make_client(server, sleeps, **kwargs):
+    return CMCClient("test-key", base_url=f"http://127.0.0.1:{server.server_port}",
+                     rate_limit_per_minute=None, sleep=sleeps.append, **kwargs)
+
+def quote_body(symbol, price, credits=1):
+    return {'status': {'error_code': 0, 'credit_count': credits},
+            'data': {symbol: {'name': symbol.title(), 'quote': {'USD': {'price': price}}}}}
+
+def test_quotes_reuse_pooled_connection(stub_server):
+    stub_server.script = [(200, {}, quote_body("BTC", 60000.0)), (200, {}, quote_body("ETH", 3000.0, 2))]
+    client = make_client(stub_server, [])
+
+    assert client.quotes_latest(["BTC"])["BTC"]['quote']['USD']['price'] == 60000.0
+    assert "ETH" in client.quotes_latest(["ETH"])
+
+    path, api_key = stub_server.requests[0]
+    assert api_key == "test-key"
+    assert parse_qs(urlparse(path).query)['skip_invalid'] == ['true']
+    # Both requests went over the same keep-alive connection
+    assert len(stub_server.ports) == 1
+    assert client.stats() == {'requests': 2, 'retries': 0, 'credits_used': 3}
+
+def test_retries_429_respecting_retry_after(stub_server):
+    rate_limited = {'status': {'error_code': 1008, 'error_message': "Minute limit reached"}}
+    stub_server.script = [
+        (429, {'Retry-After': '7'}, rate_limited),
+        (500, {}, {}),
+        (200, {}, quote_body("BTC", 60000.0))
+    ]
+    sleeps = []
+    client = make_client(stub_server, sleeps, backoff=0.5)
+
+    assert "BTC" in client.quotes_latest(["BTC"])
+    assert sleeps == [7.0, 1.0]
+    assert client.retry_count == 2
+
+def test_credit_limit_is_not_retried(stub_server):
+    exhausted = {'status': {'error_code': 1009, 'error_message': "Daily credit limit reached"}}
+    stub_server.script = [(429, {}, exhausted)]
+    sleeps = []
+    client = make_client(stub_server, sleeps)
+
+    with pytest.raises(CMCCreditLimitError):
+        client.quotes_latest(["BTC"])
+    assert sleeps == []
+
+def test_gives_up_after_max_retries(stub_server):
+    stub_server.script = [(503, {}, {})] * 3
+    client = make_client(stub_server, [], max_retries=2)
+
+    with pytest.raises(CMCError) as error:
+        client.quotes_latest(["BTC"])
+    assert error.value.status_code == 503
+    assert client.request_count == 3
+
+def test_token_bucket_waits_for_refill():
+    now = [0.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    bucket = TokenBucket(60, capacity=2, clock=lambda: now[0], sleep=sleep)
+    bucket.acquire()
+    bucket.acquire()
+    assert sleeps == []
+
+    # Third token only arrives after one second at 60 per minute
+    assert bucket.acquire() == pytest.approx(1.0)
@@ -0,0 +1,65 @@
+import threading
+import time
+
+from fetch_engine import FetchEngine, Provider
+
+def test_fetch_runs_providers_concurrently():
+    def slow_stock(symbols):
+        time.sleep(0.2)
+        return {symbol: 1.0 for symbol in symbols}
+
+    def slow_crypto(symbols):
+        time.sleep(0.2)
+        return {symbol: 2.0 for symbol in symbols}
+
+    engine = FetchEngine([Provider('stock', slow_stock, 2, 4), Provider('crypto', slow_crypto, 2, 4)])
+    result = engine.fetch({'stock': ["A", "B", "C"], 'crypto': ["X", "Y"]})
+    engine.close()
+
+    assert result.complete
+    assert result.get('stock') == {"A": 1.0, "B": 1.0, "C": 1.0}
+    assert result.get('crypto') == {"X": 2.0, "Y": 2.0}
+    # Three batches of 0.2s run side by side, not one after the other
+    assert result.elapsed < 0.5
+
+def test_concurrency_limit_per_provider():
+    in_flight = []
+    peak = []
+    lock = threading.Lock()
+
+    def fetch(symbols):
+        with lock:
+            in_flight.append(1)
+            peak.append(len(in_flight))
+        time.sleep(0.05)
+        with lock:
+            in_flight.pop()
+        return {symbol: 1.0 for symbol in symbols}
+
+    engine = FetchEngine([Provider('stock', fetch, 1, 2)])
+    result = engine.fetch({'stock': [f"T{i}" for i in range(6)]})
+    engine.close()
+
+    assert len(result.get('stock')) == 6
+    assert max(peak) <= 2
+
+def test_partial_results_on_failure_and_timeout():
+    def broken(symbols):
+        raise ConnectionError("CMC is down")
+
+    def hanging(symbols):
+        time.sleep(1)
+        return {}
+
+    def fine(symbols):
+        return {symbol: 5.0 for symbol in symbols if symbol != "UNKNOWN"}
+
+    engine = FetchEngine([Provider('crypto', broken), Provider('slow', hanging), Provider('stock', fine)])
+    result = engine.fetch({'crypto': ["BTC"], 'slow': ["S"], 'stock': ["AAPL", "UNKNOWN"]}, timeout=0.2)
+    engine.close()
+
+    assert result.get('stock') == {"AAPL": 5.0}
+    assert result.failed('stock') == {"UNKNOWN": "no price returned"}
+    assert result.failed('crypto') == {"BTC": "CMC is down"}
+    assert "timed out" in result.failed('slow')["S"]
+    assert not result.complete
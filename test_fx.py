@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+import fx as fx_module
+from fx import FXRates, format_money, parse_quote_currency, set_quote_currency, stock_currencies, ticker_currency
+
+RATES = {'EUR': 1.1, 'GBP': 1.25, 'JPY': 0.0067}
+
+def test_ticker_currency():
+    assert ticker_currency("AAPL") == ('USD', 1.0)
+    assert ticker_currency("VOD.L") == ('GBP', 0.01)
+    assert ticker_currency("7203.T") == ('JPY', 1.0)
+    assert ticker_currency("BRK.B") == ('USD', 1.0)
+    assert stock_currencies(["AAPL", "VOD.L", "BP.L", "7203.T"]) == ['USD', 'GBP', 'JPY']
+
+def test_quote_currency_from_yahoo_wins(monkeypatch):
+    monkeypatch.setattr(fx_module, "QUOTE_CURRENCIES", {})
+    assert parse_quote_currency('GBp') == ('GBP', 0.01)
+    assert parse_quote_currency('ZAc') == ('ZAR', 0.01)
+    assert parse_quote_currency('GBP') == ('GBP', 1.0)
+
+    set_quote_currency("CSPX.L", 'USD')
+    set_quote_currency("IGLT.L", 'GBP')
+    assert ticker_currency("CSPX.L") == ('USD', 1.0)
+    assert ticker_currency("IGLT.L") == ('GBP', 1.0)
+    assert ticker_currency("VOD.L") == ('GBP', 0.01)
+    assert stock_currencies(["CSPX.L", "IGLT.L"]) == ['USD', 'GBP']
+
+def test_price_factors():
+    fx = FXRates(RATES, 'EUR', crypto_currency='EUR')
+    factors = fx.price_factors(["AAPL", "VOD.L", "7203.T", "BTC", "SAP.DE", "ABB.ST"],
+                               ['stock', 'stock', 'stock', 'crypto', 'stock', 'stock'])
+    assert factors[:5] == pytest.approx([1 / 1.1, 0.01 * 1.25 / 1.1, 0.0067 / 1.1, 1.0, 1.0])
+    # No SEK rate: unpriced rather than wrong
+    assert np.isnan(factors[5])
+    assert fx.factor('USD') == pytest.approx(1 / 1.1)
+
+def test_missing_target_rate():
+    with pytest.raises(ValueError):
+        FXRates(RATES, 'SGD')
+
+def test_format_money():
+    assert format_money(1234.5) == "$1,234.50"
+    assert format_money(-3, 'EUR') == "€-3.00"
+    assert format_money(10, 'CHF') == "10.00 CHF"
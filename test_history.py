@@ -0,0 +1,163 @@
+import time
+
+import numpy as np
+import pytest
+
+from fx import FXRates
+from history import BAR_DTYPE, SECONDS_PER_DAY, HistoryStore, backfill_portfolio, portfolio_history, to_day
+from ledger import TradeLedger
+
+TODAY = 20000 # 2024-10-04
+
+def make_bars(days, closes):
+    bars = np.zeros(len(days), dtype=BAR_DTYPE)
+    bars['day'] = days
+    bars['close'] = closes
+    return bars
+
+class FakeFetch:
+    # Serves close = day number for every symbol and records the calls
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, symbols, first_day, last_day):
+        self.calls.append((sorted(symbols), first_day, last_day))
+        days = np.arange(first_day, last_day + 1)
+        return {symbol: make_bars(days, days.astype(float)) for symbol in symbols}
+
+class Holdings:
+    def __init__(self):
+        self.stock_ledger = TradeLedger()
+        self.crypto_ledger = TradeLedger()
+
+def make_store(tmp_path):
+    return HistoryStore(str(tmp_path / "history"), clock=lambda: (TODAY + 0.5) * SECONDS_PER_DAY)
+
+def test_to_day():
+    assert to_day("1970-01-02") == 1
+    assert to_day(SECONDS_PER_DAY * 3 + 5) == 3
+
+def test_backfill_fetches_only_missing_ranges(tmp_path):
+    store = make_store(tmp_path)
+    fetch = FakeFetch()
+
+    assert store.backfill('stock', ["AAPL", "MSFT"], TODAY - 10, TODAY - 5, fetch) == 1
+    assert store.backfill('stock', ["AAPL", "MSFT"], TODAY - 10, TODAY - 5, fetch) == 0
+    # Extending the range fetches only the new days, and never today
+    store.backfill('stock', ["AAPL"], TODAY - 12, TODAY, fetch)
+    assert fetch.calls[1:] == [(["AAPL"], TODAY - 12, TODAY - 11), (["AAPL"], TODAY - 4, TODAY - 1)]
+
+    assert list(store.bars('stock', "AAPL")['day']) == list(range(TODAY - 12, TODAY))
+    assert store.coverage('stock', "MSFT") == ((TODAY - 10, TODAY - 5),)
+
+    # Coverage and bars survive a reopen
+    reopened = make_store(tmp_path)
+    assert reopened.coverage('stock', "AAPL") == ((TODAY - 12, TODAY - 1),)
+    assert isinstance(reopened.bars('stock', "AAPL"), np.memmap)
+
+def test_backfill_fills_gaps_between_fetches(tmp_path):
+    store = make_store(tmp_path)
+    fetch = FakeFetch()
+    store.backfill('stock', ["AAPL"], TODAY - 300, TODAY - 200, fetch)
+    store.backfill('stock', ["AAPL"], TODAY - 100, TODAY - 1, fetch)
+    assert store.coverage('stock', "AAPL") == ((TODAY - 300, TODAY - 200), (TODAY - 100, TODAY - 1))
+
+    assert store.backfill('stock', ["AAPL"], TODAY - 300, TODAY - 1, fetch) == 1
+    assert fetch.calls[-1] == (["AAPL"], TODAY - 199, TODAY - 101)
+    assert len(store.bars('stock', "AAPL")) == 300
+    assert store.coverage('stock', "AAPL") == ((TODAY - 300, TODAY - 1),)
+
+def test_old_single_span_coverage_is_read(tmp_path):
+    store = make_store(tmp_path)
+    store.write('stock', "AAPL", make_bars([10], [1.0]), 10, 20)
+    store._coverage = {"stock:AAPL": [10, 20]}
+    store._save_coverage()
+
+    reopened = make_store(tmp_path)
+    assert reopened.missing_ranges('stock', "AAPL", 0, 30) == [(0, 9), (21, 30)]
+
+def test_close_matrix_forward_fills(tmp_path):
+    store = make_store(tmp_path)
+    store.write('stock', "AAPL", make_bars([10, 12], [1.0, 2.0]), 10, 13)
+    closes = store.close_matrix([('stock', "AAPL"), ('stock', "NONE")], np.arange(9, 14))
+
+    assert list(closes[:, 0]) == [1.0, 1.0, 1.0, 2.0, 2.0]
+    assert np.isnan(closes[:, 1]).all()
+
+def test_portfolio_history(tmp_path):
+    store = make_store(tmp_path)
+    store.write('stock', "AAPL", make_bars([0, 1, 2, 3], [10.0, 12.0, 6.0, 9.0]), 0, 3)
+    store.write('crypto', "BTC", make_bars([0, 1, 2, 3], [100.0, 100.0, 100.0, 100.0]), 0, 3)
+
+    portfolio = Holdings()
+    portfolio.stock_ledger.append("AAPL", 10, 10.0, 0.5 * SECONDS_PER_DAY)
+    portfolio.crypto_ledger.append("BTC", 1, 100.0, 2.5 * SECONDS_PER_DAY) # Bought on day 2
+    history = portfolio_history(store, portfolio, 0, 3)
+
+    assert list(history.value) == [100.0, 120.0, 160.0, 190.0]
+    assert list(history.flows) == [100.0, 0.0, 100.0, 0.0]
+    # The BTC purchase on day 2 is not counted as a return
+    assert history.returns[1] == pytest.approx(0.2)
+    assert history.returns[2] == pytest.approx((160 - 120 - 100) / 120)
+    assert history.max_drawdown == pytest.approx(60 / 120 - 1)
+
+def test_portfolio_history_in_reporting_currency(tmp_path):
+    store = make_store(tmp_path)
+    store.write('stock', "VOD.L", make_bars([0, 1], [80.0, 88.0]), 0, 1) # Pence
+    store.write('crypto', "BTC", make_bars([0, 1], [100.0, 100.0]), 0, 1) # USD from Yahoo
+
+    portfolio = Holdings()
+    portfolio.stock_ledger.append("VOD.L", 100, 1.0, 0.5 * SECONDS_PER_DAY) # Bought for $100
+    portfolio.crypto_ledger.append("BTC", 1, 100.0, 0.5 * SECONDS_PER_DAY)
+    history = portfolio_history(store, portfolio, 0, 1, FXRates({'GBP': 1.25, 'EUR': 1.25}, 'EUR'))
+
+    assert history.currency == 'EUR'
+    # 100 shares at 80p are 80 GBP, 100 USD or 80 EUR
+    assert list(history.value) == pytest.approx([80.0 + 80.0, 88.0 + 80.0])
+    assert list(history.flows) == pytest.approx([160.0, 0.0])
+    assert history.returns[1] == pytest.approx(8.0 / 160.0)
+
+def test_symbols_without_bars_are_left_out(tmp_path):
+    store = make_store(tmp_path)
+    store.write('stock', "AAPL", make_bars([0, 1, 2], [10.0, 10.0, 10.0]), 0, 2)
+    store.write('crypto', "NEWCOIN", make_bars([], []), 0, 2) # Yahoo doesn't list it
+
+    portfolio = Holdings()
+    portfolio.stock_ledger.append("AAPL", 1, 10.0, 0.5 * SECONDS_PER_DAY)
+    portfolio.crypto_ledger.append("NEWCOIN", 100, 5.0, 1.5 * SECONDS_PER_DAY)
+    history = portfolio_history(store, portfolio, 0, 2)
+
+    assert history.missing == ["NEWCOIN"]
+    assert list(history.flows) == [10.0, 0.0, 0.0]
+    assert list(history.returns) == [0.0, 0.0, 0.0]
+    assert history.max_drawdown == 0.0
+
+def test_backfill_portfolio_groups_symbols(tmp_path):
+    store = make_store(tmp_path)
+    portfolio = Holdings()
+    for symbol in ("AAPL", "MSFT", "GOOG"):
+        portfolio.stock_ledger.append(symbol, 1, 1.0, 0)
+    portfolio.crypto_ledger.append("BTC", 1, 1.0, 0)
+    stock_fetch, crypto_fetch = FakeFetch(), FakeFetch()
+
+    calls = backfill_portfolio(store, portfolio, TODAY - 30, TODAY, {'stock': stock_fetch, 'crypto': crypto_fetch})
+    assert calls == 2
+    assert stock_fetch.calls == [(["AAPL", "GOOG", "MSFT"], TODAY - 30, TODAY - 1)]
+
+def test_history_is_fast_offline(tmp_path):
+    store = make_store(tmp_path)
+    days = np.arange(TODAY - 5 * 365, TODAY)
+    portfolio = Holdings()
+    for number in range(300):
+        symbol = f"T{number}"
+        store.write('stock', symbol, make_bars(days, np.linspace(10, 20, len(days))), days[0], days[-1])
+        portfolio.stock_ledger.append(symbol, 5, 10.0, days[0] * SECONDS_PER_DAY)
+        portfolio.stock_ledger.append(symbol, -2, 15.0, days[900] * SECONDS_PER_DAY)
+
+    reopened = make_store(tmp_path)
+    started = time.perf_counter()
+    history = portfolio_history(reopened, portfolio, days[0], days[-1])
+    elapsed = time.perf_counter() - started
+
+    assert history.value[-1] == pytest.approx(300 * 3 * 20)
+    assert elapsed < 1.0
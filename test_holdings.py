@@ -0,0 +1,76 @@
+import pytest
+
+import project
+from holdings import CryptoHolding, PortfolioCatalog, StockHolding, stock_holdings
+from storage import PortfolioStore
+
+@pytest.fixture
+def store(tmp_path):
+    store = PortfolioStore(str(tmp_path / "portfolios.db"))
+    yield store
+    store.close()
+
+def test_holding_behaves_like_a_dict():
+    holding = StockHolding(2, 150)
+    assert holding == {'shares': 2, 'buy_price': 150}
+    assert 'realised_pnl' not in holding
+    assert holding.get('realised_pnl', 0) == 0
+
+    holding['realised_pnl'] = 0
+    holding['realised_pnl'] += 10
+    holding['shares'] += 1
+    assert dict(holding) == {'shares': 3, 'buy_price': 150, 'realised_pnl': 10}
+    assert not hasattr(holding, '__dict__')
+
+    with pytest.raises(KeyError):
+        holding['amount']
+    assert CryptoHolding(1, 2)['amount'] == 1
+
+def test_holdings_convert_dicts():
+    holdings = stock_holdings({"AAPL": {'shares': 2, 'buy_price': 150}})
+    project.apply_buy(holdings, "AAPL", 'shares', 2, 250)
+    project.apply_buy(holdings, "MSFT", 'shares', 1, 300)
+    assert isinstance(holdings["MSFT"], StockHolding)
+    assert holdings == {"AAPL": {'shares': 4, 'buy_price': 200}, "MSFT": {'shares': 1, 'buy_price': 300}}
+
+    project.apply_sell(holdings, "MSFT", 'shares', 1, 310)
+    assert "MSFT" not in holdings
+    assert list(holdings) == ["AAPL"]
+
+def test_catalog_loads_portfolios_on_access(store):
+    store.save_holding("Growth", 'stocks', "AAPL", {'shares': 2, 'buy_price': 150})
+    store.save_holding("Income", 'crypto', "BTC", {'amount': 1, 'buy_price': 30000, 'realised_pnl': 5})
+    store.create_portfolio("Empty")
+    portfolios = project.load_portfolios(store)
+
+    assert isinstance(portfolios, PortfolioCatalog)
+    assert list(portfolios) == ["Growth", "Income", "Empty"]
+    assert "Income" in portfolios and not portfolios.is_loaded("Income")
+
+    assert portfolios["Growth"].stocks["AAPL"] == {'shares': 2, 'buy_price': 150}
+    assert portfolios.is_loaded("Growth") and not portfolios.is_loaded("Income")
+    assert portfolios["Growth"] is portfolios["Growth"]
+
+    # values() reads every unread portfolio in one streamed query
+    values = portfolios.values()
+    assert [portfolio.name for portfolio in values] == ["Growth", "Income", "Empty"]
+    assert portfolios["Income"].crypto["BTC"]['realised_pnl'] == 5
+    assert len(portfolios["Empty"].stocks) == 0
+
+def test_catalog_rename(store):
+    store.save_holding("Old", 'stocks', "AAPL", {'shares': 2, 'buy_price': 150})
+    portfolios = project.load_portfolios(store)
+
+    # What main() does for "Rename a portfolio"
+    portfolios["New"] = portfolios.pop("Old")
+    portfolios["New"].name = "New"
+    assert list(project.load_portfolios(store)) == ["New"]
+    assert "Old" not in portfolios
+
+def test_iter_portfolios_streams_in_chunks(store):
+    for number in range(5):
+        store.save_holding(f"P{number}", 'stocks', "AAPL", {'shares': number + 1, 'buy_price': 1})
+        store.save_holding(f"P{number}", 'crypto', "BTC", {'amount': 1, 'buy_price': 1})
+    streamed = dict(store.iter_portfolios(chunk_size=3))
+
+    assert streamed == store.load()
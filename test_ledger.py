@@ -0,0 +1,110 @@
+import random
+
+import numpy as np
+import pytest
+
+from ledger import TradeLedger, match_lots
+
+def reference_positions(trades, method):
+    # Straightforward per-trade lot matching to check the vectorized engine against.
+    books = {}
+    for symbol, quantity, price in trades:
+        book = books.setdefault(symbol, {'lots': [], 'realised': 0.0})
+        if quantity > 0:
+            book['lots'].append([quantity, price])
+            continue
+        to_sell = -quantity
+        if method == 'average':
+            total = sum(lot[0] for lot in book['lots'])
+            average = sum(lot[0] * lot[1] for lot in book['lots']) / total
+            book['realised'] += to_sell * (price - average)
+            book['lots'] = [[total - to_sell, average]] if total - to_sell > 1e-9 else []
+            continue
+        while to_sell > 1e-9:
+            lot = book['lots'][0] if method == 'fifo' else book['lots'][-1]
+            used = min(lot[0], to_sell)
+            book['realised'] += used * (price - lot[1])
+            lot[0] -= used
+            to_sell -= used
+            if lot[0] <= 1e-9:
+                book['lots'].remove(lot)
+    return {
+        symbol: (sum(lot[0] for lot in book['lots']), sum(lot[0] * lot[1] for lot in book['lots']), book['realised'])
+        for symbol, book in books.items()
+    }
+
+def random_trades(count, seed=7):
+    rng = random.Random(seed)
+    held = {}
+    trades = []
+    for _ in range(count):
+        symbol = rng.choice(["AAPL", "MSFT", "BTC", "ETH"])
+        price = rng.uniform(10, 500)
+        if held.get(symbol, 0) > 0 and rng.random() < 0.45:
+            # Sometimes sell everything so positions go flat and restart
+            quantity = held[symbol] if rng.random() < 0.2 else rng.uniform(0, held[symbol])
+            held[symbol] -= quantity
+            trades.append((symbol, -quantity, price))
+        else:
+            quantity = rng.uniform(1, 20)
+            held[symbol] = held.get(symbol, 0) + quantity
+            trades.append((symbol, quantity, price))
+    return trades
+
+@pytest.mark.parametrize("method", ['fifo', 'lifo', 'average'])
+def test_matches_reference(method):
+    trades = random_trades(400)
+    ledger = TradeLedger(capacity=4)
+    for symbol, quantity, price in trades:
+        ledger.append(symbol, quantity, price)
+
+    positions = ledger.positions(method)
+    expected = reference_positions(trades, method)
+    for index, symbol in enumerate(positions.symbols):
+        quantity, cost_basis, realised = expected[symbol]
+        assert positions.quantity[index] == pytest.approx(quantity, abs=1e-6)
+        assert positions.cost_basis[index] == pytest.approx(cost_basis, abs=1e-6)
+        assert positions.realised_pnl[index] == pytest.approx(realised, abs=1e-6)
+
+@pytest.mark.parametrize("method", ['fifo', 'lifo', 'average'])
+def test_incremental_update_matches_full_replay(method):
+    trades = random_trades(300, seed=11)
+    incremental = TradeLedger()
+    for number, (symbol, quantity, price) in enumerate(trades):
+        incremental.append(symbol, quantity, price)
+        if number % 50 == 0:
+            incremental.positions(method)
+
+    full = TradeLedger()
+    symbols, quantities, prices = zip(*trades)
+    full.extend(symbols, quantities, prices)
+
+    expected = full.positions(method).as_dict()
+    for symbol, values in incremental.positions(method).as_dict().items():
+        assert values == pytest.approx(expected[symbol])
+
+def test_lot_methods_differ():
+    ledger = TradeLedger()
+    ledger.append("AAPL", 10, 100)
+    ledger.append("AAPL", 10, 200)
+    ledger.append("AAPL", -10, 250)
+
+    assert ledger.positions('fifo').as_dict()["AAPL"]['realised_pnl'] == 1500
+    assert ledger.positions('lifo').as_dict()["AAPL"]['realised_pnl'] == 500
+    average = ledger.positions('average').as_dict()["AAPL"]
+    assert average['realised_pnl'] == 1000
+    assert average['average_cost'] == 150
+
+def test_overselling_is_rejected():
+    with pytest.raises(ValueError):
+        match_lots(np.array([0, 0]), np.array([1.0, -2.0]), np.array([10.0, 10.0]), 1)
+
+def test_save_and_load(tmp_path):
+    ledger = TradeLedger()
+    ledger.append("BTC", 1, 30000, timestamp=1.0)
+    ledger.append("BTC", -0.5, 40000, timestamp=2.0)
+    ledger.save(tmp_path / "ledger.npz")
+
+    loaded = TradeLedger.load(tmp_path / "ledger.npz")
+    assert len(loaded) == 2
+    assert loaded.positions().as_dict() == ledger.positions().as_dict()
@@ -0,0 +1,86 @@
+import os
+import subprocess
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+from market_data import CMCProvider, MarketDataProvider, RecordingProvider, ReplayProvider
+
+class FakeProvider:
+    asset_class = 'crypto'
+
+    def __init__(self):
+        self.calls = 0
+
+    def quotes(self, symbols):
+        self.calls += 1
+        return {"BTC": {'name': "Bitcoin", 'exchange': None, 'price': 60000.0}}
+
+    def latest_prices(self, symbols):
+        return {"BTC": 60000.0}
+
+    def metadata(self, symbols):
+        return {"BTC": {'name': "Bitcoin", 'exchange': None}}
+
+def test_replay_serves_fixture():
+    provider = ReplayProvider({'prices': {"BTC": 1.5}, 'metadata': {"BTC": {'name': "Bitcoin", 'exchange': None}}}, 'crypto')
+
+    assert provider.latest_prices(["btc", "NOPE"]) == {"BTC": 1.5}
+    assert provider.metadata(["BTC"]) == {"BTC": {'name': "Bitcoin", 'exchange': None}}
+    assert provider.quotes(["BTC"]) == {"BTC": {'name': "Bitcoin", 'exchange': None, 'price': 1.5}}
+    assert provider.calls == 3
+
+def test_incomplete_provider_fails_on_creation():
+    class PricesOnly(MarketDataProvider):
+        def latest_prices(self, symbols):
+            return {}
+
+    with pytest.raises(TypeError):
+        PricesOnly()
+
+def test_record_then_replay(tmp_path):
+    path = str(tmp_path / "fixtures" / "crypto.json")
+    live = FakeProvider()
+    recorder = RecordingProvider(live, path)
+    assert recorder.quotes(["BTC", "NOPE"])["BTC"]['price'] == 60000.0
+    assert live.calls == 1
+
+    replay = ReplayProvider.from_directory(str(tmp_path / "fixtures"), 'crypto')
+    assert replay.quotes(["BTC", "NOPE"]) == {"BTC": {'name': "Bitcoin", 'exchange': None, 'price': 60000.0}}
+
+def test_missing_directory_replays_nothing(tmp_path):
+    assert ReplayProvider.from_directory(str(tmp_path), 'stock').latest_prices(["AAPL"]) == {}
+
+def test_cmc_provider_batches_and_needs_key():
+    calls = []
+    def quotes_latest(symbols, convert='USD'):
+        calls.append(list(symbols))
+        return {symbol: {'name': symbol, 'quote': {'USD': {'price': 1.0}}} for symbol in symbols}
+    client = SimpleNamespace(quotes_latest=quotes_latest)
+
+    quotes = CMCProvider(client, "key", batch_size=2).quotes(["a", "b", "c", "A"])
+    assert calls == [["A", "B"], ["C"]]
+    assert quotes["C"] == {'name': "C", 'exchange': None, 'price': 1.0}
+
+    with pytest.raises(ValueError):
+        CMCProvider(client, None).quotes(["BTC"])
+
+def test_cmc_provider_quotes_in_one_currency():
+    calls = []
+    def quotes_latest(symbols, convert='USD'):
+        calls.append(convert)
+        return {symbol: {'name': symbol, 'quote': {convert: {'price': 2.0}}} for symbol in symbols}
+    provider = CMCProvider(SimpleNamespace(quotes_latest=quotes_latest), "key", batch_size=2, convert=lambda: "EUR")
+
+    assert provider.latest_prices(["A", "B", "C"]) == {"A": 2.0, "B": 2.0, "C": 2.0}
+    assert calls == ["EUR", "EUR"]
+    assert provider.currency == "EUR"
+
+def test_project_imports_without_api_key(tmp_path):
+    env = {key: value for key, value in os.environ.items() if key != "CMC_API_KEY"}
+    # Run from an empty directory so no .env file supplies the key
+    result = subprocess.run([sys.executable, "-c", "import sys; sys.path.insert(0, sys.argv[1]); import project",
+                             os.path.dirname(os.path.abspath(__file__))], cwd=tmp_path, env=env,
+                            capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
@@ -0,0 +1,73 @@
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from price_cache import PriceCache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def test_ttl_per_asset_class():
+    clock = FakeClock()
+    cache = PriceCache(ttls={'stock': 60, 'crypto': 10}, clock=clock)
+    cache.set('stock', 'AAPL', 150.0)
+    cache.set('crypto', 'BTC', 60000.0)
+
+    clock.now += 30
+    assert cache.get('stock', 'AAPL') == 150.0
+    assert cache.get('crypto', 'BTC') is None
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+def test_lru_eviction():
+    cache = PriceCache(max_size=2)
+    cache.set('stock', 'AAPL', 1.0)
+    cache.set('stock', 'MSFT', 2.0)
+    cache.get('stock', 'AAPL') # AAPL is now most recently used
+    cache.set('stock', 'TSLA', 3.0)
+
+    assert cache.get('stock', 'MSFT') is None
+    assert cache.get('stock', 'AAPL') == 1.0
+    assert cache.stats()['evictions'] == 1
+
+def test_save_and_load(tmp_path):
+    clock = FakeClock()
+    path = tmp_path / "cache.json"
+    cache = PriceCache(ttls={'stock': 60, 'crypto': 10}, clock=clock)
+    cache.set('stock', 'AAPL', 150.0)
+    cache.set('stock_info', 'AAPL', (True, "Apple Inc."))
+    cache.save(path)
+
+    clock.now += 20
+    warm = PriceCache(ttls={'stock': 60, 'crypto': 10}, clock=clock)
+    assert warm.load(path) == 2
+    assert warm.get('stock', 'AAPL') == 150.0
+    assert tuple(warm.get('stock_info', 'AAPL')) == (True, "Apple Inc.")
+
+    clock.now += 60
+    expired = PriceCache(ttls={'stock': 60, 'crypto': 10}, clock=clock)
+    assert expired.load(path) == 1
+
+def test_concurrent_get_and_set():
+    cache = PriceCache(max_size=16)
+
+    def worker(seed):
+        for index in range(5000):
+            symbol = f"S{(seed * 7 + index) % 64}"
+            cache.set('crypto', symbol, float(index))
+            cache.get('crypto', symbol)
+        return True
+
+    # Switch threads as often as possible so get/set interleave
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            assert all(pool.map(worker, range(8)))
+    finally:
+        sys.setswitchinterval(interval)
+    assert len(cache) == 16
+    assert cache.hits + cache.misses == 8 * 5000
@@ -1,13 +1,64 @@
+import os
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+import yfinance
+import fx
+import project
 from project import(
     validate_ticker,
     add_stock,
     validate_crypto,
+    validate_cryptos,
+    get_crypto_prices,
+    get_stock_prices,
+    collect_crypto_symbols,
     add_crypto,
     sell_stock,
     sell_crypto,
     Portfolio
 )
 
+# Saved provider responses so the tests never touch the network
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+@pytest.fixture(autouse=True)
+def empty_price_cache(monkeypatch):
+    # Every test starts cold so cached prices and known symbols never leak between tests.
+    project.price_cache.clear()
+    monkeypatch.setattr(project, "symbol_index", project.SymbolIndex())
+    stock_provider, crypto_provider = project.make_providers(replay_dir=FIXTURES)
+    monkeypatch.setattr(project, "stock_provider", stock_provider)
+    monkeypatch.setattr(project, "crypto_provider", crypto_provider)
+    monkeypatch.setattr(project, "fx_provider", project.make_fx_provider(replay_dir=FIXTURES))
+    monkeypatch.setenv("REPORTING_CURRENCY", "USD")
+    monkeypatch.setattr(fx, "QUOTE_CURRENCIES", {})
+    yield
+    project.price_cache.clear()
+
+def use_fake_cmc(monkeypatch, quotes_latest):
+    # Put the real CMC provider (with its batching) in front of a fake client.
+    client = SimpleNamespace(quotes_latest=quotes_latest)
+    monkeypatch.setattr(project, "crypto_provider", project.CMCProvider(client, "key", batch_size=project.CMC_BATCH_SIZE))
+
+def use_fake_yfinance(monkeypatch, download):
+    # Put the real yfinance provider (with its batching) in front of a fake yf.download.
+    monkeypatch.setattr(yfinance, "download", download)
+    monkeypatch.setattr(project, "stock_provider", project.YFinanceProvider(batch_size=project.STOCK_BATCH_SIZE))
+
+def fake_quotes_latest(calls, known):
+    # Stand-in for CMCClient.quotes_latest answering from a dict of known symbols.
+    def quotes_latest(symbols, convert='USD'):
+        calls.append(list(symbols))
+        data = {}
+        for symbol in symbols:
+            if symbol in known:
+                name, price = known[symbol]
+                data[symbol] = {'name': name, 'quote': {'USD': {'price': price}}}
+        return data
+    return quotes_latest
+
 def test_validate_ticker():
     valid, name = validate_ticker("AAPL")
     assert valid == True
@@ -41,7 +92,7 @@ def test_add_crypto():
 def test_sell_stock():
     portfolio = Portfolio("Test Portfolio")
     add_stock(portfolio, "AAPL", 5, 150, confirmation='y')
-    result =  sell_stock(portfolio, "AAPL", 3)
+    result =  sell_stock(portfolio, "AAPL", 3, 200)
 
     assert "Sold" in result
     assert portfolio.stocks["AAPL"]["shares"] == 2
@@ -49,7 +100,161 @@ def test_sell_stock():
 def test_sell_crypto():
     portfolio = Portfolio("Test Portfolio")
     add_crypto(portfolio, "BTC", 1, 30000, confirmation='y')
-    result = sell_crypto(portfolio, "BTC", 0.5)
+    result = sell_crypto(portfolio, "BTC", 0.5, 40000)
 
     assert "Sold" in result
     assert portfolio.crypto["BTC"]["amount"] == 0.5
+
+def test_get_crypto_prices_batches(monkeypatch):
+    calls = []
+    known = {f"C{i}": (f"Coin {i}", float(i)) for i in range(250)}
+    use_fake_cmc(monkeypatch, fake_quotes_latest(calls, known))
+
+    prices = get_crypto_prices([f"c{i}" for i in range(250)] + ["C0"])
+
+    assert len(calls) == 3
+    assert [len(chunk) for chunk in calls] == [100, 100, 50]
+    assert prices["C42"] == 42.0
+
+def test_collect_crypto_symbols():
+    first = Portfolio("First")
+    first.crypto["BTC"] = {'amount': 1, 'buy_price': 30000}
+    second = Portfolio("Second")
+    second.crypto["BTC"] = {'amount': 2, 'buy_price': 20000}
+    second.crypto["ETH"] = {'amount': 3, 'buy_price': 2000}
+
+    assert collect_crypto_symbols({"First": first, "Second": second}) == ["BTC", "ETH"]
+    assert collect_crypto_symbols(first) == ["BTC"]
+
+def test_validate_cryptos_single_request(monkeypatch):
+    calls = []
+    use_fake_cmc(monkeypatch, fake_quotes_latest(calls, {"BTC": ("Bitcoin", 60000.0)}))
+
+    results = validate_cryptos(["btc", "BBTCC"])
+
+    assert len(calls) == 1
+    assert results["BTC"] == (True, "Bitcoin")
+    assert results["BBTCC"] == (False, None)
+
+def fake_download(calls, closes):
+    # Stand-in for yf.download returning a (Price, Ticker) column frame like yfinance does.
+    def download(tickers, **kwargs):
+        calls.append(list(tickers))
+        columns = pd.MultiIndex.from_product([["Close", "Open"], tickers], names=["Price", "Ticker"])
+        rows = [[closes.get(ticker, float("nan")) for ticker in tickers] * 2]
+        return pd.DataFrame(rows, columns=columns)
+    return download
+
+def test_get_stock_prices_bulk(monkeypatch):
+    calls = []
+    closes = {f"T{i}": float(i) for i in range(250)}
+    use_fake_yfinance(monkeypatch, fake_download(calls, closes))
+
+    prices = get_stock_prices([f"T{i}" for i in range(250)] + ["T1", "NOPE"])
+
+    assert len(calls) == 2
+    assert prices["T7"] == 7.0
+    assert "NOPE" not in prices.index
+    assert len(prices) == 250
+
+def test_prices_are_served_from_cache(monkeypatch):
+    calls = []
+    use_fake_cmc(monkeypatch, fake_quotes_latest(calls, {"BTC": ("Bitcoin", 60000.0)}))
+
+    assert get_crypto_prices(["BTC"])["BTC"] == 60000.0
+    assert validate_crypto("BTC") == (True, "Bitcoin")
+    assert get_crypto_prices(["btc"])["BTC"] == 60000.0
+
+    assert len(calls) == 1
+    assert project.price_cache.hits == 2
+
+def test_display_portfolio_survives_failing_provider(monkeypatch, capsys):
+    def broken_quotes(*args, **kwargs):
+        raise ConnectionError("CMC is down")
+    use_fake_cmc(monkeypatch, broken_quotes)
+    use_fake_yfinance(monkeypatch, fake_download([], {"AAPL": 200.0}))
+
+    portfolio = Portfolio("Test Portfolio")
+    portfolio.stocks["AAPL"] = {'shares': 2, 'buy_price': 150}
+    portfolio.crypto["BTC"] = {'amount': 1, 'buy_price': 30000}
+
+    assert project.display_portfolio(portfolio) == 400.0
+    assert "no price for 'BTC'" in capsys.readouterr().out
+
+def test_trades_are_saved_as_they_happen(tmp_path, monkeypatch):
+    monkeypatch.setattr(project, "validate_ticker", lambda ticker: (True, "Apple Inc."))
+    store = project.PortfolioStore(str(tmp_path / "portfolios.db"))
+    portfolio = Portfolio("Test Portfolio", store=store)
+
+    add_stock(portfolio, "AAPL", 5, 150, confirmation='y')
+    sell_stock(portfolio, "AAPL", 2, 200)
+    portfolio.name = "Renamed"
+
+    loaded = project.load_portfolios(store)
+    assert list(loaded) == ["Renamed"]
+    assert loaded["Renamed"].stocks["AAPL"] == {'shares': 3, 'buy_price': 150, 'realised_pnl': 100}
+
+def test_trades_are_recorded_in_ledger(tmp_path, monkeypatch):
+    monkeypatch.setattr(project, "validate_ticker", lambda ticker: (True, "Apple Inc."))
+    store = project.PortfolioStore(str(tmp_path / "portfolios.db"))
+    portfolio = Portfolio("Test Portfolio", store=store)
+
+    add_stock(portfolio, "AAPL", 10, 100, confirmation='y')
+    add_stock(portfolio, "AAPL", 10, 200, confirmation='y')
+    sell_stock(portfolio, "AAPL", 10, 250)
+
+    # Reloaded from the store, the ledger can replay the fills with any lot method
+    reloaded = project.load_portfolios(store)["Test Portfolio"]
+    assert len(reloaded.stock_ledger) == 3
+    assert reloaded.stock_ledger.positions('fifo').as_dict()["AAPL"]['realised_pnl'] == 1500
+    assert reloaded.stock_ledger.positions('average').as_dict()["AAPL"]['realised_pnl'] == 1000
+    assert reloaded.stocks["AAPL"]['realised_pnl'] == 1000
+
+def test_validation_uses_symbol_index(monkeypatch):
+    calls = []
+    use_fake_cmc(monkeypatch, fake_quotes_latest(calls, {"BTC": ("Bitcoin", 60000.0)}))
+    project.symbol_index.add('crypto', "ETH", "Ethereum")
+    project.symbol_index.add('stock', "AAPL", "Apple Inc.", "NMS")
+
+    assert validate_crypto("ETH") == (True, "Ethereum")
+    assert validate_ticker("AAPL") == (True, "Apple Inc.")
+    assert calls == []
+
+    # Unknown symbols go to the network once and are then remembered
+    project.price_cache.clear()
+    assert validate_crypto("BTC") == (True, "Bitcoin")
+    assert project.symbol_index.lookup('crypto', "BTC")['name'] == "Bitcoin"
+    assert len(calls) == 1
+
+def test_reporting_currency(monkeypatch, capsys):
+    monkeypatch.setenv("REPORTING_CURRENCY", "EUR")
+    portfolio = Portfolio("Global")
+    portfolio.stocks["AAPL"] = {'shares': 1, 'buy_price': 110.0}
+    portfolio.stocks["VOD.L"] = {'shares': 100, 'buy_price': 0.88}
+
+    # GBP and EUR come in one batch, then from the cache
+    result = project.fetch_prices(portfolio)
+    assert result.get('fx') == {'GBP': 1.25, 'EUR': 1.1}
+    assert project.fx_provider.calls == 1
+    project.fetch_prices(portfolio)
+    assert project.fx_provider.calls == 1
+
+    total = project.display_portfolio(portfolio)
+    assert total == pytest.approx(227.55 / 1.1 + 100 * 0.725 * 1.25 / 1.1)
+    assert "Total portfolio value for 'Global': €" in capsys.readouterr().out
+
+    # Yahoo says this London ETF is quoted in dollars, so it isn't read as pence
+    portfolio.stocks["CSPX.L"] = {'shares': 2, 'buy_price': 500.0}
+    result = project.fetch_prices(portfolio)
+    assert project.stock_provider.calls
+    assert fx.ticker_currency("CSPX.L") == ('USD', 1.0)
+    assert fx.ticker_currency("VOD.L") == ('GBP', 0.01)
+    assert project.display_portfolio(portfolio) == pytest.approx(
+        (227.55 + 2 * 550.0) / 1.1 + 100 * 0.725 * 1.25 / 1.1)
+    capsys.readouterr()
+    del portfolio.stocks["CSPX.L"]
+
+    # No rate for the reporting currency: shown in USD with a warning
+    monkeypatch.setenv("REPORTING_CURRENCY", "CHF")
+    assert project.display_portfolio(portfolio) == pytest.approx(227.55 + 100 * 0.725 * 1.25)
+    assert "No exchange rate for CHF" in capsys.readouterr().out
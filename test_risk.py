@@ -0,0 +1,112 @@
+import time
+from statistics import NormalDist
+
+import numpy as np
+import pytest
+
+from fx import FXRates
+from history import BAR_DTYPE, HistoryStore
+from risk import DAYS_PER_YEAR, RiskEngine
+
+FIRST_DAY = 19000
+
+class Holdings:
+    def __init__(self, stocks, crypto):
+        self.name = "Test"
+        self.stocks = stocks
+        self.crypto = crypto
+
+def write_closes(store, asset_class, symbol, closes, first_day=FIRST_DAY):
+    bars = np.zeros(len(closes), dtype=BAR_DTYPE)
+    bars['day'] = np.arange(first_day, first_day + len(closes))
+    bars['close'] = closes
+    store.write(asset_class, symbol, bars, first_day, first_day + len(closes) - 1)
+
+def random_closes(rng, days, volatility):
+    return 100 * np.cumprod(1 + rng.normal(0, volatility, days))
+
+def test_report_matches_numpy(tmp_path):
+    rng = np.random.default_rng(1)
+    store = HistoryStore(str(tmp_path))
+    aapl, btc = random_closes(rng, 500, 0.01), random_closes(rng, 500, 0.04)
+    write_closes(store, 'stock', "AAPL", aapl)
+    write_closes(store, 'crypto', "BTC", btc)
+    portfolio = Holdings({"AAPL": {'shares': 10, 'buy_price': 1}}, {"BTC": {'amount': 2, 'buy_price': 1}})
+
+    report = RiskEngine(store).report(portfolio, FIRST_DAY, FIRST_DAY + 499, {"AAPL": 100.0}, {"BTC": 50.0})
+    returns = np.column_stack([aapl[1:] / aapl[:-1] - 1, btc[1:] / btc[:-1] - 1])
+    value = np.array([1000.0, 100.0])
+
+    assert report.observations == 499
+    assert report.volatility == pytest.approx(returns.std(axis=0, ddof=1) * np.sqrt(DAYS_PER_YEAR))
+    assert report.correlation[0, 1] == pytest.approx(np.corrcoef(returns, rowvar=False)[0, 1])
+    sigma = np.sqrt(value @ np.cov(returns, rowvar=False) @ value)
+    assert report.var_parametric == pytest.approx(NormalDist().inv_cdf(0.95) * sigma)
+    assert report.var_historical == pytest.approx(-np.percentile(returns @ value, 5))
+    assert report.weights.sum() == pytest.approx(1.0)
+
+def test_report_in_reporting_currency(tmp_path):
+    rng = np.random.default_rng(3)
+    store = HistoryStore(str(tmp_path))
+    write_closes(store, 'stock', "VOD.L", random_closes(rng, 100, 0.01))
+    write_closes(store, 'stock', "AAPL", random_closes(rng, 100, 0.01))
+    portfolio = Holdings({"VOD.L": {'shares': 100, 'buy_price': 1}, "AAPL": {'shares': 1, 'buy_price': 1}}, {})
+    engine = RiskEngine(store)
+
+    usd = engine.report(portfolio, FIRST_DAY, FIRST_DAY + 99, {"VOD.L": 80.0, "AAPL": 100.0}, {})
+    report = engine.report(portfolio, FIRST_DAY, FIRST_DAY + 99, {"VOD.L": 80.0, "AAPL": 100.0}, {},
+                           fx=FXRates({'GBP': 1.25}))
+    assert report is not usd
+    # Pence converted into dollars: 100 * 0.80 GBP * 1.25
+    assert list(report.value) == pytest.approx([100.0, 100.0])
+    assert report.currency == 'USD' and report.to_dict()['currency'] == 'USD'
+
+    euros = engine.report(portfolio, FIRST_DAY, FIRST_DAY + 99, {"VOD.L": 80.0, "AAPL": 100.0}, {},
+                          fx=FXRates({'GBP': 1.25, 'EUR': 1.25}, 'EUR'))
+    assert euros.currency == 'EUR'
+    assert euros.var_parametric == pytest.approx(report.var_parametric / 1.25)
+
+def test_window_missing_and_cache(tmp_path):
+    rng = np.random.default_rng(2)
+    store = HistoryStore(str(tmp_path))
+    write_closes(store, 'stock', "AAPL", random_closes(rng, 100, 0.01))
+    # ETH only listed 40 days into the window
+    write_closes(store, 'crypto', "ETH", random_closes(rng, 60, 0.03), FIRST_DAY + 40)
+    portfolio = Holdings({"AAPL": {'shares': 1, 'buy_price': 1}, "NEW": {'shares': 1, 'buy_price': 1}},
+                         {"ETH": {'amount': 1, 'buy_price': 1}})
+
+    engine = RiskEngine(store)
+    report = engine.report(portfolio, FIRST_DAY, FIRST_DAY + 99)
+    assert report.symbols == ["AAPL", "ETH"]
+    assert report.missing == ["NEW"]
+    assert report.observations == 59
+    assert report.to_dict()['assets'][1]['symbol'] == "ETH"
+
+    assert engine.report(portfolio, FIRST_DAY, FIRST_DAY + 99) is report
+    assert (engine.hits, engine.misses) == (1, 1)
+
+    # Newly stored bars invalidate the cached returns and reports
+    write_closes(store, 'stock', "NEW", random_closes(rng, 100, 0.01))
+    assert engine.report(portfolio, FIRST_DAY, FIRST_DAY + 99).symbols == ["AAPL", "NEW", "ETH"]
+    assert engine.misses == 2
+
+def test_hundreds_of_assets_over_years(tmp_path):
+    rng = np.random.default_rng(3)
+    store = HistoryStore(str(tmp_path))
+    stocks = {}
+    for number in range(300):
+        symbol = f"S{number:03d}"
+        write_closes(store, 'stock', symbol, random_closes(rng, 3 * 365, 0.02))
+        stocks[symbol] = {'shares': 1, 'buy_price': 1}
+    engine = RiskEngine(store)
+    engine.returns([('stock', symbol) for symbol in stocks], FIRST_DAY, FIRST_DAY + 3 * 365 - 1)
+
+    started = time.perf_counter()
+    report = engine.report(Holdings(stocks, {}), FIRST_DAY, FIRST_DAY + 3 * 365 - 1)
+    assert time.perf_counter() - started < 0.5
+    assert report.covariance.shape == (300, 300)
+    assert np.isfinite(report.var_historical)
+
+def test_invalid_confidence(tmp_path):
+    with pytest.raises(ValueError):
+        RiskEngine(HistoryStore(str(tmp_path))).report(Holdings({}, {}), FIRST_DAY, FIRST_DAY + 10, confidence=1.5)
@@ -0,0 +1,167 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+import project
+from fetch_engine import FetchResult
+from server import HTTPError, PortfolioServer, PriceCoalescer
+
+PRICES = {'stock': {"AAPL": 200.0, "MSFT": 400.0}, 'crypto': {"BTC": 40000.0}}
+
+class SlowFetch:
+    # Stand-in upstream: answers from PRICES after a delay and counts the calls
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, wanted):
+        with self._lock:
+            self.calls.append({provider: sorted(symbols) for provider, symbols in wanted.items()})
+        time.sleep(self.delay)
+        result = FetchResult()
+        for provider, symbols in wanted.items():
+            result.prices[provider] = {symbol: PRICES[provider][symbol] for symbol in symbols if symbol in PRICES[provider]}
+            result.errors[provider] = {symbol: "unknown" for symbol in symbols if symbol not in PRICES[provider]}
+        return result
+
+@pytest.fixture
+def portfolios(tmp_path, monkeypatch):
+    monkeypatch.setattr(project, "validate_ticker", lambda ticker: (ticker != "NOPE", ticker))
+    monkeypatch.setenv("REPORTING_CURRENCY", "USD")
+    store = project.PortfolioStore(str(tmp_path / "portfolios.db"))
+    store.save_holding("Growth", 'stocks', "AAPL", {'shares': 2, 'buy_price': 150})
+    store.save_holding("Growth", 'crypto', "BTC", {'amount': 1, 'buy_price': 30000})
+    store.save_holding("Income", 'stocks', "MSFT", {'shares': 1, 'buy_price': 300})
+    portfolios = project.load_portfolios(store)
+    portfolios.store = store
+    return portfolios
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+def test_concurrent_requests_share_one_fetch(portfolios):
+    fetch = SlowFetch()
+    server = PortfolioServer(portfolios, PriceCoalescer(fetch))
+
+    async def main():
+        responses = await asyncio.gather(*(server.dispatch('GET', "/portfolios/Growth") for _ in range(100)))
+        await server.close()
+        return responses
+
+    responses = run(main())
+    assert len(fetch.calls) == 1
+    assert fetch.calls[0] == {'stock': ["AAPL"], 'crypto': ["BTC"]}
+    assert all(status == 200 for status, _ in responses)
+    assert responses[0][1]['total_value'] == 40400.0
+
+def test_overlapping_requests_only_fetch_new_symbols(portfolios):
+    fetch = SlowFetch()
+    server = PortfolioServer(portfolios, PriceCoalescer(fetch))
+
+    async def main():
+        growth = asyncio.ensure_future(server.dispatch('GET', "/portfolios/Growth"))
+        await asyncio.sleep(0.01)
+        everything = await server.dispatch('GET', "/value?summary=1")
+        await growth
+        await server.close()
+        return everything
+
+    status, summary = run(main())
+    assert status == 200
+    assert summary['total_value'] == 40800.0
+    assert fetch.calls == [{'stock': ["AAPL"], 'crypto': ["BTC"]}, {'stock': ["MSFT"]}]
+
+def test_trades_are_applied_one_at_a_time(portfolios):
+    server = PortfolioServer(portfolios, PriceCoalescer(SlowFetch(0)))
+    trade = json.dumps({'asset_class': 'stock', 'symbol': "msft", 'side': 'buy', 'quantity': 1, 'price': 100}).encode()
+
+    async def main():
+        responses = await asyncio.gather(*(server.dispatch('POST', "/portfolios/Income/trades", trade) for _ in range(20)))
+        sell = await server.dispatch('POST', "/portfolios/Income/trades",
+                                     json.dumps({'asset_class': 'stock', 'symbol': "MSFT", 'side': 'sell',
+                                                 'quantity': 21, 'price': 500}).encode())
+        await server.close()
+        return responses, sell
+
+    responses, sell = run(main())
+    assert all(status == 201 for status, _ in responses)
+    assert sell == (201, {'message': "Sold all shares of MSFT. Realised PnL: $8,200.00. You no longer own any shares of MSFT.",
+                          'portfolio': "Income"})
+    # Every trade reached the store
+    assert len(list(portfolios.store.iter_trades("Income", 'stocks'))) == 21
+
+def test_errors(portfolios):
+    server = PortfolioServer(portfolios, PriceCoalescer(SlowFetch(0)))
+
+    async def main():
+        with pytest.raises(HTTPError) as missing:
+            await server.dispatch('GET', "/portfolios/Nope")
+        with pytest.raises(HTTPError) as method:
+            await server.dispatch('DELETE', "/portfolios")
+        with pytest.raises(HTTPError) as oversell:
+            await server.dispatch('POST', "/portfolios/Growth/trades",
+                                  b'{"asset_class": "stock", "symbol": "AAPL", "side": "sell", "quantity": 5, "price": 1}')
+        with pytest.raises(ValueError):
+            await server.dispatch('POST', "/portfolios/Growth/trades", b'{"asset_class": "bond"}')
+        await server.close()
+        return missing.value.status, method.value.status, oversell.value
+
+    missing, method, oversell = run(main())
+    assert (missing, method, oversell.status) == (404, 405, 400)
+    assert str(oversell) == "You only own 2.0 shares of 'AAPL', cannot sell 5.0."
+
+def test_http_keep_alive(portfolios):
+    server = PortfolioServer(portfolios, PriceCoalescer(SlowFetch(0)))
+
+    async def request(reader, writer, line, body=b''):
+        writer.write(f"{line} HTTP/1.1\r\nHost: test\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+        status = int((await reader.readline()).split()[1])
+        headers = {}
+        while (header := await reader.readline()) != b'\r\n':
+            name, _, value = header.decode().partition(':')
+            headers[name.lower()] = value.strip()
+        return status, json.loads(await reader.readexactly(int(headers['content-length'])))
+
+    async def main():
+        await server.start('127.0.0.1', 0)
+        reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+        responses = [
+            await request(reader, writer, "GET /portfolios"),
+            await request(reader, writer, "GET /portfolios/Income?currency=usd"),
+            await request(reader, writer, "GET /nowhere"),
+            await request(reader, writer, "POST /portfolios/Income/trades", b'not json')
+        ]
+        writer.close()
+        await server.close()
+        return responses
+
+    listing, income, missing, bad = run(main())
+    assert listing == (200, {'portfolios': ["Growth", "Income"]})
+    assert income[0] == 200 and income[1]['total_value'] == 400.0
+    assert missing[0] == 404
+    assert bad == (400, {'error': "body must be JSON"})
+
+def test_bad_content_length_closes_connection(portfolios):
+    server = PortfolioServer(portfolios, PriceCoalescer(SlowFetch(0)))
+
+    async def main():
+        await server.start('127.0.0.1', 0)
+        responses = []
+        for length in ("abc", "-5"):
+            reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+            # The unread body would otherwise be parsed as the next request
+            writer.write(f"POST /portfolios/Income/trades HTTP/1.1\r\nContent-Length: {length}\r\n\r\n"
+                         "GET /portfolios HTTP/1.1\r\n\r\n".encode())
+            responses.append(await reader.read())
+            writer.close()
+        await server.close()
+        return responses
+
+    for response in run(main()):
+        assert response.startswith(b"HTTP/1.1 400 ")
+        assert b"Connection: close" in response
+        assert response.count(b"HTTP/1.1") == 1
@@ -0,0 +1,163 @@
+import copy
+import json
+
+import numpy as np
+import pytest
+
+import batch
+import project
+from fx import FXRates
+from simulate import Snapshot, rebalance, simulate
+
+class Holdings:
+    def __init__(self, stocks, crypto):
+        self.stocks = stocks
+        self.crypto = crypto
+
+def sample_portfolio():
+    return Holdings(
+        {"AAPL": {'shares': 10, 'buy_price': 150, 'realised_pnl': 5}, "MSFT": {'shares': 4, 'buy_price': 300}},
+        {"BTC": {'amount': 0.5, 'buy_price': 40000}}
+    )
+
+PRICES = ({"AAPL": 200.0, "MSFT": 250.0}, {"BTC": 60000.0})
+
+def test_apply_leaves_portfolio_untouched():
+    portfolio = sample_portfolio()
+    before = copy.deepcopy((portfolio.stocks, portfolio.crypto))
+    snapshot = Snapshot.from_portfolio(portfolio, *PRICES)
+
+    after = snapshot.apply([('stock', "AAPL", -4), ('crypto', "BTC", 0.5)])
+
+    assert (portfolio.stocks, portfolio.crypto) == before
+    assert list(snapshot.quantity) == [10, 4, 0.5]
+    assert list(after.quantity) == [6, 4, 1.0]
+    # Symbols and prices are shared; the holdings arrays are new
+    assert after.symbols is snapshot.symbols and after.price is snapshot.price
+    assert not np.shares_memory(after.quantity, snapshot.quantity)
+    valuation = after.valuation()
+    assert valuation.realised_pnl[0] == 5 + 50 * 4
+    assert valuation.buy_price[2] == 50000.0
+
+    with pytest.raises(ValueError):
+        snapshot.apply([('stock', "MSFT", -5)])
+    with pytest.raises(ValueError):
+        snapshot.apply([('stock', "NVDA", 1)])
+
+def test_batch_matches_apply_buy_and_sell():
+    rng = np.random.default_rng(7)
+    portfolio = sample_portfolio()
+    snapshot = Snapshot.from_portfolio(portfolio, *PRICES)
+    delta = rng.uniform(-1, 1, (200, 3)) * snapshot.quantity
+    results = simulate(snapshot, delta)
+    assert results.valid.all()
+
+    for scenario in (0, 57, 199):
+        holdings = copy.deepcopy({**portfolio.stocks, **portfolio.crypto})
+        for index, symbol in enumerate(snapshot.symbols):
+            field = 'shares' if snapshot.asset_classes[index] == 'stock' else 'amount'
+            quantity, price = delta[scenario, index], snapshot.price[index]
+            if quantity > 0:
+                project.apply_buy(holdings, symbol, field, quantity, price)
+            elif quantity < 0:
+                project.apply_sell(holdings, symbol, field, -quantity, price)
+        valuation = results.snapshot(scenario).valuation()
+        for index, symbol in enumerate(snapshot.symbols):
+            field = 'shares' if snapshot.asset_classes[index] == 'stock' else 'amount'
+            assert valuation.quantity[index] == pytest.approx(holdings[symbol][field])
+            assert valuation.buy_price[index] == pytest.approx(holdings[symbol]['buy_price'])
+            assert valuation.realised_pnl[index] == pytest.approx(holdings[symbol].get('realised_pnl', 0))
+        assert results.unrealised_pnl[scenario] == pytest.approx(valuation.total_unrealised_pnl)
+        assert results.total_value[scenario] == pytest.approx(valuation.total_value)
+
+    oversold = simulate(snapshot, [[-11, 0, 0], [0, 0, 0]])
+    assert list(oversold.valid) == [False, True]
+
+def test_rebalance_to_targets():
+    snapshot = Snapshot.from_portfolio(sample_portfolio(), *PRICES)
+    snapshot = snapshot.with_assets([('stock', "NVDA", 100.0)])
+    total = 10 * 200 + 4 * 250 + 0.5 * 60000
+
+    results = rebalance(snapshot, [
+        {('stock', "AAPL"): 1, ('crypto', "BTC"): 1},
+        {('stock', "NVDA"): 1},
+        {('stock', "AAPL"): 1, ('stock', "MSFT"): 1, ('crypto', "BTC"): 1, ('stock', "NVDA"): 1}
+    ])
+
+    assert results.valid.all()
+    assert results.total_value == pytest.approx([total] * 3)
+    assert results.cash == pytest.approx([0.0] * 3, abs=1e-6)
+    assert results.weights[0] == pytest.approx([0.5, 0, 0.5, 0])
+    assert results.weights[1] == pytest.approx([0, 0, 0, 1])
+    assert results.quantity[1] == pytest.approx([0, 0, 0, total / 100])
+    # Selling everything books the gains (and the loss on MSFT) at the snapshot prices
+    assert results.trade_realised_pnl[1] == pytest.approx(10 * 50 - 4 * 50 + 0.5 * 20000)
+    assert results.unrealised_pnl[1] == pytest.approx(0.0)
+
+    assert rebalance(snapshot, [[0.25] * 4]).quantity[0] == pytest.approx(results.quantity[2])
+
+    plan = results.to_dict(1)
+    assert [trade['symbol'] for trade in plan['trades']] == ["AAPL", "MSFT", "BTC", "NVDA"]
+    assert plan['trades'][-1]['quantity'] == pytest.approx(total / 100)
+
+    with pytest.raises(ValueError):
+        rebalance(snapshot, {('stock', "TSLA"): 1})
+    with pytest.raises(ValueError):
+        rebalance(snapshot, {('crypto', "AAPL"): 1})
+    with pytest.raises(ValueError):
+        rebalance(snapshot, [[-1, 1, 1, 0]])
+
+def test_unpriced_holding_is_kept_out_of_pnl():
+    portfolio = sample_portfolio()
+    portfolio.stocks["DELISTED"] = {'shares': 3, 'buy_price': 10}
+    snapshot = Snapshot.from_portfolio(portfolio, *PRICES)
+
+    results = rebalance(snapshot, {('stock', "AAPL"): 1, ('crypto', "BTC"): 1})
+    plan = results.to_dict(0)
+
+    assert results.quantity[0][2] == 3
+    # MSFT sold out at a 50 loss per share, 0.225 BTC sold at a 20000 gain
+    assert results.trade_realised_pnl[0] == pytest.approx(-4 * 50 + 0.225 * 20000)
+    assert not np.isnan(results.total_realised_pnl).any()
+    json.loads(json.dumps(plan, allow_nan=False))
+
+def test_stock_and_crypto_with_the_same_ticker():
+    # A COMP share and a COMP token are separate holdings
+    portfolio = Holdings({"COMP": {'shares': 10, 'buy_price': 5}}, {"COMP": {'amount': 2, 'buy_price': 40}})
+    snapshot = Snapshot.from_portfolio(portfolio, {"COMP": 10.0}, {"COMP": 50.0})
+
+    results = rebalance(snapshot, {('crypto', "COMP"): 1})
+    assert list(results.quantity[0]) == pytest.approx([0, 4])
+    assert results.trade_realised_pnl[0] == pytest.approx(10 * 5)
+
+    results = rebalance(snapshot, {('stock', "COMP"): 3, ('crypto', "COMP"): 1})
+    assert list(results.weights[0]) == pytest.approx([0.75, 0.25])
+
+def test_snapshot_in_reporting_currency():
+    fx = FXRates({'EUR': 1.25}, target='EUR')
+    snapshot = Snapshot.from_portfolio(sample_portfolio(), *PRICES, fx)
+
+    assert snapshot.currency == 'EUR'
+    assert snapshot.price[0] == pytest.approx(160.0)
+    assert rebalance(snapshot, {('stock', "AAPL"): 1}).to_dict(0)['currency'] == 'EUR'
+
+def test_rebalance_command(tmp_path, monkeypatch, capsys):
+    store = project.PortfolioStore(str(tmp_path / "portfolios.db"))
+    store.save_holding("Growth", 'stocks', "AAPL", {'shares': 10, 'buy_price': 150})
+    store.save_holding("Growth", 'crypto', "BTC", {'amount': 0.1, 'buy_price': 40000})
+    monkeypatch.setattr(project, "open_portfolio_store", lambda: store)
+    requested = []
+    monkeypatch.setattr(project, "fetch_engine", project.FetchEngine([
+        project.Provider('stock', lambda tickers: requested.extend(tickers) or {"AAPL": 200.0, "NVDA": 100.0}),
+        project.Provider('crypto', lambda symbols: {"BTC": 60000.0})
+    ]))
+
+    assert batch.run(["rebalance", "Growth", "NVDA=1", "crypto:BTC=1", "--json"]) == 0
+    plan = json.loads(capsys.readouterr().out)
+    assert sorted(requested) == ["AAPL", "NVDA"]
+    assert plan['weights'] == {"AAPL": 0.0, "BTC": 0.5, "NVDA": 0.5}
+    assert plan['trade_realised_pnl'] == pytest.approx(10 * 50 + (0.1 - 4000 / 60000) * 20000)
+    # Nothing was traded for real
+    assert project.load_portfolios(store)["Growth"].stocks["AAPL"]['shares'] == 10
+
+    assert batch.run(["rebalance", "Growth", "AAPL=x"]) == 1
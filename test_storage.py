@@ -0,0 +1,76 @@
+import json
+import sqlite3
+
+import pytest
+
+from storage import PortfolioStore
+
+def test_holdings_round_trip(tmp_path):
+    store = PortfolioStore(str(tmp_path / "portfolios.db"))
+    store.create_portfolio("Growth")
+    store.save_holding("Growth", 'stocks', "AAPL", {'shares': 5, 'buy_price': 150.0})
+    store.save_holding("Growth", 'crypto', "BTC", {'amount': 0.5, 'buy_price': 30000.0, 'realised_pnl': 100.0})
+    store.close()
+
+    reopened = PortfolioStore(str(tmp_path / "portfolios.db"))
+    assert reopened.load() == {
+        "Growth": {
+            'stocks': {"AAPL": {'shares': 5, 'buy_price': 150.0}},
+            'crypto': {"BTC": {'amount': 0.5, 'buy_price': 30000.0, 'realised_pnl': 100.0}}
+        }
+    }
+
+def test_delete_and_rename(tmp_path):
+    store = PortfolioStore(str(tmp_path / "portfolios.db"))
+    store.save_holding("Old", 'stocks', "AAPL", {'shares': 5, 'buy_price': 150.0})
+    store.save_holding("Old", 'stocks', "MSFT", {'shares': 1, 'buy_price': 300.0})
+    store.save_holding("Old", 'stocks', "AAPL", None)
+    store.rename_portfolio("Old", "New")
+
+    assert store.load() == {"New": {'stocks': {"MSFT": {'shares': 1, 'buy_price': 300.0}}, 'crypto': {}}}
+
+def test_wal_mode(tmp_path):
+    store = PortfolioStore(str(tmp_path / "portfolios.db"))
+    assert store._connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+def test_migrate_json_once(tmp_path):
+    json_path = tmp_path / "portfolios.json"
+    json_path.write_text(json.dumps({
+        "Long term": {'stocks': {"AAPL": {'shares': 2, 'buy_price': 100}}, 'crypto': {}}
+    }))
+    store = PortfolioStore(str(tmp_path / "portfolios.db"))
+
+    assert store.migrate_json(str(json_path))
+    store.save_holding("Long term", 'stocks', "AAPL", None)
+    # A second start must not re-import the JSON over newer changes
+    assert not store.migrate_json(str(json_path))
+    assert store.load() == {"Long term": {'stocks': {}, 'crypto': {}}}
+
+def test_failed_migration_writes_nothing(tmp_path):
+    json_path = tmp_path / "portfolios.json"
+    json_path.write_text(json.dumps({
+        "Long term": {'stocks': {"AAPL": {'shares': 2, 'buy_price': 100}, "MSFT": {'shares': 1, 'buy_price': 300}},
+                      'crypto': {}}
+    }))
+    store = PortfolioStore(str(tmp_path / "portfolios.db"))
+    # Fail part way through writing the opening trades
+    store._connection.execute(
+        "CREATE TEMP TRIGGER crash BEFORE INSERT ON trades WHEN NEW.symbol = 'MSFT' "
+        "BEGIN SELECT RAISE(ABORT, 'crash'); END")
+
+    with pytest.raises(sqlite3.IntegrityError):
+        store.migrate_json(str(json_path))
+    assert store.load() == {}
+    assert store.get_meta('migrated_from_json') is None
+
+    # The rerun writes each opening trade once
+    store._connection.execute("DROP TRIGGER crash")
+    assert store.migrate_json(str(json_path))
+    assert [trade[0] for trade in store.iter_trades("Long term", 'stocks')] == ["AAPL", "MSFT"]
+
+def test_trades_survive_save_all(tmp_path):
+    store = PortfolioStore(str(tmp_path / "portfolios.db"))
+    store.save_holding_and_trade("Growth", 'stocks', "AAPL", {'shares': 5, 'buy_price': 150.0}, 5, 150.0, 1.0)
+    store.save_all({"Growth": {'stocks': {"AAPL": {'shares': 5, 'buy_price': 150.0}}, 'crypto': {}}})
+
+    assert list(store.iter_trades("Growth", 'stocks')) == [("AAPL", 5.0, 150.0, 1.0)]
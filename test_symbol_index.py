@@ -0,0 +1,85 @@
+import requests
+
+from symbol_index import SymbolIndex, fetch_crypto_listings, fetch_stock_listings, parse_nasdaq_directory
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def test_lookup_and_staleness():
+    clock = FakeClock()
+    index = SymbolIndex(max_age=60, clock=clock)
+    index.add('stock', "AAPL", "Apple Inc.", "NASDAQ")
+
+    assert index.lookup('stock', "AAPL")['name'] == "Apple Inc."
+    assert index.lookup('crypto', "AAPL") is None
+    clock.now += 61
+    assert index.lookup('stock', "AAPL") is None
+    assert index.get('stock', "AAPL")['exchange'] == "NASDAQ"
+
+def test_prefix_search():
+    index = SymbolIndex()
+    index.add_many('crypto', [("BTC", "Bitcoin", None), ("BCH", "Bitcoin Cash", None), ("ETH", "Ethereum", None)])
+    index.add('crypto', "BTCB", "Bitcoin BEP2")
+
+    assert [entry['symbol'] for entry in index.prefix('crypto', "b")] == ["BCH", "BTC", "BTCB"]
+    assert [entry['symbol'] for entry in index.prefix('crypto', "BT", limit=1)] == ["BTC"]
+
+def test_save_and_reload(tmp_path):
+    path = str(tmp_path / "symbols.json")
+    index = SymbolIndex(path)
+    index.add('stock', "MSFT", "Microsoft Corporation", "NASDAQ")
+    index.save()
+
+    reloaded = SymbolIndex(path)
+    assert len(reloaded) == 1
+    assert reloaded.lookup('stock', "MSFT")['name'] == "Microsoft Corporation"
+
+def test_crypto_listings_paginate_and_keep_best_ranked():
+    class Client:
+        def __init__(self):
+            self.pages = [
+                [{'symbol': "BTC", 'name': "Bitcoin"}, {'symbol': "USDT", 'name': "Tether", 'platform': {'name': "Ethereum"}}],
+                [{'symbol': "BTC", 'name': "Fake Bitcoin"}]
+            ]
+
+        def cryptocurrency_map(self, start, limit):
+            return self.pages.pop(0)
+
+    listings = list(fetch_crypto_listings(Client(), page_size=2))
+    assert listings == [("BTC", "Bitcoin", None), ("USDT", "Tether", "Ethereum")]
+
+def test_parse_nasdaq_directory():
+    text = (
+        "ACT Symbol|Security Name|Exchange|CQS Symbol|ETF|Round Lot Size|Test Issue|NASDAQ Symbol\n"
+        "BRK.B|Berkshire Hathaway Inc. Class B|N|BRK.B|N|100|N|BRK.B\n"
+        "ZXZZT|Test Issue|N|ZXZZT|N|100|Y|ZXZZT\n"
+        "File Creation Time: 0101202400:00|||||||\n"
+    )
+    assert list(parse_nasdaq_directory(text, 'Exchange')) == [("BRK-B", "Berkshire Hathaway Inc. Class B", "NYSE")]
+
+def test_stock_listings_use_a_plain_session(monkeypatch):
+    text = (
+        "ACT Symbol|Security Name|Exchange|CQS Symbol|ETF|Round Lot Size|Test Issue|NASDAQ Symbol\n"
+        "IBM|International Business Machines|N|IBM|N|100|N|IBM\n"
+    )
+    sessions = []
+
+    class FakeSession:
+        def __init__(self):
+            self.headers = {}
+            sessions.append(self)
+
+        def get(self, url, timeout):
+            response = requests.models.Response()
+            response.status_code = 200
+            response._content = text.encode()
+            return response
+
+    monkeypatch.setattr(requests, "Session", FakeSession)
+    listings = list(fetch_stock_listings())
+    assert ("IBM", "International Business Machines", "NYSE") in listings
+    assert len(sessions) == 1 and sessions[0].headers == {}
@@ -0,0 +1,64 @@
+import bench
+import project
+from timing import Timings
+
+def test_disabled_timings_record_nothing():
+    timings = Timings()
+    with timings.timed('fetch'):
+        pass
+    assert timings.summary() == {}
+
+def test_percentiles():
+    ticks = iter(range(0, 200, 1))
+    timings = Timings(clock=lambda: next(ticks))
+    timings.enable()
+    for _ in range(100):
+        with timings.timed('fetch'):
+            pass
+
+    stats = timings.summary()['fetch']
+    assert stats['count'] == 100
+    assert stats['total'] == 100
+    assert stats['p50'] == stats['p99'] == stats['max'] == 1
+    assert "fetch" in timings.report()
+
+def test_timer_decorator():
+    timings = Timings()
+    @timings.timer('add')
+    def add(a, b):
+        return a + b
+
+    assert add(1, 2) == 3
+    timings.enable()
+    assert add(2, 2) == 4
+    assert timings.summary()['add']['count'] == 1
+    assert add.__name__ == "add"
+
+def test_dump_to_file(tmp_path):
+    timings = Timings()
+    timings.enable()
+    timings.record('render', 0.5)
+    timings.dump(str(tmp_path / "timings.txt"))
+    assert "render" in (tmp_path / "timings.txt").read_text()
+
+def test_benchmark_runs_offline():
+    result = bench.benchmark(40, memory=True)
+
+    # 28 stocks and 12 crypto fit in one request each, plus one name lookup per traded stock
+    assert result['requests'] == 2 + 28
+    assert result['memory_peak'] > 0
+    for phase in ('persist', 'load', 'fetch', 'compute', 'render', 'add_stock', 'sell_stock'):
+        assert phase in result['phases']
+
+def test_benchmark_fx_stays_offline(monkeypatch):
+    monkeypatch.setenv("REPORTING_CURRENCY", "EUR")
+    monkeypatch.setattr(project, "fx_provider", None) # Any live FX request would fail
+    result = bench.benchmark(40, memory=False, render_limit=10)
+
+    # One more request, for the EUR rate
+    assert result['requests'] == 2 + 28 + 1
+    assert not result['rendered'] and 'render' not in result['phases']
+    assert "render" in bench.format_result(result)
+
+def test_startup_does_not_import_heavy_modules():
+    assert bench.startup_modules() == []
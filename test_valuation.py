@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+
+from fx import FXRates
+from valuation import value_holdings, value_portfolio, value_portfolios
+
+class Holdings:
+    def __init__(self, stocks, crypto):
+        self.stocks = stocks
+        self.crypto = crypto
+
+def test_value_portfolio():
+    portfolio = Holdings(
+        {"AAPL": {'shares': 2, 'buy_price': 150, 'realised_pnl': 10}},
+        {"BTC": {'amount': 0.5, 'buy_price': 40000}}
+    )
+    valuation = value_portfolio(portfolio, {"AAPL": 200.0}, {"BTC": 60000.0})
+
+    assert valuation.symbols == ["AAPL", "BTC"]
+    assert list(valuation.market_value) == [400.0, 30000.0]
+    assert list(valuation.unrealised_pnl) == [100.0, 10000.0]
+    assert valuation.unrealised_pnl_pct[1] == pytest.approx(50.0)
+    assert valuation.totals() == {
+        'total_value': 30400.0,
+        'total_cost': 20300.0,
+        'total_unrealised_pnl': 10100.0,
+        'total_realised_pnl': 10.0
+    }
+
+def test_missing_prices_are_excluded_from_totals():
+    portfolio = Holdings({"AAPL": {'shares': 2, 'buy_price': 150}}, {"BTC": {'amount': 1, 'buy_price': 1}})
+    valuation = value_portfolio(portfolio, {"AAPL": 200.0}, {})
+
+    assert valuation.missing == ["BTC"]
+    assert valuation.total_value == 400.0
+    assert valuation.to_dict()['assets'][1]['market_value'] is None
+
+def test_value_holdings_vectorized():
+    count = 10000
+    quantity = np.full(count, 2.0)
+    valuation = value_holdings([f"T{i}" for i in range(count)], ['stock'] * count,
+                               quantity, np.full(count, 10.0), np.zeros(count), np.full(count, 15.0))
+
+    assert valuation.total_value == 300000.0
+    assert valuation.total_unrealised_pnl == 100000.0
+    assert valuation.weights.sum() == pytest.approx(1.0)
+    assert valuation.to_frame().loc["T5", 'market_value'] == 30.0
+
+def test_value_portfolios_prices_each_symbol_once():
+    lookups = []
+    class CountingPrices(dict):
+        def get(self, symbol, default=None):
+            lookups.append(symbol)
+            return super().get(symbol, default)
+
+    portfolios = {
+        "Growth": Holdings({"AAPL": {'shares': 2, 'buy_price': 150}}, {"BTC": {'amount': 1, 'buy_price': 30000}}),
+        "Income": Holdings({"AAPL": {'shares': 3, 'buy_price': 100, 'realised_pnl': 5}}, {}),
+        "Empty": Holdings({}, {})
+    }
+    aggregate = value_portfolios(portfolios, CountingPrices({"AAPL": 200.0}), CountingPrices({"BTC": 40000.0}))
+
+    assert lookups == ["AAPL", "BTC"]
+    assert aggregate.symbols == ["AAPL", "BTC"]
+    assert list(aggregate.quantity) == [5.0, 1.0]
+    assert list(aggregate.market_value) == [1000.0, 40000.0]
+    assert list(aggregate.unrealised_pnl) == [1000.0 - 600.0, 10000.0]
+    assert aggregate.valuations["Income"].total_value == 600.0
+    assert aggregate.valuations["Empty"].total_value == 0.0
+    assert aggregate.totals() == {
+        'total_value': 41000.0,
+        'total_cost': 30600.0,
+        'total_unrealised_pnl': 10400.0,
+        'total_realised_pnl': 5.0
+    }
+    assert aggregate.exposures[1] == pytest.approx(40000 / 41000)
+    assert aggregate.exposure_by_asset_class() == {'stock': 1000.0, 'crypto': 40000.0}
+
+def test_value_portfolios_empty():
+    aggregate = value_portfolios({}, {}, {})
+    assert len(aggregate) == 0
+    assert aggregate.total_value == 0
+
+def test_value_portfolio_in_reporting_currency():
+    portfolio = Holdings(
+        {"AAPL": {'shares': 2, 'buy_price': 110}, "VOD.L": {'shares': 100, 'buy_price': 1.1, 'realised_pnl': 11}},
+        {"BTC": {'amount': 1, 'buy_price': 55000}}
+    )
+    # Crypto quoted in EUR already (as CMC does with convert=EUR); stocks in USD and pence
+    fx = FXRates({'EUR': 1.1, 'GBP': 1.25}, 'EUR', crypto_currency='EUR')
+    valuation = value_portfolio(portfolio, {"AAPL": 220.0, "VOD.L": 88.0}, {"BTC": 50000.0}, fx)
+
+    assert valuation.currency == 'EUR'
+    assert valuation.price.tolist() == pytest.approx([200.0, 1.0, 50000.0])
+    assert valuation.buy_price.tolist() == pytest.approx([100.0, 1.0, 50000.0])
+    assert valuation.total_value == pytest.approx(400 + 100 + 50000)
+    assert valuation.total_realised_pnl == pytest.approx(10.0)
+    assert valuation.to_dict()['currency'] == 'EUR'
+
+    aggregate = value_portfolios({"A": portfolio}, {"AAPL": 220.0, "VOD.L": 88.0}, {"BTC": 50000.0}, fx)
+    assert aggregate.total_value == pytest.approx(valuation.total_value)
+    assert aggregate.cost.tolist() == pytest.approx([200.0, 100.0, 50000.0])
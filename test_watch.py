@@ -0,0 +1,89 @@
+import io
+
+import pytest
+
+from fetch_engine import FetchResult
+from watch import LiveTable, PortfolioWatch, CURSOR_UP
+
+class Holdings:
+    def __init__(self, stocks, crypto):
+        self.name = "Test"
+        self.stocks = stocks
+        self.crypto = crypto
+
+def make_fetch(ticks):
+    # Return the next {provider: prices} of ticks on every call
+    ticks = iter(ticks)
+    def fetch():
+        result = FetchResult()
+        result.prices = next(ticks)
+        return result
+    return fetch
+
+def make_portfolio():
+    return Holdings(
+        {"AAPL": {'shares': 2, 'buy_price': 150}, "MSFT": {'shares': 1, 'buy_price': 300}},
+        {"BTC": {'amount': 0.5, 'buy_price': 40000}}
+    )
+
+def test_watch_revalues_only_changed_positions():
+    fetch = make_fetch([
+        {'stock': {"AAPL": 200.0, "MSFT": 310.0}, 'crypto': {"BTC": 60000.0}},
+        {'stock': {"AAPL": 200.0, "MSFT": 320.0}, 'crypto': {"BTC": 60000.0}},
+        {'stock': {"AAPL": 200.0, "MSFT": 320.0}, 'crypto': {"BTC": 60000.0}}
+    ])
+    out = io.StringIO()
+    watch = PortfolioWatch(make_portfolio(), refresh=1, fetch=fetch, out=out, ansi=True)
+
+    assert list(watch.tick()) == [0, 1, 2]
+    assert list(watch.tick()) == [1]
+    assert watch.valuation.total_value == pytest.approx(400 + 320 + 30000)
+    assert watch.valuation.total_unrealised_pnl == pytest.approx(100 + 20 + 10000)
+    assert list(watch.tick()) == []
+
+    # The MSFT row is rewritten in place, the AAPL row never is after the first draw
+    assert out.getvalue().count("AAPL") == 1
+    assert out.getvalue().count("MSFT") == 2
+    assert "$320.00 per share" in watch.table.lines[3]
+
+def test_watch_handles_prices_appearing():
+    fetch = make_fetch([
+        {'stock': {"AAPL": 200.0}, 'crypto': {}},
+        {'stock': {"AAPL": 200.0, "MSFT": 310.0}, 'crypto': {}}
+    ])
+    watch = PortfolioWatch(make_portfolio(), refresh=1, fetch=fetch, out=io.StringIO(), ansi=False)
+    watch.tick()
+    assert watch.valuation.total_value == 400.0
+
+    assert list(watch.tick()) == [1]
+    assert watch.valuation.total_value == 710.0
+    assert watch.valuation.missing == ["BTC"]
+
+def test_run_sleeps_for_the_rest_of_the_refresh():
+    ticks = [{'stock': {"AAPL": 200.0}, 'crypto': {}}] * 3
+    sleeps = []
+    watch = PortfolioWatch(make_portfolio(), refresh=5, fetch=make_fetch(ticks), out=io.StringIO(),
+                           ansi=False, clock=lambda: 0.0, sleep=sleeps.append)
+    watch.run(count=3)
+
+    assert watch.ticks == 3
+    assert sleeps == [5.0, 5.0]
+
+def test_live_table_rewrites_changed_lines_only():
+    out = io.StringIO()
+    table = LiveTable(["Asset", "Price"], out, ansi=True)
+    table.draw([["A", "1.00"], ["B", "2.00"]], ["Total: 3.00"])
+    out.truncate(0)
+    out.seek(0)
+
+    assert table.update({1: ["B", "2.50"]}, ["Total: 3.50"]) == 2
+    assert "A" not in out.getvalue()
+    assert CURSOR_UP.format(3) in out.getvalue() # Row B is 3 lines above the cursor
+
+def test_live_table_redraws_when_a_cell_grows():
+    out = io.StringIO()
+    table = LiveTable(["Asset", "Price"], out, ansi=True)
+    table.draw([["A", "1.00"]], ["Total"])
+    table.update({0: ["A", "1000.00"]}, ["Total"])
+
+    assert table.lines[2] == "A     | 1000.00"
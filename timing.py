@@ -0,0 +1,112 @@
+import atexit
+import functools
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+########################################################################
+# Opt-in timing hooks for the hot paths. Off by default, in which case
+# timed() costs one attribute check. Turn on with PORTFOLIO_TIMING=1
+# (report printed to stderr at exit) or PORTFOLIO_TIMING=<file> (report
+# written to that file), or call enable() from code.
+class Timings:
+    def __init__(self, clock=time.perf_counter):
+        self.enabled = False
+        self._clock = clock
+        self._samples = {} # name -> list of durations in seconds
+        self._lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self._samples = {}
+
+    def record(self, name, seconds):
+        with self._lock:
+            self._samples.setdefault(name, []).append(seconds)
+
+    @contextmanager
+    def timed(self, name):
+        # Time the body of a with-block under name.
+        if not self.enabled:
+            yield
+            return
+        started = self._clock()
+        try:
+            yield
+        finally:
+            self.record(name, self._clock() - started)
+
+    def timer(self, name):
+        # Decorator version of timed().
+        def decorate(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with self.timed(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def summary(self):
+        # {name: {'count', 'total', 'p50', 'p90', 'p99', 'max'}} in seconds.
+        import numpy as np
+
+        with self._lock:
+            samples = {name: list(values) for name, values in self._samples.items()}
+        results = {}
+        for name, values in samples.items():
+            values = np.asarray(values)
+            p50, p90, p99 = np.percentile(values, [50, 90, 99])
+            results[name] = {
+                'count': len(values),
+                'total': float(values.sum()),
+                'p50': float(p50),
+                'p90': float(p90),
+                'p99': float(p99),
+                'max': float(values.max())
+            }
+        return results
+
+    def report(self):
+        lines = [f"{'Timer':<28}{'Count':>8}{'Total':>12}{'p50':>12}{'p90':>12}{'p99':>12}{'Max':>12}"]
+        for name, stats in sorted(self.summary().items(), key=lambda item: -item[1]['total']):
+            lines.append(
+                f"{name:<28}{stats['count']:>8}"
+                + "".join(f"{stats[key] * 1000:>10.2f}ms" for key in ('total', 'p50', 'p90', 'p99', 'max'))
+            )
+        return "\n".join(lines)
+
+    def dump(self, destination=None):
+        # Write the report to a file path, or stderr when destination is None.
+        if not self._samples:
+            return
+        if destination:
+            with open(destination, 'w') as file:
+                file.write(self.report() + "\n")
+        else:
+            print(self.report(), file=sys.stderr)
+
+# Shared instance used by the instrumented functions
+timings = Timings()
+timed = timings.timed
+timer = timings.timer
+
+def enable_from_environment(value=None):
+    # Honour PORTFOLIO_TIMING; registers the exit dump when it is set.
+    value = os.getenv("PORTFOLIO_TIMING") if value is None else value
+    if not value or value == '0':
+        return False
+    timings.enable()
+    atexit.register(timings.dump, None if value == '1' else value)
+    return True
+
+enable_from_environment()
@@ -0,0 +1,291 @@
+import numpy as np
+
+from fx import BASE_CURRENCY
+from holdings import Holding
+
+# Asset classes and the holding field that stores their quantity
+QUANTITY_FIELDS = {'stock': 'shares', 'crypto': 'amount'}
+
+########################################################################
+# Result of valuing a set of holdings: one array entry per asset plus totals.
+# Assets without a price have NaN for every price-dependent column and are
+# left out of the totals. Every amount is in currency.
+class Valuation:
+    def __init__(self, symbols, asset_classes, quantity, buy_price, price, realised_pnl, currency=BASE_CURRENCY):
+        self.symbols = symbols # Attribute 1: list of symbols
+        self.asset_classes = asset_classes # Attribute 2: list of 'stock' / 'crypto'
+        self.quantity = quantity
+        self.buy_price = buy_price
+        self.price = price
+        self.realised_pnl = realised_pnl
+        self.currency = currency
+
+        # Per-asset metrics, all vectorized
+        self.priced = ~np.isnan(price)
+        self.cost = quantity * buy_price
+        self.market_value = quantity * price
+        self.unrealised_pnl = self.market_value - self.cost
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.unrealised_pnl_pct = np.where(self.cost != 0, self.unrealised_pnl / self.cost * 100, np.nan)
+
+        # Totals
+        self.total_value = float(np.nansum(self.market_value))
+        self.total_cost = float(self.cost[self.priced].sum())
+        self.total_unrealised_pnl = float(np.nansum(self.unrealised_pnl))
+        self.total_realised_pnl = float(realised_pnl.sum())
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def update_prices(self, indices, prices):
+        # Re-value only the assets at indices with their new prices.
+        # Totals are adjusted by the change instead of being summed again.
+        indices = np.asarray(indices, dtype=np.intp)
+        prices = np.asarray(prices, dtype=np.float64)
+        old_value = np.nan_to_num(self.market_value[indices]).sum()
+        old_unrealised = np.nan_to_num(self.unrealised_pnl[indices]).sum()
+        old_cost = self.cost[indices][self.priced[indices]].sum()
+
+        self.price[indices] = prices
+        self.priced[indices] = ~np.isnan(prices)
+        self.market_value[indices] = self.quantity[indices] * prices
+        self.unrealised_pnl[indices] = self.market_value[indices] - self.cost[indices]
+        cost = self.cost[indices]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.unrealised_pnl_pct[indices] = np.where(cost != 0, self.unrealised_pnl[indices] / cost * 100, np.nan)
+
+        self.total_value += float(np.nan_to_num(self.market_value[indices]).sum() - old_value)
+        self.total_unrealised_pnl += float(np.nan_to_num(self.unrealised_pnl[indices]).sum() - old_unrealised)
+        self.total_cost += float(self.cost[indices][self.priced[indices]].sum() - old_cost)
+
+    @property
+    def missing(self):
+        # Symbols that had no price.
+        return [symbol for symbol, priced in zip(self.symbols, self.priced) if not priced]
+
+    @property
+    def weights(self):
+        # Share of total value held in each asset.
+        if self.total_value == 0:
+            return np.zeros(len(self.symbols))
+        return np.nan_to_num(self.market_value) / self.total_value
+
+    def totals(self):
+        return {
+            'total_value': self.total_value,
+            'total_cost': self.total_cost,
+            'total_unrealised_pnl': self.total_unrealised_pnl,
+            'total_realised_pnl': self.total_realised_pnl
+        }
+
+    def to_frame(self):
+        # Per-asset metrics as a pandas DataFrame indexed by symbol.
+        import pandas as pd
+
+        return pd.DataFrame({
+            'asset_class': self.asset_classes,
+            'quantity': self.quantity,
+            'price': self.price,
+            'market_value': self.market_value,
+            'buy_price': self.buy_price,
+            'unrealised_pnl': self.unrealised_pnl,
+            'unrealised_pnl_pct': self.unrealised_pnl_pct,
+            'realised_pnl': self.realised_pnl
+        }, index=pd.Index(self.symbols, name='symbol'))
+
+    def to_dict(self):
+        # Plain-Python version for JSON output; NaN becomes None.
+        def clean(value):
+            value = float(value)
+            return None if np.isnan(value) else value
+
+        assets = []
+        for index, symbol in enumerate(self.symbols):
+            assets.append({
+                'symbol': symbol,
+                'asset_class': self.asset_classes[index],
+                'quantity': clean(self.quantity[index]),
+                'price': clean(self.price[index]),
+                'market_value': clean(self.market_value[index]),
+                'buy_price': clean(self.buy_price[index]),
+                'unrealised_pnl': clean(self.unrealised_pnl[index]),
+                'unrealised_pnl_pct': clean(self.unrealised_pnl_pct[index]),
+                'realised_pnl': clean(self.realised_pnl[index])
+            })
+        return {'currency': self.currency, 'assets': assets, **self.totals()}
+
+########################################################################
+def holdings_arrays(stocks, crypto):
+    # Flatten Portfolio.stocks / Portfolio.crypto dicts into aligned arrays.
+    symbols = list(stocks) + list(crypto)
+    asset_classes = ['stock'] * len(stocks) + ['crypto'] * len(crypto)
+    count = len(symbols)
+    quantity = np.empty(count)
+    buy_price = np.empty(count)
+    realised_pnl = np.empty(count)
+
+    for index, data in enumerate(list(stocks.values()) + list(crypto.values())):
+        if isinstance(data, Holding):
+            # Read the slots directly rather than through the dict interface
+            quantity[index] = data.quantity
+            buy_price[index] = data.buy_price
+            realised_pnl[index] = data.realised_pnl or 0
+            continue
+        quantity[index] = data[QUANTITY_FIELDS[asset_classes[index]]]
+        buy_price[index] = data['buy_price']
+        realised_pnl[index] = data.get('realised_pnl', 0)
+    return symbols, asset_classes, quantity, buy_price, realised_pnl
+
+def price_vector(symbols, asset_classes, stock_prices, crypto_prices):
+    # Line up {symbol: price} lookups with the holdings; missing prices become NaN.
+    price = np.full(len(symbols), np.nan)
+    for index, symbol in enumerate(symbols):
+        if asset_classes[index] == 'stock':
+            value = stock_prices.get(symbol)
+        else:
+            value = crypto_prices.get(symbol.upper())
+        if value is not None:
+            price[index] = value
+    return price
+
+def value_holdings(symbols, asset_classes, quantity, buy_price, realised_pnl, price, currency=BASE_CURRENCY):
+    # Value holdings against a price vector aligned with them.
+    return Valuation(
+        list(symbols), list(asset_classes),
+        np.asarray(quantity, dtype=np.float64),
+        np.asarray(buy_price, dtype=np.float64),
+        np.asarray(price, dtype=np.float64),
+        np.asarray(realised_pnl, dtype=np.float64),
+        currency
+    )
+
+def convert_holdings(fx, symbols, asset_classes, buy_price, realised_pnl, price):
+    # Take quoted prices and the USD buy prices / realised PnL into fx.target, one
+    # multiply per array. Returns (buy_price, realised_pnl, price).
+    if fx is None:
+        return buy_price, realised_pnl, price
+    base = fx.factor(BASE_CURRENCY)
+    return buy_price * base, realised_pnl * base, price * fx.price_factors(symbols, asset_classes)
+
+def value_portfolio(portfolio, stock_prices, crypto_prices, fx=None):
+    # Value a Portfolio using {symbol: price} mappings (or pandas Series) for stocks and crypto.
+    # With fx (an FXRates), everything is converted into fx.target; otherwise prices are taken as USD.
+    symbols, asset_classes, quantity, buy_price, realised_pnl = holdings_arrays(portfolio.stocks, portfolio.crypto)
+    price = price_vector(symbols, asset_classes, stock_prices, crypto_prices)
+    buy_price, realised_pnl, price = convert_holdings(fx, symbols, asset_classes, buy_price, realised_pnl, price)
+    return value_holdings(symbols, asset_classes, quantity, buy_price, realised_pnl, price,
+                          BASE_CURRENCY if fx is None else fx.target)
+
+########################################################################
+# Valuation of many portfolios at once. Every (asset class, symbol) held
+# anywhere is priced once; each portfolio indexes into that shared price
+# vector, and the consolidated exposures are summed per symbol with bincount.
+class AggregateValuation:
+    def __init__(self, valuations, symbols, asset_classes, quantity, price, cost, currency=BASE_CURRENCY):
+        self.valuations = valuations # Attribute 1: {portfolio name: Valuation}
+        self.symbols = symbols # Attribute 2: unique symbols across all portfolios
+        self.asset_classes = asset_classes
+        self.quantity = quantity # Total held across portfolios
+        self.price = price
+        self.cost = cost
+        self.currency = currency
+
+        self.priced = ~np.isnan(price)
+        self.market_value = quantity * price
+        self.unrealised_pnl = self.market_value - cost
+
+        self.total_value = sum(valuation.total_value for valuation in valuations.values())
+        self.total_cost = sum(valuation.total_cost for valuation in valuations.values())
+        self.total_unrealised_pnl = sum(valuation.total_unrealised_pnl for valuation in valuations.values())
+        self.total_realised_pnl = sum(valuation.total_realised_pnl for valuation in valuations.values())
+
+    def __len__(self):
+        return len(self.symbols)
+
+    @property
+    def missing(self):
+        return [symbol for symbol, priced in zip(self.symbols, self.priced) if not priced]
+
+    @property
+    def exposures(self):
+        # Share of the combined value held in each symbol.
+        if self.total_value == 0:
+            return np.zeros(len(self.symbols))
+        return np.nan_to_num(self.market_value) / self.total_value
+
+    def exposure_by_asset_class(self):
+        values = {}
+        for asset_class, value in zip(self.asset_classes, np.nan_to_num(self.market_value)):
+            values[asset_class] = values.get(asset_class, 0.0) + float(value)
+        return values
+
+    def totals(self):
+        return {
+            'total_value': self.total_value,
+            'total_cost': self.total_cost,
+            'total_unrealised_pnl': self.total_unrealised_pnl,
+            'total_realised_pnl': self.total_realised_pnl
+        }
+
+    def to_dict(self):
+        def clean(value):
+            value = float(value)
+            return None if np.isnan(value) else value
+
+        exposures = self.exposures
+        assets = []
+        for index, symbol in enumerate(self.symbols):
+            assets.append({
+                'symbol': symbol,
+                'asset_class': self.asset_classes[index],
+                'quantity': clean(self.quantity[index]),
+                'price': clean(self.price[index]),
+                'market_value': clean(self.market_value[index]),
+                'unrealised_pnl': clean(self.unrealised_pnl[index]),
+                'exposure': clean(exposures[index])
+            })
+        return {
+            'currency': self.currency,
+            'portfolios': {name: valuation.totals() for name, valuation in self.valuations.items()},
+            'assets': assets,
+            'asset_classes': self.exposure_by_asset_class(),
+            **self.totals()
+        }
+
+def value_portfolios(portfolios, stock_prices, crypto_prices, fx=None):
+    # Value a {name: Portfolio} mapping in one pass over the unique symbols.
+    # fx converts into a reporting currency as in value_portfolio.
+    base = 1.0 if fx is None else fx.factor(BASE_CURRENCY)
+    currency = BASE_CURRENCY if fx is None else fx.target
+    keys = {} # (asset_class, symbol) -> index into the unique arrays
+    holdings = {}
+    for name, portfolio in portfolios.items():
+        symbols, asset_classes, quantity, buy_price, realised_pnl = holdings_arrays(portfolio.stocks, portfolio.crypto)
+        ids = np.fromiter(
+            (keys.setdefault((asset_class, symbol), len(keys)) for symbol, asset_class in zip(symbols, asset_classes)),
+            dtype=np.intp, count=len(symbols))
+        holdings[name] = (symbols, asset_classes, quantity, buy_price * base, realised_pnl * base, ids)
+
+    unique_classes = [asset_class for asset_class, _ in keys]
+    unique_symbols = [symbol for _, symbol in keys]
+    unique_price = price_vector(unique_symbols, unique_classes, stock_prices, crypto_prices)
+    if fx is not None:
+        unique_price = unique_price * fx.price_factors(unique_symbols, unique_classes)
+
+    valuations = {}
+    for name, (symbols, asset_classes, quantity, buy_price, realised_pnl, ids) in holdings.items():
+        valuations[name] = value_holdings(symbols, asset_classes, quantity, buy_price, realised_pnl, unique_price[ids],
+                                          currency)
+
+    # Consolidate every portfolio's positions per unique symbol
+    if holdings:
+        all_ids = np.concatenate([entry[5] for entry in holdings.values()])
+        all_quantity = np.concatenate([entry[2] for entry in holdings.values()])
+        all_cost = np.concatenate([entry[2] * entry[3] for entry in holdings.values()])
+    else:
+        all_ids, all_quantity, all_cost = np.empty(0, dtype=np.intp), np.empty(0), np.empty(0)
+    total_quantity = np.bincount(all_ids, weights=all_quantity, minlength=len(keys))
+    total_cost = np.bincount(all_ids, weights=all_cost, minlength=len(keys))
+
+    return AggregateValuation(valuations, unique_symbols, unique_classes, total_quantity, unique_price, total_cost,
+                              currency)
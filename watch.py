@@ -0,0 +1,191 @@
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+import project
+from fx import BASE_CURRENCY
+from valuation import convert_holdings, holdings_arrays, price_vector, value_holdings
+
+# ANSI escape sequences used to rewrite single lines in place
+CURSOR_UP = "\x1b[{}F" # Up n lines, to column 1
+CURSOR_DOWN = "\x1b[{}E" # Down n lines, to column 1
+CLEAR_LINE = "\x1b[2K"
+CLEAR_BELOW = "\x1b[J"
+
+DEFAULT_REFRESH = 5.0
+
+########################################################################
+# Fixed-width table drawn once and then patched line by line. On a
+# terminal only the lines whose text changed are rewritten; elsewhere
+# (pipes, files) the whole table is printed again when anything changes.
+class LiveTable:
+    def __init__(self, headers, out=None, ansi=None):
+        self._headers = headers # Attribute 1: column headers
+        self._out = out or sys.stdout # Attribute 2: stream to draw on
+        self._ansi = self._out.isatty() if ansi is None else ansi
+        self._rows = []
+        self._footer = []
+        self._widths = []
+        self._lines = [] # Lines currently on screen
+        self.lines_written = 0
+
+    @property
+    def lines(self):
+        return list(self._lines)
+
+    def _format(self, cells):
+        # First column left-aligned, the rest right-aligned
+        parts = [cells[0].ljust(self._widths[0])]
+        parts += [cell.rjust(width) for cell, width in zip(cells[1:], self._widths[1:])]
+        return " | ".join(parts)
+
+    def _render(self):
+        separator = "-+-".join("-" * width for width in self._widths)
+        lines = [self._format(self._headers), separator]
+        lines += [self._format(row) for row in self._rows]
+        lines.append(separator)
+        return lines + self._footer
+
+    def draw(self, rows, footer):
+        # Draw the whole table, replacing whatever this table drew before.
+        self._rows = [list(row) for row in rows]
+        self._footer = list(footer)
+        self._widths = [
+            max([len(header)] + [len(row[column]) for row in self._rows])
+            for column, header in enumerate(self._headers)
+        ]
+        if self._ansi and self._lines:
+            self._out.write(CURSOR_UP.format(len(self._lines)) + CLEAR_BELOW)
+        self._lines = self._render()
+        self._out.write("\n".join(self._lines) + "\n")
+        self._out.flush()
+        self.lines_written += len(self._lines)
+
+    def update(self, rows, footer):
+        # Apply {row index: cells} and a new footer; returns the number of lines rewritten.
+        for index, cells in rows.items():
+            self._rows[index] = list(cells)
+        fits = all(
+            len(cell) <= width
+            for index in rows
+            for cell, width in zip(self._rows[index], self._widths)
+        )
+        if not fits or len(footer) != len(self._footer):
+            self.draw(self._rows, footer)
+            return len(self._lines)
+        self._footer = list(footer)
+
+        lines = self._render()
+        changed = [number for number, (old, new) in enumerate(zip(self._lines, lines)) if old != new]
+        if not changed:
+            return 0
+        if not self._ansi:
+            self._lines = lines
+            self._out.write("\n".join(lines) + "\n")
+            self._out.flush()
+            self.lines_written += len(lines)
+            return len(lines)
+
+        # The cursor sits on the line below the table; jump up to each changed line and back
+        for number in changed:
+            distance = len(lines) - number
+            self._out.write(CURSOR_UP.format(distance) + CLEAR_LINE + lines[number] + CURSOR_DOWN.format(distance))
+        self._out.flush()
+        self._lines = lines
+        self.lines_written += len(changed)
+        return len(changed)
+
+########################################################################
+# Live view of one portfolio. Every tick the prices are fetched through the
+# shared price cache, so ticks faster than the cache TTL cost no API calls;
+# only positions whose price moved are re-valued and redrawn. With an
+# AlertEngine, its rules are checked against every tick's prices and the
+# latest alert is shown under the totals.
+class PortfolioWatch:
+    def __init__(self, portfolio, refresh=DEFAULT_REFRESH, fetch=None, out=None, ansi=None,
+                 clock=time.monotonic, sleep=time.sleep, alerts=None):
+        if refresh <= 0:
+            raise ValueError("refresh must be greater than 0")
+        self._portfolio = portfolio # Attribute 1: Portfolio being watched
+        self._refresh = refresh # Attribute 2: seconds between ticks
+        extra = alerts.price_symbols() if alerts is not None else None
+        self._fetch = fetch or (lambda: project.fetch_prices({portfolio.name: portfolio}, extra=extra))
+        self._table = LiveTable(project.VALUATION_HEADERS, out, ansi)
+        self._clock = clock
+        self._sleep = sleep
+        self._alerts = alerts
+        self._valuation = None
+        self.fired = [] # Every Alert raised so far
+        self.ticks = 0
+
+    @property
+    def valuation(self):
+        return self._valuation
+
+    @property
+    def table(self):
+        return self._table
+
+    def _footer(self):
+        stamp = datetime.now().strftime('%H:%M:%S')
+        footer = project.valuation_totals(self._valuation, self._portfolio.name)
+        if self._alerts is not None:
+            # Always one line, so the table keeps its height
+            footer.append(f"Last alert: {self.fired[-1].message}" if self.fired else "Last alert: none")
+        return footer + [f"Last update: {stamp} (Ctrl+C to stop)"]
+
+    def _check_alerts(self, stock_prices, crypto_prices, fx):
+        if self._alerts is None:
+            return
+        self.fired += self._alerts.update_prices(stock_prices, crypto_prices, fx)
+        self.fired += self._alerts.update_valuation(self._portfolio.name, self._valuation)
+
+    def tick(self):
+        # Fetch prices once and redraw what changed. Returns the indices of re-valued positions.
+        prices = self._fetch()
+        stock_prices, crypto_prices = prices.get('stock'), prices.get('crypto')
+        fx = project.fx_rates(prices)
+        self.ticks += 1
+
+        if self._valuation is None:
+            # The holdings are fixed for the life of the watch; only prices move.
+            # Buy prices are converted once, at the first tick's exchange rates.
+            symbols, asset_classes, quantity, buy_price, realised_pnl = holdings_arrays(
+                self._portfolio.stocks, self._portfolio.crypto)
+            price = price_vector(symbols, asset_classes, stock_prices, crypto_prices)
+            buy_price, realised_pnl, price = convert_holdings(fx, symbols, asset_classes, buy_price, realised_pnl, price)
+            self._valuation = value_holdings(symbols, asset_classes, quantity, buy_price, realised_pnl, price,
+                                             fx.target if fx else BASE_CURRENCY)
+            self._check_alerts(stock_prices, crypto_prices, fx)
+            self._table.draw(
+                [project.valuation_row(self._valuation, index) for index in range(len(self._valuation))],
+                self._footer())
+            return np.arange(len(self._valuation))
+
+        valuation = self._valuation
+        price = price_vector(valuation.symbols, valuation.asset_classes, stock_prices, crypto_prices)
+        if fx is not None:
+            price *= fx.price_factors(valuation.symbols, valuation.asset_classes)
+        old = valuation.price
+        changed = np.flatnonzero((price != old) & ~(np.isnan(price) & np.isnan(old)))
+        if changed.size:
+            valuation.update_prices(changed, price[changed])
+        self._check_alerts(stock_prices, crypto_prices, fx)
+        rows = {int(index): project.valuation_row(valuation, index) for index in changed}
+        self._table.update(rows, self._footer())
+        return changed
+
+    def run(self, count=None):
+        # Tick every refresh seconds until Ctrl+C, or count ticks if given.
+        try:
+            while count is None or self.ticks < count:
+                started = self._clock()
+                self.tick()
+                if count is not None and self.ticks >= count:
+                    break
+                self._sleep(max(0.0, self._refresh - (self._clock() - started)))
+        except KeyboardInterrupt:
+            pass
+        return self._valuation